@@ -0,0 +1,6 @@
+"""
+Offline analytics over the request history.
+
+demand.py builds the hour-of-week demand grid and recommends standby positions for idle
+ambulances (admin API under /admin/demand, CLI: python -m analytics.demand).
+"""
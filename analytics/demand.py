@@ -0,0 +1,379 @@
+"""
+Spatio-temporal demand grid and ambulance pre-positioning.
+
+build_model() bins historical requests (location, created_at) into DEMAND_CELL_DEG cells
+per hour of the week (0 = Sunday 00:00, IST as stored). MongoDB does the binning in one
+$group on the floored coordinates, so only non-empty (cell, hour) counts cross the wire;
+numpy scatters them into a 168 x rows x cols array, smooths it with a Gaussian kernel in
+space (DEMAND_BANDWIDTH_KM) and over neighbouring hours, and divides by the weeks covered,
+giving expected requests per hour per cell. The model is stored in db.demand_models.
+When the requests span more than DEMAND_MAX_CELLS cells the counts are re-binned into
+cells a whole multiple of DEMAND_CELL_DEG wide, which bounds both the build's memory and
+the stored document (168 x cells float32, under MongoDB's 16 MB limit).
+
+recommend_standby() solves a maximal-coverage problem for one hour of the week: greedily
+choose one site per idle ambulance that adds the most demand within DEMAND_COVERAGE_KM not
+already covered, then match ambulances to sites minimising total distance.
+
+  python -m analytics.demand build --days 730
+  python -m analytics.demand heatmap --hour-of-week 42 --top 20
+  python -m analytics.demand standby --hour-of-week 42
+"""
+import argparse
+import math
+import threading
+import time
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from bson import Binary
+
+from config import Config
+from utils.time_utils import get_ist_now_naive
+
+HOURS_PER_WEEK = 168
+KM_PER_DEG_LAT = 111.32
+MODEL_ID = 'current'
+
+
+def hour_of_week(dt):
+    """0..167, Sunday 00:00 first (matches MongoDB's $dayOfWeek)."""
+    return (dt.isoweekday() % 7) * 24 + dt.hour
+
+
+def _km_matrix(lat1, lng1, lat2, lng2):
+    """Pairwise distances (km), equirectangular; accurate to well under 1% at city scale."""
+    lat1, lng1 = np.radians(lat1)[:, None], np.radians(lng1)[:, None]
+    lat2, lng2 = np.radians(lat2)[None, :], np.radians(lng2)[None, :]
+    x = (lng2 - lng1) * np.cos((lat1 + lat2) / 2)
+    return np.hypot(x, lat2 - lat1) * 6371.0
+
+
+def _smooth_axis(grid, sigma, axis, circular=False):
+    """Gaussian filter along one axis as a sum of shifted copies (kernel truncated at 3 sigma)."""
+    if sigma <= 0:
+        return grid
+    radius = max(1, int(math.ceil(3 * sigma)))
+    offsets = np.arange(-radius, radius + 1)
+    weights = np.exp(-0.5 * (offsets / sigma) ** 2)
+    weights /= weights.sum()
+    out = np.zeros_like(grid)
+    n = grid.shape[axis]
+    for off, w in zip(offsets.tolist(), weights.tolist()):
+        if circular:
+            out += w * np.roll(grid, off, axis=axis)
+            continue
+        src = [slice(None)] * grid.ndim
+        dst = [slice(None)] * grid.ndim
+        src[axis] = slice(max(0, -off), n - max(0, off))
+        dst[axis] = slice(max(0, off), n - max(0, -off))
+        out[tuple(dst)] += w * grid[tuple(src)]
+    return out
+
+
+def _trimmed_range(index, weight, tail):
+    """Index range holding all but `tail` of the weight at each end (drops far-off outliers)."""
+    order = np.argsort(index)
+    cum = np.cumsum(weight[order]) / weight.sum()
+    lo = index[order][np.searchsorted(cum, tail)]
+    hi = index[order][min(np.searchsorted(cum, 1 - tail), len(order) - 1)]
+    return int(lo), int(hi)
+
+
+class DemandModel:
+    def __init__(self, grid, row0, col0, cell_deg, weeks, requests, built_at=None, bandwidth_km=None):
+        self.grid = grid.astype(np.float32)   # [hour_of_week, row, col] expected requests per hour
+        self.row0 = row0                      # absolute cell index of grid row 0 (floor(lat / cell_deg))
+        self.col0 = col0
+        self.cell_deg = cell_deg
+        self.weeks = weeks
+        self.requests = requests
+        self.built_at = built_at
+        self.bandwidth_km = bandwidth_km
+
+    @property
+    def shape(self):
+        return self.grid.shape[1], self.grid.shape[2]
+
+    def centers(self):
+        """(lat, lng) arrays of every cell centre, flattened row-major."""
+        rows, cols = self.shape
+        lat = (np.arange(rows) + self.row0 + 0.5) * self.cell_deg
+        lng = (np.arange(cols) + self.col0 + 0.5) * self.cell_deg
+        return np.repeat(lat, cols), np.tile(lng, rows)
+
+    def heatmap(self, how, top=None, min_rate=0.0):
+        """Cells for one hour of the week, highest expected rate first."""
+        rates = self.grid[how % HOURS_PER_WEEK].ravel()
+        idx = np.flatnonzero(rates > min_rate)
+        idx = idx[np.argsort(rates[idx])[::-1]]
+        if top:
+            idx = idx[:top]
+        lat, lng = self.centers()
+        return [
+            {'lat': round(float(lat[i]), 6), 'lng': round(float(lng[i]), 6), 'rate': round(float(rates[i]), 5)}
+            for i in idx
+        ]
+
+    def to_document(self):
+        return {
+            '_id': MODEL_ID,
+            'grid': Binary(zlib.compress(self.grid.tobytes(), 6)),
+            'shape': list(self.grid.shape),
+            'row0': self.row0,
+            'col0': self.col0,
+            'cell_deg': self.cell_deg,
+            'weeks': self.weeks,
+            'requests': self.requests,
+            'bandwidth_km': self.bandwidth_km,
+            'built_at': self.built_at,
+        }
+
+    @classmethod
+    def from_document(cls, doc):
+        grid = np.frombuffer(zlib.decompress(doc['grid']), dtype=np.float32).reshape(doc['shape'])
+        return cls(grid, doc['row0'], doc['col0'], doc['cell_deg'], doc['weeks'], doc['requests'],
+                   doc.get('built_at'), doc.get('bandwidth_km'))
+
+
+def _extent(r, c, n, cell_deg, bandwidth_km):
+    """(kernel padding, row lo/hi, col lo/hi) of the cells holding nearly all requests."""
+    pad = int(math.ceil(3 * bandwidth_km / (KM_PER_DEG_LAT * cell_deg))) + 1
+    r_lo, r_hi = _trimmed_range(r, n, Config.DEMAND_OUTLIER_SHARE)
+    c_lo, c_hi = _trimmed_range(c, n, Config.DEMAND_OUTLIER_SHARE)
+    return pad, r_lo, r_hi, c_lo, c_hi
+
+
+def build_model(db, days=None, cell_deg=None, bandwidth_km=None):
+    """Demand model from the last `days` of requests (all history if None); None if there are none."""
+    cell_deg = cell_deg or Config.DEMAND_CELL_DEG
+    bandwidth_km = Config.DEMAND_BANDWIDTH_KM if bandwidth_km is None else bandwidth_km
+    match = {'status': {'$ne': 'fake'}, 'location.lat': {'$ne': None}, 'created_at': {'$ne': None}}
+    if days:
+        match['created_at'] = {'$gte': get_ist_now_naive() - timedelta(days=days)}
+    span = list(db.requests.aggregate([
+        {'$match': match},
+        {'$group': {'_id': None, 'first': {'$min': '$created_at'}, 'last': {'$max': '$created_at'}}},
+    ]))
+    if not span:
+        return None
+    counts = list(db.requests.aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': {
+                'r': {'$floor': {'$divide': ['$location.lat', cell_deg]}},
+                'c': {'$floor': {'$divide': ['$location.lng', cell_deg]}},
+                'd': {'$dayOfWeek': '$created_at'},
+                'h': {'$hour': '$created_at'},
+            },
+            'n': {'$sum': 1},
+        }},
+    ], allowDiskUse=True))
+    r = np.fromiter((x['_id']['r'] for x in counts), dtype=np.int64, count=len(counts))
+    c = np.fromiter((x['_id']['c'] for x in counts), dtype=np.int64, count=len(counts))
+    how = np.fromiter(((x['_id']['d'] - 1) * 24 + x['_id']['h'] for x in counts), dtype=np.int64, count=len(counts))
+    n = np.fromiter((x['n'] for x in counts), dtype=np.float64, count=len(counts))
+
+    # Grid over the area holding nearly all requests, padded for the kernel; cells k times
+    # wider (floor(floor(x / d) / k) == floor(x / (k d))) until it fits DEMAND_MAX_CELLS
+    fine_r, fine_c, fine_deg = r, c, cell_deg
+    k = 1
+    while True:
+        r, c, cell_deg = fine_r // k, fine_c // k, round(fine_deg * k, 9)
+        pad, r_lo, r_hi, c_lo, c_hi = _extent(r, c, n, cell_deg, bandwidth_km)
+        rows, cols = r_hi - r_lo + 1 + 2 * pad, c_hi - c_lo + 1 + 2 * pad
+        if rows * cols <= Config.DEMAND_MAX_CELLS or (r_lo == r_hi and c_lo == c_hi):
+            break
+        k = max(k + 1, int(k * math.sqrt(rows * cols / Config.DEMAND_MAX_CELLS)))
+    row0, col0 = r_lo - pad, c_lo - pad
+    keep = (r >= r_lo) & (r <= r_hi) & (c >= c_lo) & (c <= c_hi)
+    grid = np.zeros((HOURS_PER_WEEK, rows, cols), dtype=np.float64)
+    np.add.at(grid, (how[keep], r[keep] - row0, c[keep] - col0), n[keep])
+
+    sigma_rows = bandwidth_km / (KM_PER_DEG_LAT * cell_deg)
+    mid_lat = (row0 + rows / 2) * cell_deg
+    sigma_cols = bandwidth_km / (KM_PER_DEG_LAT * math.cos(math.radians(mid_lat)) * cell_deg)
+    grid = _smooth_axis(grid, sigma_rows, axis=1)
+    grid = _smooth_axis(grid, sigma_cols, axis=2)
+    grid = _smooth_axis(grid, Config.DEMAND_HOUR_BANDWIDTH, axis=0, circular=True)
+
+    first, last = span[0]['first'], span[0]['last']
+    weeks = max((last - first).total_seconds() / (7 * 86400), 1.0)
+    return DemandModel(grid / weeks, row0, col0, cell_deg, round(weeks, 2), int(n.sum()),
+                       get_ist_now_naive(), bandwidth_km)
+
+
+def save_model(db, model):
+    db.demand_models.replace_one({'_id': MODEL_ID}, model.to_document(), upsert=True)
+    _cached['model'] = model
+    _cached['checked_at'] = time.monotonic()
+
+
+_cached = {'model': None, 'checked_at': 0.0}
+_cache_lock = threading.Lock()
+
+
+def get_model(db):
+    """Stored model, re-read when another worker or the CLI has saved a newer one (checked every minute)."""
+    with _cache_lock:
+        if time.monotonic() - _cached['checked_at'] < 60 and _cached['model'] is not None:
+            return _cached['model']
+        head = db.demand_models.find_one({'_id': MODEL_ID}, {'built_at': 1})
+        current = _cached['model']
+        if head is None:
+            _cached['model'] = None
+        elif current is None or current.built_at != head.get('built_at'):
+            _cached['model'] = DemandModel.from_document(db.demand_models.find_one({'_id': MODEL_ID}))
+        _cached['checked_at'] = time.monotonic()
+        return _cached['model']
+
+
+def idle_ambulances(db):
+    """Active ambulances with a location and no open assignment (two queries)."""
+    busy = set(db.requests.distinct('assigned_ambulance_id', {'status': {'$in': ['assigned', 'to_hospital']}}))
+    return [
+        a for a in db.ambulances.find(
+            {'status': 'active', 'current_location': {'$ne': None}},
+            {'name': 1, 'vehicle_number': 1, 'ambulance_type': 1, 'current_location': 1}
+        )
+        if a['_id'] not in busy and (a.get('current_location') or {}).get('lat') is not None
+    ]
+
+
+def recommend_standby(model, how, ambulances, radius_km=None):
+    """
+    Standby sites for `ambulances` at hour of week `how`: maximal coverage of expected demand
+    within radius_km, then a minimum-total-distance matching of ambulances to sites.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    radius_km = radius_km or Config.DEMAND_COVERAGE_KM
+    rates = model.grid[how % HOURS_PER_WEEK].ravel().astype(np.float64)
+    total = float(rates.sum())
+    result = {'hour_of_week': how % HOURS_PER_WEEK, 'radius_km': radius_km,
+              'expected_requests_per_hour': round(total, 4), 'moves': []}
+    if not ambulances or total <= 0:
+        result.update(coverage_now=0.0, coverage_after=0.0)
+        return result
+
+    lat, lng = model.centers()
+    demand = np.argsort(rates)[::-1][:Config.DEMAND_MAX_DEMAND_CELLS]
+    demand = demand[rates[demand] > 0]
+    d_lat, d_lng, w = lat[demand], lng[demand], rates[demand]
+
+    amb_lat = np.array([float(a['current_location']['lat']) for a in ambulances])
+    amb_lng = np.array([float(a['current_location']['lng']) for a in ambulances])
+    # Candidate sites: the busiest cells plus where the ambulances already are
+    top = demand[:Config.DEMAND_CANDIDATE_SITES]
+    s_lat = np.concatenate([lat[top], amb_lat])
+    s_lng = np.concatenate([lng[top], amb_lng])
+    covers = _km_matrix(s_lat, s_lng, d_lat, d_lng) <= radius_km
+
+    def coverage(site_rows):
+        return float(w[covers[site_rows].any(axis=0)].sum()) / total
+
+    uncovered = w.copy()
+    chosen = []
+    for _ in range(len(ambulances)):
+        gains = covers @ uncovered
+        best = int(np.argmax(gains))
+        if gains[best] <= 0:
+            break
+        chosen.append(best)
+        uncovered[covers[best]] = 0.0
+
+    current = np.arange(len(top), len(top) + len(ambulances))
+    final = current.copy()  # ambulances without a site, or with a short move, stay put
+    if chosen:
+        cost = _km_matrix(amb_lat, amb_lng, s_lat[chosen], s_lng[chosen])
+        for i, j in zip(*linear_sum_assignment(cost)):
+            site, distance = chosen[j], float(cost[i, j])
+            if distance < Config.DEMAND_MIN_MOVE_KM:
+                continue
+            final[i] = site
+            amb = ambulances[i]
+            result['moves'].append({
+                'ambulance_id': str(amb['_id']),
+                'name': amb.get('name'),
+                'vehicle_number': amb.get('vehicle_number'),
+                'from': {'lat': float(amb_lat[i]), 'lng': float(amb_lng[i])},
+                'to': {'lat': round(float(s_lat[site]), 6), 'lng': round(float(s_lng[site]), 6)},
+                'distance_km': round(distance, 2),
+                'site_demand_per_hour': round(float(w[covers[site]].sum()), 4),
+            })
+    result['moves'].sort(key=lambda m: -m['site_demand_per_hour'])
+    result['coverage_now'] = round(coverage(current), 4)
+    result['coverage_after'] = round(coverage(final), 4)
+    return result
+
+
+# --- CLI -----------------------------------------------------------------------------
+
+def _db(uri):
+    from pymongo import MongoClient
+    from utils.db import client_options
+    return MongoClient(uri, **client_options()).get_default_database()
+
+
+def _build(args):
+    db = _db(args.mongo_uri)
+    started = time.perf_counter()
+    model = build_model(db, days=args.days, cell_deg=args.cell_deg, bandwidth_km=args.bandwidth_km)
+    if model is None:
+        print("No requests in range")
+        return
+    save_model(db, model)
+    rows, cols = model.shape
+    print(f"{model.requests} requests over {model.weeks} weeks -> {rows}x{cols} cells x {HOURS_PER_WEEK} hours "
+          f"({time.perf_counter() - started:.2f}s)")
+
+
+def _load(args):
+    db = _db(args.mongo_uri)
+    model = get_model(db)
+    if model is None:
+        raise SystemExit("No demand model; run: python -m analytics.demand build")
+    how = args.hour_of_week if args.hour_of_week is not None else hour_of_week(get_ist_now_naive())
+    return db, model, how
+
+
+def _heatmap(args):
+    _, model, how = _load(args)
+    for cell in model.heatmap(how, top=args.top):
+        print(f"{cell['lat']:.5f},{cell['lng']:.5f}  {cell['rate']:.4f}/h")
+
+
+def _standby(args):
+    db, model, how = _load(args)
+    result = recommend_standby(model, how, idle_ambulances(db), radius_km=args.radius_km)
+    print(f"hour of week {result['hour_of_week']}: coverage {result['coverage_now']:.1%} -> "
+          f"{result['coverage_after']:.1%} within {result['radius_km']} km")
+    for m in result['moves']:
+        print(f"  {m['name'] or m['ambulance_id']}: -> {m['to']['lat']:.5f},{m['to']['lng']:.5f} "
+              f"({m['distance_km']} km, {m['site_demand_per_hour']}/h)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the demand grid or query standby recommendations")
+    parser.add_argument('--mongo-uri', default=Config.MONGO_URI)
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="bin request history into the hour-of-week demand grid")
+    build.add_argument('--days', type=int, default=None, help="history window (default: all)")
+    build.add_argument('--cell-deg', type=float, default=None)
+    build.add_argument('--bandwidth-km', type=float, default=None)
+    build.set_defaults(func=_build)
+    heat = sub.add_parser('heatmap', help="busiest cells for an hour of the week")
+    heat.add_argument('--hour-of-week', type=int, default=None, help="0 = Sunday 00:00 (default: now)")
+    heat.add_argument('--top', type=int, default=20)
+    heat.set_defaults(func=_heatmap)
+    standby = sub.add_parser('standby', help="standby positions for the idle ambulances")
+    standby.add_argument('--hour-of-week', type=int, default=None)
+    standby.add_argument('--radius-km', type=float, default=None)
+    standby.set_defaults(func=_standby)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,50 +1,111 @@
 import sys
 import os
+import threading
 
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from flask import Flask
-from flask_pymongo import PyMongo
-from flask_jwt_extended import JWTManager
-from flask_cors import CORS
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
 from config import Config
-from routes.user_routes import init_user_routes
-from routes.ambulance_routes import init_ambulance_routes
-from routes.admin_routes import init_admin_routes
-from routes.sensor_routes import init_sensor_routes
-from models.otp_model import OTPModel
-
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Initialize extensions
-mongo = PyMongo(app)
-jwt = JWTManager(app)
-# CORS configuration - allow frontend domain in production
-frontend_url = os.getenv('FRONTEND_URL', '*')
-if frontend_url == '*':
-    CORS(app)  # Allow all origins in development
-else:
-    CORS(app, origins=[frontend_url])  # Specific origin in production
-
-# Initialize routes
-init_user_routes(app, mongo.db)
-init_ambulance_routes(app, mongo.db)
-init_admin_routes(app, mongo.db)
-init_sensor_routes(app, mongo.db)
-
-@app.route('/', methods=['GET'])
+
+
+def create_app(config_object=Config):
+    """
+    Build the Flask app without touching the network: the Mongo client is created on
+    first use, heavy modules (sklearn, numpy, twilio) load lazily or in a background
+    warm-up, and one-time maintenance runs via `flask --app app maintenance`.
+    """
+    from flask_pymongo import PyMongo
+    from flask_jwt_extended import JWTManager
+    from flask_cors import CORS
+    from routes.user_routes import init_user_routes
+    from routes.ambulance_routes import init_ambulance_routes
+    from routes.admin_routes import init_admin_routes
+    from routes.sensor_routes import init_sensor_routes
+    from utils.auth import init_auth
+    from utils.db import LazyDatabase, client_options, command_counter
+
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+
+    # Initialize extensions
+    db = LazyDatabase(lambda: PyMongo(app, **client_options()).db)
+    app.extensions['mongo_db'] = db
+    JWTManager(app)
+    init_auth(app)
+    # CORS configuration - allow frontend domain in production
+    frontend_url = os.getenv('FRONTEND_URL', '*')
+    if frontend_url == '*':
+        CORS(app)  # Allow all origins in development
+    else:
+        CORS(app, origins=[frontend_url])  # Specific origin in production
+
+    # Initialize routes
+    init_user_routes(app, db)
+    init_ambulance_routes(app, db)
+    init_admin_routes(app, db)
+    init_sensor_routes(app, db)
+
+    app.add_url_rule('/', 'health_check', health_check, methods=['GET'])
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(500, internal_error)
+    app.cli.add_command(maintenance)
+    app.cli.add_command(archive)
+    app.cli.add_command(export_command)
+    app.cli.add_command(import_command)
+    app.cli.add_command(shard_setup)
+
+    if config_object.LOAD_SHED_ENABLED:
+        from utils.load_shed import load_shedder
+        load_shedder.init_app(app)
+
+    if config_object.DB_OP_COUNTING:
+        from flask import request
+        app.before_request(command_counter.begin)
+        app.teardown_request(lambda _exc: command_counter.end(request.endpoint))
+
+    if config_object.ESCALATION_ENABLED:
+        # Started by the first request a worker serves, so CLI commands never join the election
+        from services.escalation import scheduler
+        app.before_request(lambda: scheduler.start(db))
+
+    if config_object.EVENT_BUS_ENABLED:
+        # Per worker, after the fork: change events keep this process's caches current
+        from utils.event_bus import event_bus
+        app.before_request(lambda: event_bus.start(db))
+
+    if config_object.WARM_UP_ON_BOOT:
+        threading.Thread(target=_warm_up, name='warm-up', daemon=True).start()
+    return app
+
+
+def _warm_up():
+    """Load the detection model and data files in the background so the first request doesn't."""
+    try:
+        from ml.accident_detector import warm_up
+        from utils.hospitals import get_catalogue
+        warm_up()
+        get_catalogue()
+        if Config.DISPATCH_USE_ROAD_ETA:
+            from roadnet.eta import get_engine
+            get_engine()
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+
+
 def health_check():
     """Health check endpoint"""
+    db = current_app.extensions['mongo_db']
     try:
         # Test database connection
-        mongo.db.command('ping')
+        db.command('ping')
         return {
             'status': 'ok',
             'message': 'Emergency Response System API is running',
             'database': 'connected',
-            'database_name': mongo.db.name
+            'database_name': db.name
         }, 200
     except Exception as e:
         return {
@@ -54,23 +115,125 @@ def health_check():
             'error': str(e)
         }, 200
 
-@app.errorhandler(404)
+
 def not_found(error):
     """Handle 404 errors"""
     return {'error': 'Endpoint not found'}, 404
 
-@app.errorhandler(500)
+
 def internal_error(error):
     """Handle 500 errors"""
     return {'error': 'Internal server error'}, 500
 
-# Cleanup expired OTPs on startup (for production with gunicorn)
-def cleanup_on_startup():
-    with app.app_context():
-        OTPModel.cleanup_expired_otps(mongo.db)
 
-# Run cleanup on app initialization
-cleanup_on_startup()
+@click.command('maintenance')
+@click.option('--rebuild-live-incidents', is_flag=True, help='Recompute the dashboard view from requests.')
+@with_appcontext
+def maintenance(rebuild_live_incidents):
+    """One-time deploy tasks; run once before starting the workers (see start.sh)."""
+    from models.otp_model import OTPModel
+    from models.live_incident_model import LiveIncidentModel
+    from models.request_event_model import RequestEventModel
+    from utils.rate_limit import RateLimiter
+    from utils.blacklist import Blacklist
+    from models.idempotency_model import IdempotencyModel
+    from ops.archive import ensure_indexes as archive_indexes
+    from ops.sharding import ensure_indexes as region_indexes
+    from models.ambulance_model import AmbulanceModel
+    from utils.event_bus import EventBus
+    db = current_app.extensions['mongo_db']
+    OTPModel.cleanup_expired_otps(db)
+    click.echo('Expired OTPs removed')
+    LiveIncidentModel.ensure_indexes(db)
+    RequestEventModel.ensure_indexes(db)
+    RateLimiter.ensure_indexes(db)
+    Blacklist.ensure_indexes(db)
+    IdempotencyModel.ensure_indexes(db)
+    archive_indexes(db)
+    region_indexes(db)
+    AmbulanceModel.ensure_indexes(db)
+    EventBus.ensure_indexes(db)
+    if rebuild_live_incidents:
+        click.echo(f'Live incidents rebuilt: {LiveIncidentModel.rebuild(db)} open')
+    click.echo(f'Live incident tombstones pruned: {LiveIncidentModel.prune(db)}')
+
+
+@click.command('archive')
+@click.option('--days', type=int, default=None, help='Archive requests older than this (default ARCHIVE_AFTER_DAYS).')
+@click.option('--to', 'target', type=click.Choice(['collection', 'ndjson', 'parquet']), default=None,
+              help='Destination (default ARCHIVE_TARGET).')
+@click.option('--dir', 'directory', default=None, help='Directory for file archives (default ARCHIVE_DIR).')
+@click.option('--batch-size', type=int, default=None, help='Requests per batch (default ARCHIVE_BATCH_SIZE).')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+@with_appcontext
+def archive(days, target, directory, batch_size, max_batches):
+    """Move completed/fake requests and their tracks out of the hot collections (ops/archive.py)."""
+    from ops.archive import archive_finished
+    db = current_app.extensions['mongo_db']
+    totals = archive_finished(
+        db, older_than_days=days, batch_size=batch_size, target=target, directory=directory,
+        max_batches=max_batches,
+        progress=lambda t: click.echo(f"batch {t['batches']}: {t['requests']} requests, {t['location_tracks']} track points"),
+    )
+    click.echo(f"Archived {totals['requests']} requests and {totals['location_tracks']} track points "
+               f"in {totals['batches']} batches")
+
+
+@click.command('export')
+@click.argument('collection')
+@click.argument('directory')
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'parquet']), default='ndjson', show_default=True)
+@click.option('--parts', type=int, default=None, help='Parallel _id ranges / output files (default BULK_WORKERS).')
+@click.option('--query', default=None, help='Filter as MongoDB extended JSON.')
+@click.option('--batch-size', type=int, default=None, help='Cursor batch size (default BULK_BATCH_SIZE).')
+@with_appcontext
+def export_command(collection, directory, fmt, parts, query, batch_size):
+    """Stream COLLECTION into compressed files under DIRECTORY (ops/bulk.py)."""
+    from ops.bulk import export_collection, parse_query
+    db = current_app.extensions['mongo_db']
+    manifest = export_collection(db, collection, directory, fmt=fmt, parts=parts, query=parse_query(query),
+                                 batch_size=batch_size)
+    click.echo(f"Exported {manifest['documents']} documents from {collection} into {len(manifest['files'])} files")
+
+
+@click.command('import')
+@click.argument('source')
+@click.option('--collection', default=None, help='Target collection (default: the one in the manifest).')
+@click.option('--upsert', is_flag=True, help='Replace documents with the same _id instead of skipping them.')
+@click.option('--batch-size', type=int, default=None, help='Documents per write (default BULK_BATCH_SIZE).')
+@with_appcontext
+def import_command(source, collection, upsert, batch_size):
+    """Stream an export directory (or one file) from SOURCE into the database (ops/bulk.py)."""
+    from ops.bulk import import_collection
+    db = current_app.extensions['mongo_db']
+    result = import_collection(db, source, name=collection, upsert=upsert, batch_size=batch_size)
+    click.echo(f"Imported {result['documents']} documents into {result['collection']} from {result['files']} files")
+
+
+@click.command('shard-setup')
+@click.option('--backfill', is_flag=True, help='Set region on requests/ambulances that predate it.')
+@click.option('--shard', is_flag=True, help='Enable sharding and shard the collections (run against mongos).')
+@click.option('--zones', 'zones_file', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='JSON file mapping zones to shards and region prefixes.')
+@with_appcontext
+def shard_setup(backfill, shard, zones_file):
+    """Region shard key setup for multi-node deployments (ops/sharding.py)."""
+    import json
+    from ops.sharding import apply_zones, backfill_regions, ensure_indexes, shard_collections
+    db = current_app.extensions['mongo_db'].get()
+    ensure_indexes(db)
+    if backfill:
+        click.echo(f'Regions backfilled: {backfill_regions(db)}')
+    if shard:
+        click.echo(f"Sharded: {', '.join(shard_collections(db))}")
+    if zones_file:
+        with open(zones_file, encoding='utf-8') as f:
+            zones = json.load(f)
+        apply_zones(db, zones)
+        click.echo(f"Zones applied: {', '.join(zones)}")
+
+
+app = create_app()
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 10000))
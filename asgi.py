@@ -0,0 +1,56 @@
+"""
+ASGI entry point: async hot paths in front of the existing Flask app.
+
+routes/async_routes.py serves the high-frequency endpoints with Motor, so a worker waiting
+on Atlas keeps accepting connections; every other path falls through to the Flask app
+(app.py), which runs in a thread pool exactly as under gunicorn.
+
+Run:
+  uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+  gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2 --bind 0.0.0.0:$PORT
+"""
+import os
+import sys
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from a2wsgi import WSGIMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount
+
+from config import Config
+from app import app as flask_app
+from routes.async_routes import routes as async_routes
+from utils.db import client_options
+from utils.event_bus import event_bus
+from utils.load_shed import ASGILoadShedMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Motor binds to the running loop, so the client is created per worker at startup
+    client = AsyncIOMotorClient(Config.MONGO_URI, **client_options())
+    app.state.db = client.get_default_database()
+    app.state.sync_db = flask_app.extensions['mongo_db']
+    event_bus.start(app.state.sync_db)
+    try:
+        yield
+    finally:
+        client.close()
+
+
+frontend_url = os.getenv('FRONTEND_URL', '*')
+app = Starlette(
+    routes=async_routes + [Mount('/', app=WSGIMiddleware(flask_app, workers=Config.ASGI_WSGI_THREADS))],
+    middleware=[Middleware(
+        CORSMiddleware,
+        allow_origins=['*'] if frontend_url == '*' else [frontend_url],
+        allow_methods=['*'],
+        allow_headers=['*'],
+    )] + ([Middleware(ASGILoadShedMiddleware)] if Config.LOAD_SHED_ENABLED else []),
+    lifespan=lifespan,
+)
@@ -14,9 +14,27 @@ class Config:
     # JWT Configuration
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-secret-change-me')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    # Verified claims kept per worker (entries expire with their token; see utils/auth.py)
+    JWT_CLAIMS_CACHE_SIZE = int(os.getenv('JWT_CLAIMS_CACHE_SIZE', '10000'))
+    # How often each worker reloads the blacklisted user ids (utils/blacklist.py)
+    BLACKLIST_SYNC_SECONDS = float(os.getenv('BLACKLIST_SYNC_SECONDS', '15'))
     
     # OTP Configuration
     OTP_EXPIRY_MINUTES = 5
+    # HMAC key for stored OTP hashes (defaults to JWT_SECRET_KEY)
+    OTP_HASH_KEY = os.getenv('OTP_HASH_KEY', '')
+    # Sends per phone and per caller IP, and verify attempts per phone, within each window
+    OTP_SEND_PHONE_LIMIT = int(os.getenv('OTP_SEND_PHONE_LIMIT', '3'))
+    OTP_SEND_PHONE_WINDOW_SECONDS = int(os.getenv('OTP_SEND_PHONE_WINDOW_SECONDS', '600'))
+    OTP_SEND_IP_LIMIT = int(os.getenv('OTP_SEND_IP_LIMIT', '20'))
+    OTP_SEND_IP_WINDOW_SECONDS = int(os.getenv('OTP_SEND_IP_WINDOW_SECONDS', '3600'))
+    OTP_VERIFY_PHONE_LIMIT = int(os.getenv('OTP_VERIFY_PHONE_LIMIT', '10'))
+    OTP_VERIFY_WINDOW_SECONDS = int(os.getenv('OTP_VERIFY_WINDOW_SECONDS', '600'))
+    # Rate limit counters: 'memory' (per worker) or 'mongo' (shared); keys kept per limiter in
+    # memory; reverse proxies in front of the app (client IP position in X-Forwarded-For)
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+    RATE_LIMIT_PROXY_HOPS = int(os.getenv('RATE_LIMIT_PROXY_HOPS', '1'))
     
     # Admin Credentials (should be in environment variables in production)
     ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
@@ -29,3 +47,178 @@ class Config:
 
     # Accident detection (Twilio Voice webhook base URL - must be publicly accessible)
     TWILIO_VOICE_WEBHOOK_BASE = os.getenv('TWILIO_VOICE_WEBHOOK_BASE', 'http://localhost:5000')
+    # 'twilio' or 'fake' (in-process outbox with a simulated API latency; load tests)
+    SMS_BACKEND = os.getenv('SMS_BACKEND', 'twilio')
+    SMS_FAKE_LATENCY_MS = float(os.getenv('SMS_FAKE_LATENCY_MS', '150'))
+
+    # Skip window read + model for sensor samples far below every detection rule
+    SENSOR_PREFILTER_ENABLED = os.getenv('SENSOR_PREFILTER_ENABLED', 'true').lower() == 'true'
+
+    # User/ambulance profile cache (0 TTL disables; a redis:// URL shares it across workers
+    # and needs the redis package)
+    PROFILE_CACHE_TTL_SECONDS = float(os.getenv('PROFILE_CACHE_TTL_SECONDS', '5'))
+    PROFILE_CACHE_MAX_ENTRIES = int(os.getenv('PROFILE_CACHE_MAX_ENTRIES', '10000'))
+    PROFILE_CACHE_URL = os.getenv('PROFILE_CACHE_URL', '')
+
+    # Hospital catalogue (CSV or Overpass JSON) for /ambulance/nearby-hospitals
+    HOSPITALS_FILE = os.getenv('HOSPITALS_FILE', str(Path(__file__).resolve().parent / 'data' / 'hospitals.csv'))
+    # Reject /ambulance/select-hospital choices that are not in the catalogue
+    HOSPITAL_CATALOGUE_STRICT = os.getenv('HOSPITAL_CATALOGUE_STRICT', 'false').lower() == 'true'
+
+    # Road-network ETAs (build with: python -m roadnet.eta build city.osm data/roadnet.npz).
+    # When enabled and the graph file exists, dispatch re-ranks the nearest candidates by drive time.
+    ROADNET_FILE = os.getenv('ROADNET_FILE', str(Path(__file__).resolve().parent / 'data' / 'roadnet.npz'))
+    DISPATCH_USE_ROAD_ETA = os.getenv('DISPATCH_USE_ROAD_ETA', 'false').lower() == 'true'
+    ROAD_ETA_CANDIDATES = int(os.getenv('ROAD_ETA_CANDIDATES', '5'))
+
+    # ASGI mode (asgi.py): Server-Sent Events feed at /stream/updates
+    SSE_POLL_SECONDS = float(os.getenv('SSE_POLL_SECONDS', '2'))
+    SSE_KEEPALIVE_SECONDS = float(os.getenv('SSE_KEEPALIVE_SECONDS', '15'))
+    SSE_MAX_SECONDS = float(os.getenv('SSE_MAX_SECONDS', '300'))
+    # Threads serving the mounted Flask app (every route without an async twin)
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '16'))
+
+    # MongoDB client: pool per worker process, bounded waits. timeoutMS caps every operation
+    # (0 disables); read preferences take primary/primaryPreferred/secondary/secondaryPreferred/nearest.
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '20'))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '60000'))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000'))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+    MONGO_TIMEOUT_MS = int(os.getenv('MONGO_TIMEOUT_MS', '10000'))
+    MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', '')  # empty: URI / driver default
+    # Admin dashboards and request history
+    MONGO_REPORTING_READ_PREFERENCE = os.getenv('MONGO_REPORTING_READ_PREFERENCE', 'secondaryPreferred')
+    MONGO_REPORTING_MAX_STALENESS_SECONDS = int(os.getenv('MONGO_REPORTING_MAX_STALENESS_SECONDS', '-1'))
+    # Request create/assign/status writes
+    MONGO_DISPATCH_WRITE_CONCERN = os.getenv('MONGO_DISPATCH_WRITE_CONCERN', 'majority')
+
+    # Live incidents view behind /admin/dashboard-map: counter check interval per worker, full
+    # reload interval, out-of-order write window, and how long completed incidents stay as tombstones
+    LIVE_INCIDENTS_SYNC_SECONDS = float(os.getenv('LIVE_INCIDENTS_SYNC_SECONDS', '1'))
+    LIVE_INCIDENTS_RESYNC_SECONDS = float(os.getenv('LIVE_INCIDENTS_RESYNC_SECONDS', '300'))
+    LIVE_INCIDENTS_SETTLE_SECONDS = float(os.getenv('LIVE_INCIDENTS_SETTLE_SECONDS', '2'))
+    LIVE_INCIDENTS_TOMBSTONE_HOURS = float(os.getenv('LIVE_INCIDENTS_TOMBSTONE_HOURS', '24'))
+
+    # /admin/map-data clustering: markers instead of cells from this zoom (if at most
+    # MAP_MAX_DETAIL_POINTS), ambulance position refresh/reload intervals, tile cache
+    MAP_DETAIL_ZOOM = int(os.getenv('MAP_DETAIL_ZOOM', '15'))
+    MAP_MAX_DETAIL_POINTS = int(os.getenv('MAP_MAX_DETAIL_POINTS', '500'))
+    MAP_AMBULANCE_REFRESH_SECONDS = float(os.getenv('MAP_AMBULANCE_REFRESH_SECONDS', '2'))
+    MAP_AMBULANCE_RELOAD_SECONDS = float(os.getenv('MAP_AMBULANCE_RELOAD_SECONDS', '60'))
+    MAP_TILE_TTL_SECONDS = float(os.getenv('MAP_TILE_TTL_SECONDS', '30'))
+    MAP_TILE_CACHE_ENTRIES = int(os.getenv('MAP_TILE_CACHE_ENTRIES', '5000'))
+    MAP_MAX_TILES = int(os.getenv('MAP_MAX_TILES', '64'))
+
+    # Demand model (analytics/demand.py): grid cell, spatial/temporal smoothing, share of
+    # far-off requests dropped at each edge; standby coverage radius and search sizes. Above
+    # DEMAND_MAX_CELLS grid cells the cell size is coarsened (168 x cells float32 per model)
+    DEMAND_CELL_DEG = float(os.getenv('DEMAND_CELL_DEG', '0.005'))
+    DEMAND_BANDWIDTH_KM = float(os.getenv('DEMAND_BANDWIDTH_KM', '0.8'))
+    DEMAND_HOUR_BANDWIDTH = float(os.getenv('DEMAND_HOUR_BANDWIDTH', '1'))
+    DEMAND_OUTLIER_SHARE = float(os.getenv('DEMAND_OUTLIER_SHARE', '0.001'))
+    DEMAND_COVERAGE_KM = float(os.getenv('DEMAND_COVERAGE_KM', '3'))
+    DEMAND_MIN_MOVE_KM = float(os.getenv('DEMAND_MIN_MOVE_KM', '0.5'))
+    DEMAND_CANDIDATE_SITES = int(os.getenv('DEMAND_CANDIDATE_SITES', '400'))
+    DEMAND_MAX_DEMAND_CELLS = int(os.getenv('DEMAND_MAX_DEMAND_CELLS', '3000'))
+    DEMAND_MAX_CELLS = int(os.getenv('DEMAND_MAX_CELLS', '20000'))
+
+    # Response-time rollups (models/request_event_model.py): area = geohash of this length
+    # (5 ~ 5 km cells); raw lifecycle events expire after this many days (0 keeps them)
+    ROLLUP_AREA_PRECISION = int(os.getenv('ROLLUP_AREA_PRECISION', '5'))
+    REQUEST_EVENT_RETENTION_DAYS = int(os.getenv('REQUEST_EVENT_RETENTION_DAYS', '400'))
+
+    # Dispatch: 'direct' assigns the nearest ambulance outright; 'offer' sends time-boxed offers
+    # to the DISPATCH_OFFER_FANOUT nearest and assigns the first to accept (services/dispatch.py)
+    DISPATCH_MODE = os.getenv('DISPATCH_MODE', 'direct')
+    DISPATCH_OFFER_FANOUT = int(os.getenv('DISPATCH_OFFER_FANOUT', '3'))
+    DISPATCH_OFFER_TIMEOUT_SECONDS = float(os.getenv('DISPATCH_OFFER_TIMEOUT_SECONDS', '30'))
+    # An ambulance claim whose request is still open is only taken over after this long (the
+    # claiming dispatcher died before writing the request; models/ambulance_model.py)
+    DISPATCH_CLAIM_GRACE_SECONDS = float(os.getenv('DISPATCH_CLAIM_GRACE_SECONDS', '10'))
+
+    # Escalation of pending requests (services/escalation.py): lease TTL and loop cadence,
+    # retry backoff, growth of the radius ranked first, how long the requested type is
+    # preferred, and the SLA after which admins are alerted (SMS to ESCALATION_ALERT_PHONES,
+    # comma separated)
+    ESCALATION_ENABLED = os.getenv('ESCALATION_ENABLED', 'true').lower() == 'true'
+    ESCALATION_LEASE_SECONDS = float(os.getenv('ESCALATION_LEASE_SECONDS', '15'))
+    ESCALATION_TICK_SECONDS = float(os.getenv('ESCALATION_TICK_SECONDS', '1'))
+    ESCALATION_SYNC_SECONDS = float(os.getenv('ESCALATION_SYNC_SECONDS', '5'))
+    ESCALATION_FIRST_RETRY_SECONDS = float(os.getenv('ESCALATION_FIRST_RETRY_SECONDS', '10'))
+    ESCALATION_MAX_RETRY_SECONDS = float(os.getenv('ESCALATION_MAX_RETRY_SECONDS', '60'))
+    ESCALATION_BASE_RADIUS_KM = float(os.getenv('ESCALATION_BASE_RADIUS_KM', '5'))
+    ESCALATION_RADIUS_GROWTH = float(os.getenv('ESCALATION_RADIUS_GROWTH', '1.5'))
+    ESCALATION_MAX_RADIUS_KM = float(os.getenv('ESCALATION_MAX_RADIUS_KM', '50'))
+    ESCALATION_RELAX_TYPE_SECONDS = float(os.getenv('ESCALATION_RELAX_TYPE_SECONDS', '120'))
+    ESCALATION_SLA_SECONDS = float(os.getenv('ESCALATION_SLA_SECONDS', '300'))
+    ESCALATION_ALERT_PHONES = [p.strip() for p in os.getenv('ESCALATION_ALERT_PHONES', '').split(',') if p.strip()]
+
+    # Admission control (utils/load_shed.py): path prefixes per priority class (the rest is
+    # 'normal'), token bucket refill per second and size per identity (rate 0 = unlimited), and
+    # the shedding thresholds: in-flight requests per worker, latency EWMA, proxy queue wait.
+    # Low-priority traffic is shed at pressure 1, normal at LOAD_SHED_NORMAL_FACTOR.
+    LOAD_SHED_ENABLED = os.getenv('LOAD_SHED_ENABLED', 'true').lower() == 'true'
+    LOAD_SHED_CRITICAL_PATHS = [p for p in os.getenv(
+        'LOAD_SHED_CRITICAL_PATHS',
+        '/user/request-emergency,/user/my-request,/user/verify-otp,/ambulance/verify-otp,'
+        '/ambulance/status,/ambulance/offers,/ambulance/assigned-details,/ambulance/update-location,'
+        '/ambulance/complete-request,/ambulance/report-issue,/ambulance/select-hospital,/admin/login'
+    ).split(',') if p]
+    LOAD_SHED_LOW_PATHS = [p for p in os.getenv(
+        'LOAD_SHED_LOW_PATHS', '/sensor/,/admin/,/ambulance/nearby-hospitals,/stream/'
+    ).split(',') if p]
+    LOAD_SHED_RATES = {
+        'critical': float(os.getenv('LOAD_SHED_CRITICAL_RATE', '0')),
+        'normal': float(os.getenv('LOAD_SHED_NORMAL_RATE', '5')),
+        'low': float(os.getenv('LOAD_SHED_LOW_RATE', '2')),
+    }
+    LOAD_SHED_BURSTS = {
+        'critical': float(os.getenv('LOAD_SHED_CRITICAL_BURST', '0')),
+        'normal': float(os.getenv('LOAD_SHED_NORMAL_BURST', '30')),
+        'low': float(os.getenv('LOAD_SHED_LOW_BURST', '20')),
+    }
+    LOAD_SHED_MAX_INFLIGHT = int(os.getenv('LOAD_SHED_MAX_INFLIGHT', '12'))
+    LOAD_SHED_LATENCY_MS = float(os.getenv('LOAD_SHED_LATENCY_MS', '1500'))
+    LOAD_SHED_QUEUE_MS = float(os.getenv('LOAD_SHED_QUEUE_MS', '1000'))
+    LOAD_SHED_NORMAL_FACTOR = float(os.getenv('LOAD_SHED_NORMAL_FACTOR', '1.5'))
+    LOAD_SHED_RETRY_AFTER_SECONDS = float(os.getenv('LOAD_SHED_RETRY_AFTER_SECONDS', '2'))
+
+    # Idempotency-Key: how long a key replays its response, and how long a claimed key is
+    # held for a handler before another retry may take it over
+    IDEMPOTENCY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_TTL_HOURS', '24'))
+    IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+
+    # Region shard key (utils/region.py, ops/sharding.py): geohash characters per region
+    # (4 = about 20 x 39 km), and whether dispatch searches the regions around a point first so
+    # its queries stay on one shard
+    SHARD_REGION_PRECISION = int(os.getenv('SHARD_REGION_PRECISION', '4'))
+    SHARDED_DISPATCH = os.getenv('SHARDED_DISPATCH', 'false').lower() == 'true'
+
+    # Change-stream event bus (utils/event_bus.py): one consumer per worker feeding cache
+    # invalidation, the admin map and SSE streams; poll interval when change streams are
+    # unavailable (standalone mongod), and the wait before reopening a failed stream
+    EVENT_BUS_ENABLED = os.getenv('EVENT_BUS_ENABLED', 'true').lower() == 'true'
+    EVENT_BUS_POLL_SECONDS = float(os.getenv('EVENT_BUS_POLL_SECONDS', '1'))
+    EVENT_BUS_RETRY_SECONDS = float(os.getenv('EVENT_BUS_RETRY_SECONDS', '2'))
+
+    # Archival of finished requests and their tracks (`flask --app app archive`, ops/archive.py):
+    # age in days, requests per batch, destination ('collection', 'ndjson' or 'parquet') and
+    # the directory for file archives
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+    ARCHIVE_TARGET = os.getenv('ARCHIVE_TARGET', 'collection')
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+
+    # Bulk export/import (`flask --app app export|import`, ops/bulk.py): documents per cursor
+    # batch / write, and parallel _id ranges (export) or files (import)
+    BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '5000'))
+    BULK_WORKERS = int(os.getenv('BULK_WORKERS', '4'))
+
+    # Load the detection model / hospital catalogue / road graph in a background thread at
+    # worker start instead of on the first request that needs them
+    WARM_UP_ON_BOOT = os.getenv('WARM_UP_ON_BOOT', 'true').lower() == 'true'
+
+    # Count MongoDB commands per Flask endpoint (db_ops in /admin/metrics; perf/city_loadtest.py)
+    DB_OP_COUNTING = os.getenv('DB_OP_COUNTING', 'false').lower() == 'true'
@@ -1,7 +1,20 @@
-/** Overpass API - fetch hospitals near a point (free, no key) */
+import api from './client';
+
+/** Overpass API - fetch hospitals near a point (free, no key). Fallback when the backend catalogue is empty. */
 const OVERPASS = 'https://overpass-api.de/api/interpreter';
 
+/** Backend hospital catalogue first (great-circle ranked, no third-party call); Overpass if it has nothing. */
 export async function fetchNearbyHospitals(lat, lng, radiusM = 5000) {
+  try {
+    const res = await api.get('/ambulance/nearby-hospitals', { params: { lat, lng, radius: radiusM, k: 10 } });
+    if (res.data?.catalogue_size > 0) return res.data.hospitals || [];
+  } catch (e) {
+    console.warn('Hospital catalogue lookup failed:', e);
+  }
+  return fetchOverpassHospitals(lat, lng, radiusM);
+}
+
+async function fetchOverpassHospitals(lat, lng, radiusM) {
   const query = `[out:json];(
     node["amenity"="hospital"](around:${radiusM},${lat},${lng});
     way["amenity"="hospital"](around:${radiusM},${lat},${lng});
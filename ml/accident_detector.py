@@ -27,6 +27,13 @@ def _load_model():
         pass
     return None
 
+def warm_up():
+    """Load the model (and numpy/sklearn with it) ahead of the first prediction."""
+    model_data = _load_model()
+    if model_data:
+        import numpy  # noqa: F401  (predict() imports it per call)
+    return model_data is not None
+
 def extract_features(readings):
     """
     Extract feature vector from sensor readings window.
@@ -1,118 +1,193 @@
 """
 Train accident detection ML model on synthetic data.
-Run: python -m ml.accident_train
-Output: ml/accident_model.joblib
+Run: python -m ml.accident_train [--seed 42] [--n-jobs -1] [--no-search] [--source traces]
+Output: ml/accident_model.joblib + ml/accident_model_metrics.json
+
+--source traces trains on features extracted from simulated raw 1 Hz streams
+(ml.synthetic_traces) instead of directly generated feature vectors.
+
+Synthetic samples are generated with vectorized NumPy draws from a seeded
+Generator, so the same seed always produces the same dataset and model.
+The hyperparameter search scores every candidate on cross-validated accuracy
+minus a penalty on inference cost (trees x depth) and keeps the best trade-off.
 """
 import os
 import sys
-import random
-import math
+import json
+import time
+import argparse
 import numpy as np
 from pathlib import Path
 
 # Ensure project root in path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-def generate_synthetic_accident_sample():
-    """Generate one accident sample: speed drop, accel spike, gyro spike, stopped 15s+."""
-    # Before accident: speed 30-80 km/h
-    speed_before = random.uniform(30, 80)
-    # After: sudden drop to 0-5
-    speed_after = random.uniform(0, 5)
+FEATURE_NAMES = [
+    'speed_drop', 'speed_drop_rate', 'accel_spike', 'gyro_spike',
+    'seconds_stopped', 'location_change_m', 'speed_before', 'speed_after'
+]
+
+# Candidate grid for the search; cost of a candidate is n_estimators * max_depth
+PARAM_GRID = {
+    'n_estimators': [25, 50, 100],
+    'max_depth': [4, 6, 8, 10],
+    'min_samples_leaf': [1, 5],
+}
+# Accuracy points given up per unit of (trees x depth); 1000 tree-levels ~ 0.5% accuracy
+COST_PENALTY = 5e-6
+
+
+def _rng(seed_or_rng):
+    if isinstance(seed_or_rng, np.random.Generator):
+        return seed_or_rng
+    return np.random.default_rng(seed_or_rng)
+
+
+def generate_synthetic_accident_samples(n, rng=None):
+    """Accident samples: speed drop, accel spike, gyro spike, stopped 15s+. Returns (n, 8) array."""
+    rng = _rng(rng)
+    # Before accident: speed 30-80 km/h; after: sudden drop to 0-5
+    speed_before = rng.uniform(30, 80, n)
+    speed_after = rng.uniform(0, 5, n)
     speed_drop = speed_before - speed_after
     speed_drop_rate = speed_drop / 3  # over ~3 sec
 
-    # Accelerometer: high magnitude change (impact)
-    accel_mag = random.uniform(15, 45)  # m/s^2 equivalent
-    accel_x = random.gauss(0, 1) * accel_mag / 3
-    accel_y = random.gauss(0, 1) * accel_mag / 3
-    accel_z = random.gauss(-1, 0.5) * accel_mag / 3  # often downward
-    accel_spike = math.sqrt(accel_x**2 + accel_y**2 + accel_z**2)
+    # Accelerometer: high magnitude change (impact), often downward on z
+    accel_mag = rng.uniform(15, 45, n)
+    accel_xy = rng.normal(0, 1, (n, 2)) * (accel_mag / 3)[:, None]
+    accel_z = rng.normal(-1, 0.5, n) * accel_mag / 3
+    accel_spike = np.sqrt((accel_xy ** 2).sum(axis=1) + accel_z ** 2)
 
     # Gyroscope: tilt/rotation spike
-    gyro_mag = random.uniform(2, 12)
-    gyro_x = random.gauss(0, 1) * gyro_mag
-    gyro_y = random.gauss(0, 1) * gyro_mag
-    gyro_z = random.gauss(0, 1) * gyro_mag
-    gyro_spike = math.sqrt(gyro_x**2 + gyro_y**2 + gyro_z**2)
-
-    # Stopped at same location for 15+ sec
-    seconds_stopped = random.uniform(15, 120)
-    location_change_m = random.uniform(0, 5)  # minimal movement
-
-    return [
-        speed_drop,
-        speed_drop_rate,
-        accel_spike,
-        gyro_spike,
-        seconds_stopped,
-        location_change_m,
-        speed_before,
-        speed_after,
-    ]
-
-def generate_synthetic_shake_stop_sample():
-    """Generate one shake-at-standstill sample: phone shaken hard then stopped.
+    gyro_mag = rng.uniform(2, 12, n)
+    gyro_xyz = rng.normal(0, 1, (n, 3)) * gyro_mag[:, None]
+    gyro_spike = np.sqrt((gyro_xyz ** 2).sum(axis=1))
+
+    # Stopped at same location for 15+ sec, minimal movement
+    seconds_stopped = rng.uniform(15, 120, n)
+    location_change_m = rng.uniform(0, 5, n)
+
+    return np.column_stack([
+        speed_drop, speed_drop_rate, accel_spike, gyro_spike,
+        seconds_stopped, location_change_m, speed_before, speed_after,
+    ])
+
+
+def generate_synthetic_shake_stop_samples(n, rng=None):
+    """Shake-at-standstill samples: phone shaken hard then stopped (demo scenario).
     Speed is ~0 (person standing/sitting), high accel, moderate gyro, stopped 10-60s.
-    This represents the demo scenario where user shakes phone and places it down.
     """
-    # Person is stationary - speed is near zero
-    speed_before = random.uniform(0, 3)
-    speed_after = random.uniform(0, 2)
-    speed_drop = max(0, speed_before - speed_after)
+    rng = _rng(rng)
+    speed_before = rng.uniform(0, 3, n)
+    speed_after = rng.uniform(0, 2, n)
+    speed_drop = np.maximum(0, speed_before - speed_after)
     speed_drop_rate = speed_drop / 2
 
-    # High accelerometer from shaking (above gravity ~9.8)
-    accel_spike = random.uniform(10, 35)
+    # High accelerometer from shaking (above gravity ~9.8), moderate gyro from rotation
+    accel_spike = rng.uniform(10, 35, n)
+    gyro_spike = rng.uniform(5, 40, n)
 
-    # Moderate gyroscope from rotation during shake
-    gyro_spike = random.uniform(5, 40)
+    # Phone stopped after shake for 10-60 sec; person barely moves
+    seconds_stopped = rng.uniform(10, 60, n)
+    location_change_m = rng.uniform(0, 10, n)
 
-    # Phone stopped after shake for 10-60 sec
-    seconds_stopped = random.uniform(10, 60)
-    location_change_m = random.uniform(0, 10)  # person barely moves
+    return np.column_stack([
+        speed_drop, speed_drop_rate, accel_spike, gyro_spike,
+        seconds_stopped, location_change_m, speed_before, speed_after,
+    ])
 
-    return [
-        speed_drop,
-        speed_drop_rate,
-        accel_spike,
-        gyro_spike,
-        seconds_stopped,
-        location_change_m,
-        speed_before,
-        speed_after,
-    ]
 
-def generate_synthetic_normal_sample():
-    """Generate one normal driving sample: gradual changes, no impact."""
-    # Normal speed variation
-    speed = random.uniform(0, 80)
-    speed_drop = random.uniform(-5, 5)  # small changes
-    speed_drop_rate = random.uniform(-2, 2)
+def generate_synthetic_normal_samples(n, rng=None):
+    """Normal driving samples: gradual changes, no impact."""
+    rng = _rng(rng)
+    speed = rng.uniform(0, 80, n)
+    speed_drop = rng.uniform(-5, 5, n)  # small changes
+    speed_drop_rate = rng.uniform(-2, 2, n)
 
-    # Low accel (normal driving)
-    accel_spike = random.uniform(0, 8)
-
-    # Low gyro
-    gyro_spike = random.uniform(0, 2)
+    # Low accel and gyro (normal driving)
+    accel_spike = rng.uniform(0, 8, n)
+    gyro_spike = rng.uniform(0, 2, n)
 
     # Either moving or short stop
-    seconds_stopped = random.uniform(0, 8)
-    location_change_m = random.uniform(0, 500)
-
-    return [
-        speed_drop,
-        speed_drop_rate,
-        accel_spike,
-        gyro_spike,
-        seconds_stopped,
-        location_change_m,
-        speed,
-        max(0, speed + speed_drop),
-    ]
-
-def train_and_save(n_accidents=2000, n_shake_stop=1500, n_normal=4000):
-    """Generate synthetic data including shake-stop samples, train model, save to joblib."""
+    seconds_stopped = rng.uniform(0, 8, n)
+    location_change_m = rng.uniform(0, 500, n)
+
+    return np.column_stack([
+        speed_drop, speed_drop_rate, accel_spike, gyro_spike,
+        seconds_stopped, location_change_m, speed, np.maximum(0, speed + speed_drop),
+    ])
+
+
+def build_dataset(n_accidents=2000, n_shake_stop=1500, n_normal=4000, seed=42):
+    """Generate the labelled synthetic dataset. Same seed -> identical X, y."""
+    rng = np.random.default_rng(seed)
+    X = np.vstack([
+        generate_synthetic_accident_samples(n_accidents, rng),
+        generate_synthetic_shake_stop_samples(n_shake_stop, rng),
+        generate_synthetic_normal_samples(n_normal, rng),
+    ])
+    # Both vehicle accidents and shake-stop are labeled as accident (1)
+    y = np.concatenate([
+        np.ones(n_accidents + n_shake_stop, dtype=int),
+        np.zeros(n_normal, dtype=int),
+    ])
+    return X, y
+
+
+def inference_cost(params):
+    """Relative per-row inference cost of a forest: trees x depth."""
+    return params['n_estimators'] * params['max_depth']
+
+
+def measure_row_latency(clf, X, repeats=200):
+    """Median wall time (microseconds) of a single-row predict_proba, as done in ml.accident_detector.predict."""
+    row = X[:1]
+    clf.predict_proba(row)  # warm-up
+    samples = []
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        t0 = time.perf_counter()
+        clf.predict_proba(row)
+        samples.append(time.perf_counter() - t0)
+    return float(np.median(samples) * 1e6)
+
+
+def search_hyperparameters(X, y, seed=42, n_jobs=-1, cv=5, param_grid=None, cost_penalty=COST_PENALTY):
+    """
+    Cross-validated grid search scored on accuracy - cost_penalty * (trees x depth).
+    Returns (best_params, candidates) where candidates is a list of dicts sorted best first.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+
+    grid = GridSearchCV(
+        RandomForestClassifier(random_state=seed, n_jobs=1),
+        param_grid or PARAM_GRID,
+        scoring='accuracy',
+        cv=StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed),
+        n_jobs=n_jobs,
+    )
+    grid.fit(X, y)
+
+    candidates = []
+    for params, mean, std in zip(grid.cv_results_['params'],
+                                 grid.cv_results_['mean_test_score'],
+                                 grid.cv_results_['std_test_score']):
+        cost = inference_cost(params)
+        candidates.append({
+            'params': params,
+            'cv_accuracy': float(mean),
+            'cv_accuracy_std': float(std),
+            'cost': cost,
+            'objective': float(mean) - cost_penalty * cost,
+        })
+    candidates.sort(key=lambda c: (-c['objective'], c['cost']))
+    return candidates[0]['params'], candidates
+
+
+def train_and_save(n_accidents=2000, n_shake_stop=1500, n_normal=4000, seed=42, n_jobs=-1,
+                   search=True, cv=5, output_dir=None, source='synthetic', traces_per_scenario=2000):
+    """Generate synthetic data including shake-stop samples, train model, save model + metrics report."""
     try:
         import joblib
         from sklearn.ensemble import RandomForestClassifier
@@ -121,30 +196,73 @@ def train_and_save(n_accidents=2000, n_shake_stop=1500, n_normal=4000):
         print("Install: pip install scikit-learn joblib")
         raise
 
-    X_acc = [generate_synthetic_accident_sample() for _ in range(n_accidents)]
-    X_shake = [generate_synthetic_shake_stop_sample() for _ in range(n_shake_stop)]
-    X_norm = [generate_synthetic_normal_sample() for _ in range(n_normal)]
-
-    # Both vehicle accidents and shake-stop are labeled as accident (1)
-    X = np.array(X_acc + X_shake + X_norm)
-    y = np.array([1] * n_accidents + [1] * n_shake_stop + [0] * n_normal)
+    t_start = time.perf_counter()
+    if source == 'traces':
+        from ml.synthetic_traces import build_trace_dataset
+        X, y = build_trace_dataset(traces_per_scenario, seed=seed, processes=None if n_jobs == -1 else max(1, n_jobs))
+    else:
+        X, y = build_dataset(n_accidents, n_shake_stop, n_normal, seed=seed)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed, stratify=y)
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    candidates = []
+    if search:
+        params, candidates = search_hyperparameters(X_train, y_train, seed=seed, n_jobs=n_jobs, cv=cv)
+        print(f"Best params: {params} (cv accuracy {candidates[0]['cv_accuracy']:.3f}, cost {candidates[0]['cost']})")
+    else:
+        params = {'n_estimators': 100, 'max_depth': 10}
 
-    clf = RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42)
+    clf = RandomForestClassifier(random_state=seed, n_jobs=n_jobs, **params)
     clf.fit(X_train, y_train)
+    # Serving predicts one row at a time; a single-threaded forest avoids joblib dispatch overhead per call
+    clf.set_params(n_jobs=1)
 
     score = clf.score(X_test, y_test)
-    print(f"Model accuracy: {score:.3f}")
+    latency_us = measure_row_latency(clf, X_test)
+    print(f"Model accuracy: {score:.3f}, per-row latency: {latency_us:.0f} us")
 
-    ml_dir = Path(__file__).resolve().parent
+    ml_dir = Path(output_dir) if output_dir else Path(__file__).resolve().parent
     model_path = ml_dir / "accident_model.joblib"
-    joblib.dump({'model': clf, 'feature_names': [
-        'speed_drop', 'speed_drop_rate', 'accel_spike', 'gyro_spike',
-        'seconds_stopped', 'location_change_m', 'speed_before', 'speed_after'
-    ]}, model_path)
-    print(f"Saved to {model_path}")
+    joblib.dump({'model': clf, 'feature_names': FEATURE_NAMES, 'params': params, 'seed': seed}, model_path)
+
+    report = {
+        'seed': seed,
+        'source': source,
+        'samples': (
+            {'per_scenario': traces_per_scenario, 'total': int(len(y))} if source == 'traces'
+            else {'accident': n_accidents, 'shake_stop': n_shake_stop, 'normal': n_normal}
+        ),
+        'params': params,
+        'test_accuracy': float(score),
+        'inference_cost': inference_cost(params),
+        'predicted_row_latency_us': latency_us,
+        'training_seconds': round(time.perf_counter() - t_start, 3),
+        'search': candidates,
+    }
+    metrics_path = ml_dir / "accident_model_metrics.json"
+    with open(metrics_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved to {model_path} (metrics: {metrics_path})")
     return model_path
 
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the accident detection model on synthetic data.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--n-jobs', type=int, default=int(os.getenv('TRAIN_N_JOBS', -1)))
+    parser.add_argument('--n-accidents', type=int, default=2000)
+    parser.add_argument('--n-shake-stop', type=int, default=1500)
+    parser.add_argument('--n-normal', type=int, default=4000)
+    parser.add_argument('--cv', type=int, default=5)
+    parser.add_argument('--source', choices=['synthetic', 'traces'], default='synthetic')
+    parser.add_argument('--traces-per-scenario', type=int, default=2000)
+    parser.add_argument('--no-search', action='store_true', help='Skip the search; use 100 trees, depth 10')
+    args = parser.parse_args(argv)
+    return train_and_save(
+        n_accidents=args.n_accidents, n_shake_stop=args.n_shake_stop, n_normal=args.n_normal,
+        seed=args.seed, n_jobs=args.n_jobs, search=not args.no_search, cv=args.cv,
+        source=args.source, traces_per_scenario=args.traces_per_scenario,
+    )
+
+
 if __name__ == '__main__':
-    train_and_save()
+    main()
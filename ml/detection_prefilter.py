@@ -0,0 +1,177 @@
+"""
+Cheap pre-filter in front of accident detection for idle sensor streams.
+
+Keeps running stats per user for the samples this worker has seen (max accel/gyro
+magnitude, speed range, stationary time) and reports whether the full path
+(100-reading window read + extract_features + model) can be skipped because every
+rule in ml.accident_detector.rule_based_predict is far out of reach.
+
+The local window is re-seeded from the DB window on every full evaluation. Under several
+workers (or nodes) one user's samples are spread across processes, so the caller passes
+the _id of the user's newest reading in the DB before the new one was stored. A sample is
+only skipped when that reading is the last one this worker saw, i.e. the local window
+holds every reading in between; otherwise, or when the seed is older than RESEED_SECONDS,
+it is evaluated in full.
+"""
+import math
+import threading
+from collections import OrderedDict, deque
+
+from utils import metrics
+
+WINDOW_SIZE = 100           # same as SensorReadingModel.get_recent_for_user default
+MAX_USERS = 20000
+RESEED_SECONDS = 60
+MARGIN = 0.8                # skip only when stats are below 80% of every threshold
+STOP_RADIUS_M = 50          # same as extract_features' "same spot" distance
+
+_USERS = OrderedDict()      # user_id -> _UserStats
+_LOCK = threading.Lock()
+_COUNTERS = {'evaluated': 0, 'skipped': 0, 'seeded': 0}
+
+
+class _UserStats:
+    __slots__ = ('samples', 'seeded_at', 'last_id')
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW_SIZE)  # (ts, accel_mag, gyro_mag, speed, lat, lng)
+        self.seeded_at = None
+        self.last_id = None       # _id of the newest reading in samples
+
+
+def _ts(value):
+    if value is None:
+        return None
+    if hasattr(value, 'timestamp'):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return float(value)
+    return None
+
+
+def _sample(r):
+    """Same magnitudes as extract_features (missing axes count as 0)."""
+    ax, ay, az = r.get('accel_x') or 0, r.get('accel_y') or 0, r.get('accel_z') or 0
+    gx, gy, gz = r.get('gyro_x') or 0, r.get('gyro_y') or 0, r.get('gyro_z') or 0
+    return (
+        _ts(r.get('timestamp')),
+        math.sqrt(ax * ax + ay * ay + az * az),
+        math.sqrt(gx * gx + gy * gy + gz * gz),
+        r.get('speed_kmh'),
+        r.get('lat'),
+        r.get('lng'),
+    )
+
+
+def _stationary_seconds(samples):
+    """
+    Longest recent span whose positions stay within STOP_RADIUS_M (same extent metric as
+    extract_features). This is never less than extract_features' seconds_stopped.
+    """
+    lat_min = lat_max = lng_min = lng_max = None
+    newest = oldest = None
+    for ts, _a, _g, _s, lat, lng in reversed(samples):
+        if lat is None or lng is None:
+            continue
+        if lat_min is None:
+            lat_min = lat_max = lat
+            lng_min = lng_max = lng
+        else:
+            lat_min, lat_max = min(lat_min, lat), max(lat_max, lat)
+            lng_min, lng_max = min(lng_min, lng), max(lng_max, lng)
+        d_lat = (lat_max - lat_min) * 111320
+        d_lng = (lng_max - lng_min) * 111320 * math.cos(math.radians((lat_max + lat_min) / 2))
+        if math.sqrt(d_lat ** 2 + d_lng ** 2) >= STOP_RADIUS_M:
+            break
+        if ts is not None:
+            newest = ts if newest is None else newest
+            oldest = ts
+    if newest is None or oldest is None:
+        return 0
+    return newest - oldest
+
+
+def _far_below_rules(samples):
+    accel = max(s[1] for s in samples)
+    gyro = max(s[2] for s in samples)
+    speeds = [s[3] for s in samples if s[3] is not None]
+    speed_max = max(speeds) if speeds else 0
+    speed_delta = speed_max - min(speeds) if speeds else 0
+    stopped = _stationary_seconds(samples)
+    m = MARGIN
+    # Path 1: accel >= 9.5 and stopped >= 8
+    path1 = accel >= 9.5 * m and stopped >= 8 * m
+    # Path 2: gyro >= 50 and accel >= 10
+    path2 = gyro >= 50 * m and accel >= 10 * m
+    # Paths 3/4: gyro >= 10 (15), accel >= 5, stopped >= 8 (10)
+    path34 = gyro >= 10 * m and accel >= 5 * m and stopped >= 8 * m
+    # Path 5: speed_before >= 25, speed_drop >= 20, accel >= 10
+    path5 = speed_max >= 25 * m and speed_delta >= 20 * m and accel >= 10 * m
+    return not (path1 or path2 or path34 or path5)
+
+
+def _get(user_id):
+    stats = _USERS.get(user_id)
+    if stats is None:
+        stats = _USERS[user_id] = _UserStats()
+        if len(_USERS) > MAX_USERS:
+            _USERS.popitem(last=False)
+    else:
+        _USERS.move_to_end(user_id)
+    return stats
+
+
+def should_evaluate(user_id, previous_id, reading, shake_stop_flag=False):
+    """
+    Record the new (stored) reading and decide if the full detection path must run.
+    previous_id is the _id of the user's newest reading before this one
+    (SensorReadingModel.latest_id, read before the insert).
+    Returns True to evaluate (caller should then seed() with the DB window), False to skip.
+    """
+    sample = _sample(reading)
+    now = sample[0]
+    with _LOCK:
+        stats = _get(str(user_id))
+        fresh = (
+            stats.seeded_at is not None and now is not None
+            and previous_id is not None and stats.last_id == previous_id
+            and now - stats.seeded_at <= RESEED_SECONDS
+        )
+        stats.samples.append(sample)
+        stats.last_id = reading.get('_id')
+        if fresh and not shake_stop_flag and _far_below_rules(stats.samples):
+            _COUNTERS['skipped'] += 1
+            return False
+        _COUNTERS['evaluated'] += 1
+        return True
+
+
+def seed(user_id, readings):
+    """Replace the local window with the readings used for a full evaluation."""
+    samples = [_sample(r) for r in readings[-WINDOW_SIZE:]]
+    with _LOCK:
+        stats = _get(str(user_id))
+        stats.samples.clear()
+        stats.samples.extend(samples)
+        stamps = [s[0] for s in samples if s[0] is not None]
+        stats.seeded_at = max(stamps) if stamps else None
+        stats.last_id = readings[-1].get('_id') if readings else None
+        _COUNTERS['seeded'] += 1
+
+
+def forget(user_id):
+    with _LOCK:
+        _USERS.pop(str(user_id), None)
+
+
+def get_stats():
+    with _LOCK:
+        total = _COUNTERS['evaluated'] + _COUNTERS['skipped']
+        return dict(
+            _COUNTERS,
+            tracked_users=len(_USERS),
+            skip_ratio=round(_COUNTERS['skipped'] / total, 4) if total else 0.0,
+        )
+
+
+metrics.register('sensor_prefilter', get_stats)
@@ -0,0 +1,331 @@
+"""
+Raw 1 Hz sensor stream simulator for the accident detector.
+
+Unlike ml.accident_train's feature-level generators, this produces the same
+readings the app stores from /sensor/submit (lat, lng, speed_kmh, accel_*,
+gyro_*, timestamp), so features come from ml.accident_detector.extract_features
+exactly as in serving.
+
+Scenarios: parked, driving, braking, crash, phone_drop, shake_stop.
+Accel values include gravity (the frontend sends accelerationIncludingGravity);
+missing fields are NaN in arrays and None in reading dicts.
+
+Run:
+  python -m ml.synthetic_traces dataset --per-scenario 5000 --out data/traces.npz
+  python -m ml.synthetic_traces fleet-day --users 200 --hours 24 --out data/fleet_day --processes 8
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+
+# Ensure project root in path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+GRAVITY = 9.8
+M_PER_DEG_LAT = 111320.0
+DEFAULT_CENTER = (18.5204, 73.8567)  # Pune
+
+SCENARIOS = ['parked', 'driving', 'braking', 'crash', 'phone_drop', 'shake_stop']
+ACCIDENT_SCENARIOS = {'crash', 'shake_stop'}
+FIELDS = ['lat', 'lng', 'speed_kmh', 'accel_x', 'accel_y', 'accel_z', 'gyro_x', 'gyro_y', 'gyro_z']
+
+# Share of one-minute segments per scenario in a simulated fleet day
+FLEET_MIX = {
+    'parked': 0.46,
+    'driving': 0.48,
+    'braking': 0.05,
+    'phone_drop': 0.008,
+    'crash': 0.001,
+    'shake_stop': 0.001,
+}
+
+
+def _rng(seed_or_rng):
+    if isinstance(seed_or_rng, np.random.Generator):
+        return seed_or_rng
+    return np.random.default_rng(seed_or_rng)
+
+
+def _cruise_speed(rng, n, length, low=20, high=80):
+    """Smooth speed profiles (km/h): a random base speed plus a damped random walk."""
+    base = rng.uniform(low, high, (n, 1))
+    walk = np.cumsum(rng.normal(0, 1.2, (n, length)), axis=1)
+    walk -= walk.mean(axis=1, keepdims=True)
+    return np.clip(base + walk, 0, 130)
+
+
+def _gravity_vector(rng, n):
+    """Random phone orientation: unit vectors scaled to gravity, shape (n, 3)."""
+    tilt = rng.uniform(0, 0.6, n)  # mostly screen-up in a mount or pocket
+    az = rng.uniform(0, 2 * np.pi, n)
+    return np.column_stack([
+        np.sin(tilt) * np.cos(az),
+        np.sin(tilt) * np.sin(az),
+        -np.cos(tilt),
+    ]) * GRAVITY
+
+
+def simulate(scenario, n, length=60, rng=None, center=DEFAULT_CENTER, spread_km=15.0,
+             gps_jitter_m=4.0, missing_rate=0.02):
+    """
+    Simulate n traces of `length` seconds for one scenario.
+    Returns dict of float32 arrays shaped (n, length) for each of FIELDS, plus
+    'event_at' (n,) index of the scenario event (-1 if none) and 'label' (n,).
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    rng = _rng(rng)
+    t = np.arange(length)[None, :]
+    event_at = rng.integers(length // 4, length // 2, n) if scenario != 'driving' and scenario != 'parked' else np.full(n, -1)
+    after = t >= event_at[:, None]
+
+    accel = np.broadcast_to(_gravity_vector(rng, n)[:, :, None], (n, 3, length)).copy()
+    accel += rng.normal(0, 0.25, (n, 3, length))
+    gyro = rng.normal(0, 1.5, (n, 3, length))
+
+    if scenario == 'parked':
+        speed = np.zeros((n, length))
+        # Frontend reports gravity-only readings and no rotation when the phone is still
+        accel[:] = np.array([0.0, 0.0, -GRAVITY])[None, :, None]
+        gyro[:] = 0.0
+    elif scenario == 'driving':
+        speed = _cruise_speed(rng, n, length)
+        accel += rng.normal(0, 0.8, (n, 3, length))  # road vibration
+    elif scenario == 'braking':
+        speed = _cruise_speed(rng, n, length, 35, 90)
+        decel_s = rng.uniform(2, 6, (n, 1))
+        floor = rng.uniform(0, 15, (n, 1))
+        ramp = np.clip((t - event_at[:, None]) / decel_s, 0, 1)
+        speed = speed - (speed - floor) * ramp * after
+        braking = after & (t < event_at[:, None] + decel_s)
+        accel[:, 1, :] += np.where(braking, rng.uniform(3, 7, (n, 1)), 0)
+    elif scenario == 'crash':
+        speed = _cruise_speed(rng, n, length, 30, 90)
+        speed = np.where(after, rng.uniform(0, 2, (n, length)), speed)
+        impact = (t >= event_at[:, None]) & (t < event_at[:, None] + rng.integers(1, 3, (n, 1)))
+        mag = rng.uniform(20, 60, (n, 1))
+        direction = rng.normal(0, 1, (n, 3, 1))
+        direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+        accel += direction * np.where(impact, mag, 0)[:, None, :]
+        gyro += rng.normal(0, 1, (n, 3, 1)) * np.where(impact, rng.uniform(60, 300, (n, 1)), 0)[:, None, :]
+        # Phone comes to rest in a new orientation
+        rest = _gravity_vector(rng, n)[:, :, None]
+        settled = (t >= event_at[:, None] + 3)[:, None, :]
+        accel = np.where(settled, rest + rng.normal(0, 0.05, (n, 3, length)), accel)
+        gyro = np.where(settled, 0.0, gyro)
+    elif scenario == 'phone_drop':
+        speed = np.where(rng.random((n, 1)) < 0.5, 0.0, _cruise_speed(rng, n, length, 0, 50))
+        freefall = t == event_at[:, None]
+        hit = t == event_at[:, None] + 1
+        accel = np.where(freefall[:, None, :], rng.normal(0, 0.5, (n, 3, length)), accel)
+        mag = rng.uniform(20, 45, (n, 1))
+        accel[:, 2, :] += np.where(hit, mag, 0)
+        gyro += rng.normal(0, 1, (n, 3, 1)) * np.where(freefall | hit, rng.uniform(100, 400, (n, 1)), 0)[:, None, :]
+    else:  # shake_stop
+        speed = rng.uniform(0, 3, (n, length))
+        shake_len = rng.integers(2, 6, (n, 1))
+        shaking = after & (t < event_at[:, None] + shake_len)
+        accel += rng.normal(0, 1, (n, 3, length)) * np.where(shaking, rng.uniform(10, 25, (n, 1)), 0)[:, None, :]
+        gyro += rng.normal(0, 1, (n, 3, length)) * np.where(shaking, rng.uniform(50, 250, (n, 1)), 0)[:, None, :]
+        still = (t >= event_at[:, None] + shake_len)
+        speed = np.where(still, 0.0, speed)
+        accel = np.where(still[:, None, :], np.array([0.0, 0.0, -GRAVITY])[None, :, None], accel)
+        gyro = np.where(still[:, None, :], 0.0, gyro)
+
+    # Integrate speed along a slowly turning heading, then add GPS jitter
+    heading = rng.uniform(0, 2 * np.pi, (n, 1)) + np.cumsum(rng.normal(0, 0.03, (n, length)), axis=1)
+    step_m = speed / 3.6
+    north = np.cumsum(step_m * np.cos(heading), axis=1)
+    east = np.cumsum(step_m * np.sin(heading), axis=1)
+    lat0 = center[0] + rng.uniform(-1, 1, (n, 1)) * spread_km * 1000 / M_PER_DEG_LAT
+    lng0 = center[1] + rng.uniform(-1, 1, (n, 1)) * spread_km * 1000 / (M_PER_DEG_LAT * np.cos(np.radians(center[0])))
+    lat = lat0 + (north + rng.normal(0, gps_jitter_m, (n, length))) / M_PER_DEG_LAT
+    lng = lng0 + (east + rng.normal(0, gps_jitter_m, (n, length))) / (M_PER_DEG_LAT * np.cos(np.radians(lat0)))
+    speed_obs = np.clip(speed + rng.normal(0, 1.0, (n, length)) * (speed > 0), 0, None)
+
+    out = {
+        'lat': lat, 'lng': lng, 'speed_kmh': speed_obs,
+        'accel_x': accel[:, 0], 'accel_y': accel[:, 1], 'accel_z': accel[:, 2],
+        'gyro_x': gyro[:, 0], 'gyro_y': gyro[:, 1], 'gyro_z': gyro[:, 2],
+    }
+    for name in FIELDS:
+        arr = out[name].astype(np.float32 if name not in ('lat', 'lng') else np.float64)
+        if missing_rate:
+            arr[rng.random(arr.shape) < missing_rate] = np.nan
+        out[name] = arr
+    out['event_at'] = event_at.astype(np.int32)
+    out['label'] = np.full(n, 1 if scenario in ACCIDENT_SCENARIOS else 0, dtype=np.int8)
+    return out
+
+
+def to_readings(batch, i, start=None):
+    """Convert trace i of a simulate() batch to reading dicts as stored by SensorReadingModel."""
+    start = start or datetime(2024, 1, 1)
+    length = batch['lat'].shape[1]
+    columns = {name: batch[name][i].tolist() for name in FIELDS}
+    readings = []
+    for j in range(length):
+        r = {name: (None if v != v else v) for name, v in ((name, columns[name][j]) for name in FIELDS)}
+        r['timestamp'] = start + timedelta(seconds=j)
+        readings.append(r)
+    return readings
+
+
+def _features_for_chunk(args):
+    scenario, n, length, seed = args
+    from ml.accident_detector import extract_features
+    batch = simulate(scenario, n, length, rng=seed)
+    X = [extract_features(to_readings(batch, i)) for i in range(n)]
+    return np.array(X, dtype=np.float64), batch['label'].astype(int)
+
+
+def build_trace_dataset(n_per_scenario=2000, length=60, seed=42, processes=None, chunk=500):
+    """
+    Simulate raw traces for every scenario and run extract_features on each window.
+    Returns (X, y) ready for ml.accident_train. Work is split into seeded chunks
+    so the result does not depend on the process count.
+    """
+    seeds = np.random.SeedSequence(seed)
+    jobs = []
+    for scenario in SCENARIOS:
+        remaining = n_per_scenario
+        while remaining > 0:
+            size = min(chunk, remaining)
+            jobs.append((scenario, size, length, seeds.spawn(1)[0]))
+            remaining -= size
+    if processes == 1:
+        parts = [_features_for_chunk(job) for job in jobs]
+    else:
+        with Pool(processes or os.cpu_count()) as pool:
+            parts = pool.map(_features_for_chunk, jobs)
+    X = np.vstack([p[0] for p in parts])
+    y = np.concatenate([p[1] for p in parts])
+    return X, y
+
+
+def simulate_user_day(user_idx, hours=24, seed=None, segment_s=60, mix=None):
+    """
+    One user's day as consecutive one-minute segments drawn from the scenario mix.
+    Segments are chained so each starts where the previous ended.
+    Returns dict of 1D arrays (hours*3600 rows) including 't', 'user', 'scenario' and 'event' marker.
+    """
+    rng = _rng(seed)
+    mix = mix or FLEET_MIX
+    names = list(mix)
+    probs = np.array([mix[k] for k in names], dtype=float)
+    n_seg = int(hours * 3600 // segment_s)
+    seg_scenario = rng.choice(len(names), n_seg, p=probs / probs.sum())
+    center = (DEFAULT_CENTER[0] + rng.uniform(-0.1, 0.1), DEFAULT_CENTER[1] + rng.uniform(-0.1, 0.1))
+
+    cols = {name: np.empty((n_seg, segment_s), dtype=np.float64 if name in ('lat', 'lng') else np.float32) for name in FIELDS}
+    event = np.zeros((n_seg, segment_s), dtype=np.int8)
+    for code, name in enumerate(names):
+        idx = np.flatnonzero(seg_scenario == code)
+        if not len(idx):
+            continue
+        batch = simulate(name, len(idx), segment_s, rng=rng, center=center, spread_km=0.0)
+        for f in FIELDS:
+            cols[f][idx] = batch[f]
+        hit = batch['event_at'] >= 0
+        if name in ACCIDENT_SCENARIOS:
+            event[idx[hit], batch['event_at'][hit]] = 1
+
+    # Chain segments: shift each one so it starts at the previous segment's last position
+    for name, origin in (('lat', center[0]), ('lng', center[1])):
+        seg = cols[name]
+        first = np.nan_to_num(np.where(np.isnan(seg[:, 0]), seg[:, 1], seg[:, 0]), nan=origin)
+        last = np.nan_to_num(np.where(np.isnan(seg[:, -1]), seg[:, -2], seg[:, -1]), nan=origin)
+        offset = np.concatenate([[0.0], np.cumsum(last - first)[:-1]])
+        seg += offset[:, None]
+
+    total = n_seg * segment_s
+    day = {f: cols[f].reshape(total) for f in FIELDS}
+    day['t'] = np.arange(total, dtype=np.int32)
+    day['user'] = np.full(total, user_idx, dtype=np.int32)
+    day['scenario'] = np.repeat(seg_scenario.astype(np.int8), segment_s)
+    day['event'] = event.reshape(total)
+    return day
+
+
+def _fleet_shard(args):
+    shard, users, hours, seed, out_dir = args
+    rngs = [np.random.default_rng(s) for s in seed.spawn(len(users))]
+    days = [simulate_user_day(u, hours, rng) for u, rng in zip(users, rngs)]
+    merged = {k: np.concatenate([d[k] for d in days]) for k in days[0]}
+    path = Path(out_dir) / f"fleet-{shard:04d}.npz"
+    np.savez_compressed(path, **merged)
+    return str(path), int(len(merged['t']))
+
+
+def generate_fleet_day(n_users=200, hours=24, out_dir='data/fleet_day', processes=None, seed=42, users_per_shard=25):
+    """
+    Simulate n_users phones streaming at 1 Hz for `hours`, written as compressed
+    .npz shards (one per users_per_shard users) using a process pool.
+    Returns list of (path, rows).
+    """
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    shard_users = [list(range(i, min(i + users_per_shard, n_users))) for i in range(0, n_users, users_per_shard)]
+    shard_seeds = np.random.SeedSequence(seed).spawn(len(shard_users))
+    jobs = [(i, users, hours, s, out_dir) for i, (users, s) in enumerate(zip(shard_users, shard_seeds))]
+    if processes == 1:
+        return [_fleet_shard(job) for job in jobs]
+    with Pool(processes or os.cpu_count()) as pool:
+        return pool.map(_fleet_shard, jobs)
+
+
+def iter_fleet_readings(path, start=None):
+    """
+    Stream (user_idx, reading_dict) from fleet-day shards in timestamp order within each shard.
+    Used by the load test and ingestion benchmark to replay the corpus.
+    """
+    start = start or datetime(2024, 1, 1)
+    paths = sorted(Path(path).glob('fleet-*.npz')) if Path(path).is_dir() else [Path(path)]
+    for p in paths:
+        data = np.load(p)
+        order = np.lexsort((data['user'], data['t']))
+        cols = {f: data[f][order] for f in FIELDS}
+        users = data['user'][order]
+        ts = data['t'][order]
+        for k in range(len(order)):
+            r = {f: (None if cols[f][k] != cols[f][k] else float(cols[f][k])) for f in FIELDS}
+            r['timestamp'] = start + timedelta(seconds=int(ts[k]))
+            yield int(users[k]), r
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate raw sensor streams for the accident detector.')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    ds = sub.add_parser('dataset', help='Labelled feature windows from simulated traces')
+    ds.add_argument('--per-scenario', type=int, default=2000)
+    ds.add_argument('--length', type=int, default=60)
+    ds.add_argument('--seed', type=int, default=42)
+    ds.add_argument('--processes', type=int, default=None)
+    ds.add_argument('--out', default='data/traces.npz')
+    fd = sub.add_parser('fleet-day', help='Raw 1 Hz streams for a fleet of phones')
+    fd.add_argument('--users', type=int, default=200)
+    fd.add_argument('--hours', type=float, default=24)
+    fd.add_argument('--seed', type=int, default=42)
+    fd.add_argument('--processes', type=int, default=None)
+    fd.add_argument('--out', default='data/fleet_day')
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.cmd == 'dataset':
+        X, y = build_trace_dataset(args.per_scenario, args.length, args.seed, args.processes)
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(args.out, X=X, y=y)
+        print(f"{len(y)} windows ({int(y.sum())} accidents) -> {args.out} in {time.perf_counter() - t0:.1f}s")
+    else:
+        shards = generate_fleet_day(args.users, args.hours, args.out, args.processes, args.seed)
+        rows = sum(r for _, r in shards)
+        print(f"{rows} readings in {len(shards)} shards -> {args.out} in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+from config import Config
 from utils.time_utils import get_ist_now_naive
+from utils.cache import profile_cache
+from utils.db import dispatch_collection
+from utils.region import region_of, near_filter
+from models.live_incident_model import LiveIncidentModel, safe_update
 
 class AmbulanceModel:
     @staticmethod
@@ -20,7 +26,8 @@ class AmbulanceModel:
             'current_location': None,
             'current_location_updated_at': None,
             'profile_completed': False,  # Track if profile is completed
-            'created_at': get_ist_now_naive()
+            'created_at': get_ist_now_naive(),
+            'updated_at': get_ist_now_naive()
         }
         result = db.ambulances.insert_one(ambulance)
         return result.inserted_id
@@ -31,7 +38,10 @@ class AmbulanceModel:
 
     @staticmethod
     def find_by_id(db, ambulance_id):
-        return db.ambulances.find_one({'_id': ObjectId(ambulance_id)})
+        """Cached for a few seconds (utils.cache.profile_cache); writes below invalidate it."""
+        return profile_cache.get_or_load(
+            db, 'ambulance', ambulance_id, lambda: db.ambulances.find_one({'_id': ObjectId(ambulance_id)})
+        )
 
     @staticmethod
     def update_profile(db, ambulance_id, update_data):
@@ -39,33 +49,111 @@ class AmbulanceModel:
         required_fields = ['name', 'age', 'date_of_birth', 'gender', 'vehicle_number', 'driving_license']
         if all(key in update_data and update_data.get(key) for key in required_fields):
             update_data['profile_completed'] = True
-        db.ambulances.update_one(
+        updated = db.ambulances.find_one_and_update(
             {'_id': ObjectId(ambulance_id)},
-            {'$set': update_data}
+            {'$set': dict(update_data, updated_at=get_ist_now_naive())},
+            return_document=ReturnDocument.AFTER
         )
-        return db.ambulances.find_one({'_id': ObjectId(ambulance_id)})
+        AmbulanceModel._cache_after_write(db, ambulance_id, updated)
+        return updated
 
     @staticmethod
     def update_status(db, ambulance_id, status):
-        db.ambulances.update_one(
+        updated = db.ambulances.find_one_and_update(
             {'_id': ObjectId(ambulance_id)},
-            {'$set': {'status': status}}
+            {'$set': {'status': status, 'updated_at': get_ist_now_naive()}},
+            return_document=ReturnDocument.AFTER
         )
-        return db.ambulances.find_one({'_id': ObjectId(ambulance_id)})
+        AmbulanceModel._cache_after_write(db, ambulance_id, updated)
+        return updated
 
     @staticmethod
-    def update_location(db, ambulance_id, lat, lng):
-        """Update location for specific ambulance_id only."""
+    def _location_update(lat, lng):
         now = get_ist_now_naive()
-        db.ambulances.update_one(
+        return {'$set': {
+            'current_location': {'lat': float(lat), 'lng': float(lng)},
+            'current_location_updated_at': now,
+            'region': region_of(lat, lng),
+            'updated_at': now,
+        }}
+
+    @staticmethod
+    def update_location(db, ambulance_id, lat, lng):
+        """Update location for specific ambulance_id only. Returns the updated document."""
+        updated = db.ambulances.find_one_and_update(
             {'_id': ObjectId(ambulance_id)},
-            {'$set': {
-                'current_location': {'lat': float(lat), 'lng': float(lng)},
-                'current_location_updated_at': now
-            }}
+            AmbulanceModel._location_update(lat, lng),
+            return_document=ReturnDocument.AFTER
         )
-        return db.ambulances.find_one({'_id': ObjectId(ambulance_id)})
+        AmbulanceModel._cache_after_write(db, ambulance_id, updated)
+        return updated
+
+    @staticmethod
+    def set_location(db, ambulance_id, lat, lng):
+        """Write-only update_location for callers that discard the document (GPS hot path)."""
+        result = db.ambulances.update_one(
+            {'_id': ObjectId(ambulance_id)},
+            AmbulanceModel._location_update(lat, lng)
+        )
+        profile_cache.invalidate(db, 'ambulance', ambulance_id)
+        return result.matched_count > 0
+
+    @staticmethod
+    def _cache_after_write(db, ambulance_id, updated):
+        """Write-through: the post-update document replaces the cached profile and the live view's copy."""
+        if updated is not None:
+            profile_cache.put(db, 'ambulance', updated)
+            safe_update(LiveIncidentModel.ambulance_changed, db, updated)
+        else:
+            profile_cache.invalidate(db, 'ambulance', ambulance_id)
     
+    @staticmethod
+    def claim(db, ambulance_id, request_id):
+        """
+        Reserve the ambulance for one request before assigning it (atomic, so concurrent
+        dispatches on any worker or node cannot both assign it). Cleared by release() when
+        the request leaves 'assigned'. A claim is taken over only when its request is gone or
+        finished, or when it is older than DISPATCH_CLAIM_GRACE_SECONDS without its request
+        holding this ambulance (the dispatcher died between the claim and the request write).
+        """
+        now = get_ist_now_naive()
+        ambulances = dispatch_collection(db, 'ambulances')
+        claim = {'$set': {'assigned_request_id': str(request_id), 'claimed_at': now, 'updated_at': now}}
+        if ambulances.update_one({'_id': ObjectId(ambulance_id), 'assigned_request_id': None}, claim).modified_count:
+            profile_cache.invalidate(db, 'ambulance', ambulance_id)
+            return True
+        amb = ambulances.find_one({'_id': ObjectId(ambulance_id)}, {'assigned_request_id': 1, 'claimed_at': 1}) or {}
+        held = amb.get('assigned_request_id')
+        if not held:
+            return False
+        req = db.requests.find_one({'_id': ObjectId(held)}, {'status': 1, 'assigned_ambulance_id': 1})
+        if req is not None and req.get('status') in ('pending', 'assigned'):
+            if req.get('status') == 'assigned' and req.get('assigned_ambulance_id') == ObjectId(ambulance_id):
+                return False
+            claimed_at = amb.get('claimed_at')
+            if claimed_at is not None and (now - claimed_at).total_seconds() < Config.DISPATCH_CLAIM_GRACE_SECONDS:
+                return False   # its dispatcher may still be writing the request
+        taken = ambulances.update_one(
+            {'_id': ObjectId(ambulance_id), 'assigned_request_id': held, 'claimed_at': amb.get('claimed_at')}, claim
+        ).modified_count
+        profile_cache.invalidate(db, 'ambulance', ambulance_id)
+        return taken > 0
+
+    @staticmethod
+    def release(db, request_id):
+        """Clear the claim held for request_id (whichever ambulance has it)."""
+        result = dispatch_collection(db, 'ambulances').find_one_and_update(
+            {'assigned_request_id': str(request_id)},
+            {'$set': {'assigned_request_id': None, 'claimed_at': None, 'updated_at': get_ist_now_naive()}},
+            projection={'_id': 1}
+        )
+        if result:
+            profile_cache.invalidate(db, 'ambulance', str(result['_id']))
+
+    @staticmethod
+    def ensure_indexes(db):
+        db.ambulances.create_index('assigned_request_id', sparse=True)
+
     @staticmethod
     def has_active_assignment(db, ambulance_id):
         """Check if ambulance has an active assigned request (status='assigned')."""
@@ -76,22 +164,25 @@ class AmbulanceModel:
         return count > 0
 
     @staticmethod
-    def get_all_with_location(db, exclude_assigned=True):
+    def get_all_with_location(db, exclude_assigned=True, near=None):
         """All ambulances with location.
         If exclude_assigned=True, only ACTIVE ambulances without an active assignment are returned.
+        near=(lat, lng): only the regions around that point when SHARDED_DISPATCH is on.
         """
         query = {'current_location': {'$ne': None}}
         if exclude_assigned:
             # Only consider ambulances that are currently ACTIVE for assignment
             query['status'] = 'active'
+        if near:
+            query.update(near_filter(*near))
         ambulances = list(db.ambulances.find(query))
-        if exclude_assigned:
-            # Filter out ambulances with active assigned requests
-            filtered = []
-            for amb in ambulances:
-                if not AmbulanceModel.has_active_assignment(db, str(amb['_id'])):
-                    filtered.append(amb)
-            return filtered
+        if exclude_assigned and ambulances:
+            # Filter out ambulances with active assigned requests (one query for all of them)
+            busy = set(db.requests.distinct('assigned_ambulance_id', {
+                'assigned_ambulance_id': {'$in': [amb['_id'] for amb in ambulances]},
+                'status': 'assigned'
+            }))
+            return [amb for amb in ambulances if amb['_id'] not in busy]
         return ambulances
 
     @staticmethod
@@ -0,0 +1,115 @@
+"""
+Motor (asyncio) counterparts of the model methods used by the ASGI hot paths (asgi.py).
+
+Documents, filters and cache behaviour come from the sync models so both serving modes
+read and write the same shapes; only the I/O is awaited.
+"""
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from models.ambulance_model import AmbulanceModel
+from models.live_incident_model import COUNTER_ID, LiveIncidentModel, live_incidents
+from models.request_model import ARCHIVE_SUFFIX, RequestModel, LocationTrackModel
+from models.sensor_reading_model import SensorReadingModel
+from utils.cache import profile_cache
+
+
+class AsyncUserModel:
+    @staticmethod
+    async def find_by_id(db, user_id):
+        return await profile_cache.aget_or_load(
+            db, 'user', user_id, lambda: db.users.find_one({'_id': ObjectId(user_id)})
+        )
+
+
+class AsyncAmbulanceModel:
+    @staticmethod
+    async def find_by_id(db, ambulance_id):
+        return await profile_cache.aget_or_load(
+            db, 'ambulance', ambulance_id, lambda: db.ambulances.find_one({'_id': ObjectId(ambulance_id)})
+        )
+
+    @staticmethod
+    async def set_location(db, ambulance_id, lat, lng):
+        result = await db.ambulances.update_one(
+            {'_id': ObjectId(ambulance_id)},
+            AmbulanceModel._location_update(lat, lng)
+        )
+        profile_cache.invalidate(db, 'ambulance', ambulance_id)
+        return result.matched_count > 0
+
+
+class AsyncRequestModel:
+    @staticmethod
+    async def get_active_for_user(db, user_id):
+        reqs = await db.requests.find(
+            RequestModel._active_for_user_filter(user_id)
+        ).sort('created_at', -1).limit(1).to_list(1)
+        return reqs[0] if reqs else None
+
+    @staticmethod
+    async def get_active_for_ambulance(db, ambulance_id):
+        reqs = await db.requests.find(
+            RequestModel._active_for_ambulance_filter(ambulance_id)
+        ).sort('created_at', -1).limit(1).to_list(1)
+        return reqs[0] if reqs else None
+
+    @staticmethod
+    async def get_by_ambulance(db, ambulance_id, include_archive=False):
+        query = {'assigned_ambulance_id': ObjectId(ambulance_id)}
+        reqs = await db.requests.find(query).sort('created_at', -1).to_list(None)
+        if include_archive:
+            reqs += await db['requests' + ARCHIVE_SUFFIX].find(query).sort('created_at', -1).to_list(None)
+            reqs.sort(key=lambda r: r['created_at'], reverse=True)
+        return reqs
+
+
+class AsyncLocationTrackModel:
+    @staticmethod
+    async def add(db, request_id, ambulance_id, lat, lng):
+        doc = LocationTrackModel._doc(request_id, ambulance_id, lat, lng)
+        await db.location_tracks.insert_one(doc)
+        try:
+            await AsyncLiveIncidentModel.track_point(db, request_id, ambulance_id, lat, lng, doc['created_at'])
+        except Exception as e:
+            live_incidents.update_errors += 1
+            print(f"Live incident update failed: {e}")
+
+    @staticmethod
+    async def get_track_for_request(db, request_id):
+        return await db.location_tracks.find(
+            {'request_id': ObjectId(request_id)}
+        ).sort('created_at', 1).to_list(None)
+
+
+class AsyncLiveIncidentModel:
+    @staticmethod
+    async def track_point(db, request_id, ambulance_id, lat, lng, created_at):
+        counter = await db.counters.find_one_and_update(
+            {'_id': COUNTER_ID}, {'$inc': {'seq': 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        with_ambulance, track_only = LiveIncidentModel._track_updates(
+            request_id, ambulance_id, lat, lng, created_at, counter['seq']
+        )
+        if (await db.live_incidents.update_one(*with_ambulance)).matched_count == 0:
+            await db.live_incidents.update_one(*track_only)
+
+
+class AsyncSensorReadingModel:
+    @staticmethod
+    async def add(db, user_id, lat, lng, **fields):
+        doc = SensorReadingModel._doc(user_id, lat, lng, **fields)
+        await db.sensor_readings.insert_one(doc)
+        return doc
+
+    @staticmethod
+    async def latest_id(db, user_id):
+        doc = await db.sensor_readings.find_one({'user_id': ObjectId(user_id)}, {'_id': 1}, sort=[('timestamp', -1)])
+        return doc['_id'] if doc else None
+
+    @staticmethod
+    async def get_recent_for_user(db, user_id, limit=100):
+        readings = await db.sensor_readings.find(
+            {'user_id': ObjectId(user_id)}
+        ).sort('timestamp', -1).limit(limit).to_list(limit)
+        return list(reversed(readings))  # oldest first
@@ -0,0 +1,87 @@
+from datetime import timedelta
+import hashlib
+import json
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import Config
+from utils.time_utils import get_ist_now_naive
+
+NEW = 'new'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+
+
+class IdempotencyModel:
+    """
+    Client idempotency keys (Idempotency-Key header) for the endpoints that create
+    emergencies. One document per (scope, caller, key) with _id '<scope>:<caller>:<key>', so
+    the _id index is the unique index. Documents expire through a TTL index on expires_at.
+
+    claim() checks and reserves the key in one upsert: $setOnInsert, returning the document
+    as it was BEFORE. None means this call owns the key. An existing document holds either
+    the stored response to replay or a request still being handled.
+    """
+    @staticmethod
+    def _key(scope, caller, key):
+        return f"{scope}:{caller}:{key}"
+
+    @staticmethod
+    def fingerprint(payload):
+        """Hash of the request body, to refuse a key reused for a different request."""
+        if payload is None:
+            return None
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def claim(db, scope, caller, key, fingerprint=None):
+        """Returns (NEW | REPLAY | IN_PROGRESS | MISMATCH, existing document or None)."""
+        now = get_ist_now_naive()
+        _id = IdempotencyModel._key(scope, caller, key)
+        try:
+            before = db.idempotency_keys.find_one_and_update(
+                {'_id': _id},
+                {'$setOnInsert': {
+                    'state': 'pending',
+                    'fingerprint': fingerprint,
+                    'created_at': now,
+                    'locked_until': now + timedelta(seconds=Config.IDEMPOTENCY_LOCK_SECONDS),
+                    'expires_at': now + timedelta(hours=Config.IDEMPOTENCY_TTL_HOURS),
+                }},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            return IN_PROGRESS, None   # a concurrent first use won the insert
+        if before is None:
+            return NEW, None
+        if fingerprint and before.get('fingerprint') and before['fingerprint'] != fingerprint:
+            return MISMATCH, before
+        if before.get('state') == 'done':
+            return REPLAY, before
+        if before['locked_until'] <= now:
+            # The handler that claimed it died without finishing; take the key over
+            taken = db.idempotency_keys.find_one_and_update(
+                {'_id': _id, 'state': 'pending', 'locked_until': before['locked_until']},
+                {'$set': {'locked_until': now + timedelta(seconds=Config.IDEMPOTENCY_LOCK_SECONDS)}}
+            )
+            if taken is not None:
+                return NEW, None
+        return IN_PROGRESS, before
+
+    @staticmethod
+    def complete(db, scope, caller, key, status, body):
+        """Store the response replayed for later uses of the key."""
+        db.idempotency_keys.update_one(
+            {'_id': IdempotencyModel._key(scope, caller, key), 'state': 'pending'},
+            {'$set': {'state': 'done', 'status': status, 'body': body, 'completed_at': get_ist_now_naive()}}
+        )
+
+    @staticmethod
+    def release(db, scope, caller, key):
+        """Forget a claimed key whose request failed, so the client can retry it."""
+        db.idempotency_keys.delete_one({'_id': IdempotencyModel._key(scope, caller, key), 'state': 'pending'})
+
+    @staticmethod
+    def ensure_indexes(db):
+        db.idempotency_keys.create_index('expires_at', expireAfterSeconds=0)
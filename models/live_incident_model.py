@@ -0,0 +1,349 @@
+"""
+Materialized "live incidents" view behind GET /admin/dashboard-map.
+
+db.live_incidents holds one document per request that is not completed, already in the
+dashboard's shape (request, assigned ambulance, track). The request, ambulance and track
+write methods update it as they go, so a poll no longer rebuilds the picture from
+requests + ambulances + location_tracks. Each change stamps the document with the next
+value of a shared counter (db.counters, _id 'live_incidents'). A completed request leaves
+a tombstone ({'removed': True}) so clients holding an older version learn it is gone;
+`flask --app app maintenance` prunes old tombstones and raises the counter's 'floor'.
+
+live_incidents (LiveIncidentSnapshot) is each worker's in-memory copy. It checks the
+counter at most every LIVE_INCIDENTS_SYNC_SECONDS and re-reads only documents whose
+version moved, so fifty admin screens cost the database about the same as one. Responses
+carry a version; ?since=<version> returns just the incidents changed after it.
+
+A version is allocated before its document is written, so two concurrent writers can land
+out of order. Readers therefore only treat versions older than LIVE_INCIDENTS_SETTLE_SECONDS
+as complete: incidents changed inside that window are sent again on the next delta.
+"""
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from config import Config
+from utils import metrics
+from utils.time_utils import get_ist_now_naive
+
+COUNTER_ID = 'live_incidents'
+# Colour palette for different ambulances' tracks
+TRACK_COLORS = ['#3b82f6', '#ef4444', '#10b981', '#f59e0b', '#8b5cf6', '#ec4899', '#06b6d4', '#84cc16']
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+class LiveIncidentModel:
+    @staticmethod
+    def _next_versions(db, count=1):
+        """Reserve `count` versions; returns the highest."""
+        counter = db.counters.find_one_and_update(
+            {'_id': COUNTER_ID},
+            {'$inc': {'seq': count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter['seq']
+
+    @staticmethod
+    def _ambulance_view(amb):
+        if not amb:
+            return None
+        return {
+            'id': str(amb['_id']),
+            'name': amb.get('name'),
+            'phone': amb.get('phone'),
+            'vehicle_number': amb.get('vehicle_number'),
+            'driving_license': amb.get('driving_license'),
+            'age': amb.get('age'),
+            'gender': amb.get('gender'),
+            'status': amb.get('status'),
+            'current_location': amb.get('current_location'),
+            'current_location_updated_at': _iso(amb.get('current_location_updated_at')),
+        }
+
+    @staticmethod
+    def _track_point(lat, lng, created_at):
+        return {'lat': lat, 'lng': lng, 'created_at': _iso(created_at)}
+
+    @staticmethod
+    def _fields(req, amb):
+        return {
+            'location': req.get('location'),
+            'status': req.get('status'),
+            'created_at': _iso(req.get('created_at')),
+            'assigned_ambulance_id': str(req['assigned_ambulance_id']) if req.get('assigned_ambulance_id') else None,
+            'assigned_ambulance': LiveIncidentModel._ambulance_view(amb),
+            'selected_hospital': req.get('selected_hospital'),
+        }
+
+    @staticmethod
+    def _tombstone(version):
+        return {
+            '$set': {'removed': True, 'removed_at': get_ist_now_naive(), 'version': version},
+            '$unset': {'track': '', 'assigned_ambulance': '', 'location': '', 'selected_hospital': ''},
+        }
+
+    @staticmethod
+    def request_changed(db, req):
+        """Create/assign/hospital/complete: mirror the request's post-write document."""
+        if not req:
+            return
+        version = LiveIncidentModel._next_versions(db)
+        if req.get('status') == 'completed':
+            db.live_incidents.update_one({'_id': req['_id']}, LiveIncidentModel._tombstone(version))
+            return
+        amb = None
+        if req.get('assigned_ambulance_id'):
+            from models.ambulance_model import AmbulanceModel
+            amb = AmbulanceModel.find_by_id(db, str(req['assigned_ambulance_id']))
+        fields = LiveIncidentModel._fields(req, amb)
+        fields.update(version=version, removed=False)
+        db.live_incidents.update_one(
+            {'_id': req['_id']},
+            {'$set': fields, '$setOnInsert': {'track': []}, '$unset': {'removed_at': ''}},
+            upsert=True
+        )
+
+    @staticmethod
+    def requests_removed(db, request_ids):
+        """Requests deleted from the hot collection (archival): tombstone their rows."""
+        if not request_ids:
+            return
+        version = LiveIncidentModel._next_versions(db)
+        db.live_incidents.update_many(
+            {'_id': {'$in': list(request_ids)}, 'removed': {'$ne': True}}, LiveIncidentModel._tombstone(version)
+        )
+
+    @staticmethod
+    def _track_updates(request_id, ambulance_id, lat, lng, created_at, version):
+        """(filter, update) pairs: the first also moves the assigned ambulance's marker."""
+        point = LiveIncidentModel._track_point(float(lat), float(lng), created_at)
+        live = {'_id': ObjectId(request_id), 'removed': {'$ne': True}}
+        with_ambulance = (
+            dict(live, **{'assigned_ambulance.id': str(ambulance_id)}),
+            {'$push': {'track': point}, '$set': {
+                'version': version,
+                'assigned_ambulance.current_location': {'lat': point['lat'], 'lng': point['lng']},
+                'assigned_ambulance.current_location_updated_at': point['created_at'],
+            }}
+        )
+        track_only = (live, {'$push': {'track': point}, '$set': {'version': version}})
+        return with_ambulance, track_only
+
+    @staticmethod
+    def track_point(db, request_id, ambulance_id, lat, lng, created_at):
+        version = LiveIncidentModel._next_versions(db)
+        with_ambulance, track_only = LiveIncidentModel._track_updates(
+            request_id, ambulance_id, lat, lng, created_at, version
+        )
+        if db.live_incidents.update_one(*with_ambulance).matched_count == 0:
+            db.live_incidents.update_one(*track_only)
+
+    @staticmethod
+    def ambulance_changed(db, amb):
+        """Profile/status change: refresh the ambulance shown on its open incidents."""
+        if not amb or not db.live_incidents.find_one(
+                {'assigned_ambulance_id': str(amb['_id']), 'removed': {'$ne': True}}, {'_id': 1}):
+            return
+        version = LiveIncidentModel._next_versions(db)
+        db.live_incidents.update_many(
+            {'assigned_ambulance_id': str(amb['_id']), 'removed': {'$ne': True}},
+            {'$set': {'assigned_ambulance': LiveIncidentModel._ambulance_view(amb), 'version': version}}
+        )
+
+    @staticmethod
+    def rebuild(db):
+        """Recompute the view from requests/ambulances/location_tracks (first use, or after drift)."""
+        requests = list(db.requests.find({'status': {'$ne': 'completed'}}))
+        amb_ids = list({r['assigned_ambulance_id'] for r in requests if r.get('assigned_ambulance_id')})
+        ambulances = {a['_id']: a for a in db.ambulances.find({'_id': {'$in': amb_ids}})}
+        tracks = {}
+        for t in db.location_tracks.find({'request_id': {'$in': [r['_id'] for r in requests]}}).sort('created_at', 1):
+            tracks.setdefault(t['request_id'], []).append(
+                LiveIncidentModel._track_point(t['lat'], t['lng'], t.get('created_at'))
+            )
+        live_ids = {r['_id'] for r in requests}
+        stale = [d['_id'] for d in db.live_incidents.find({'removed': {'$ne': True}}, {'_id': 1})
+                 if d['_id'] not in live_ids]
+        version = LiveIncidentModel._next_versions(db, len(requests) + len(stale) + 1)
+        for req in requests:
+            doc = LiveIncidentModel._fields(req, ambulances.get(req.get('assigned_ambulance_id')))
+            doc.update(track=tracks.get(req['_id'], []), version=version, removed=False)
+            db.live_incidents.replace_one({'_id': req['_id']}, doc, upsert=True)
+        for request_id in stale:
+            db.live_incidents.update_one({'_id': request_id}, LiveIncidentModel._tombstone(version))
+        db.counters.update_one({'_id': COUNTER_ID}, {'$set': {'built_at': get_ist_now_naive()}})
+        return len(requests)
+
+    @staticmethod
+    def prune(db, older_than_hours=None):
+        """Drop old tombstones; clients with a version below the new floor get a full snapshot."""
+        hours = Config.LIVE_INCIDENTS_TOMBSTONE_HOURS if older_than_hours is None else older_than_hours
+        cutoff = get_ist_now_naive() - timedelta(hours=hours)
+        old = list(db.live_incidents.find({'removed': True, 'removed_at': {'$lt': cutoff}}, {'version': 1}))
+        if not old:
+            return 0
+        db.counters.update_one({'_id': COUNTER_ID}, {'$max': {'floor': max(d['version'] for d in old)}})
+        db.live_incidents.delete_many({'_id': {'$in': [d['_id'] for d in old]}})
+        return len(old)
+
+    @staticmethod
+    def ensure_indexes(db):
+        db.live_incidents.create_index('version')
+        db.live_incidents.create_index('assigned_ambulance_id')
+
+
+def safe_update(fn, *args):
+    """The view is derived data: a failed update must not fail the dispatch write that caused it."""
+    try:
+        fn(*args)
+    except Exception as e:
+        live_incidents.update_errors += 1
+        print(f"Live incident update failed: {e}")
+
+
+class LiveIncidentSnapshot:
+    """Per-worker copy of db.live_incidents, refreshed by version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}          # request id str -> view document (tombstones included)
+        self._version = 0        # highest version applied
+        self._seq = None         # counter value at the last check
+        self._floor = 0
+        self._history = deque()  # (monotonic time, version) after each sync, for the settle window
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._rendered = {}      # (since, version) -> encoded body
+        self.full_loads = 0
+        self.delta_loads = 0
+        self.served = 0
+        self.update_errors = 0
+
+    def _settled(self, now):
+        """Version as of LIVE_INCIDENTS_SETTLE_SECONDS ago: every write below it has landed."""
+        cutoff = now - Config.LIVE_INCIDENTS_SETTLE_SECONDS
+        while len(self._history) > 1 and self._history[1][0] <= cutoff:
+            self._history.popleft()
+        if self._history and self._history[0][0] <= cutoff:
+            return self._history[0][1]
+        return 0
+
+    def _apply(self, docs):
+        for d in docs:
+            self._docs[str(d['_id'])] = d
+            self._version = max(self._version, d.get('version', 0))
+
+    def refresh(self, db):
+        now = time.monotonic()
+        if now - self._checked_at < Config.LIVE_INCIDENTS_SYNC_SECONDS:
+            return
+        with self._lock:
+            if now - self._checked_at < Config.LIVE_INCIDENTS_SYNC_SECONDS:
+                return
+            counter = db.counters.find_one({'_id': COUNTER_ID})
+            if not counter or not counter.get('built_at'):
+                LiveIncidentModel.rebuild(db)
+                counter = db.counters.find_one({'_id': COUNTER_ID})
+            floor = counter.get('floor', 0)
+            if (not self._loaded_at or now - self._loaded_at >= Config.LIVE_INCIDENTS_RESYNC_SECONDS
+                    or floor > self._version):
+                self._docs, self._version = {}, 0
+                self._apply(db.live_incidents.find())
+                self._history.clear()
+                self._loaded_at = now
+                self.full_loads += 1
+            elif counter['seq'] != self._seq or self._settled(now) < self._version:
+                # Re-read everything not yet settled: catches writes that landed out of order
+                self._apply(db.live_incidents.find({'version': {'$gt': self._settled(now)}}))
+                self.delta_loads += 1
+            self._seq, self._floor = counter['seq'], floor
+            if not self._history or self._history[-1][1] != self._version:
+                self._history.append((now, self._version))
+                self._rendered = {}
+            self._checked_at = now
+
+    def _live(self):
+        """Open incidents newest first, and ambulance id -> track colour in that order."""
+        live = sorted((d for d in self._docs.values() if not d.get('removed')),
+                      key=lambda d: d.get('created_at') or '', reverse=True)
+        colors = {}
+        for d in live:
+            amb = d.get('assigned_ambulance')
+            if amb and amb['id'] not in colors:
+                colors[amb['id']] = TRACK_COLORS[len(colors) % len(TRACK_COLORS)]
+        return live, colors
+
+    @staticmethod
+    def _row(d, colors):
+        amb = d.get('assigned_ambulance')
+        return {
+            'id': str(d['_id']),
+            'location': d.get('location'),
+            'status': d.get('status'),
+            'created_at': d.get('created_at'),
+            'assigned_ambulance_id': d.get('assigned_ambulance_id'),
+            'assigned_ambulance': amb,
+            'track': d.get('track', []),
+            'track_color': colors.get(amb['id']) if amb else None,
+            'selected_hospital': d.get('selected_hospital'),
+        }
+
+    def _payload(self, since, settled):
+        live, colors = self._live()
+        if since is None or since < self._floor:
+            out = [self._row(d, colors) for d in live]
+            return {'requests': out, 'count': len(out), 'version': settled, 'full': True}
+        changed = [self._row(d, colors) for d in live if d.get('version', 0) > since]
+        removed = [k for k, d in self._docs.items() if d.get('removed') and d.get('version', 0) > since]
+        return {
+            'requests': changed, 'count': len(live), 'removed': removed,
+            'colors': colors, 'version': settled, 'full': False,
+        }
+
+    def open_incidents(self, db):
+        """(version, dashboard rows of every open incident), refreshed like render()."""
+        self.refresh(db)
+        with self._lock:
+            live, colors = self._live()
+            return self._version, [self._row(d, colors) for d in live]
+
+    def render(self, db, since, dumps):
+        """Encoded dashboard body (full, or changes after `since`); cached until the next change."""
+        self.refresh(db)
+        with self._lock:
+            settled = self._settled(time.monotonic())
+            key = (since if since is None or since >= self._floor else None, self._version, settled)
+            body = self._rendered.get(key)
+            if body is None:
+                if len(self._rendered) >= 64:
+                    self._rendered = {}
+                body = self._rendered[key] = dumps(self._payload(key[0], settled))
+            self.served += 1
+            return body
+
+    def reset(self):
+        with self._lock:
+            self._loaded_at = self._checked_at = 0.0
+
+    def stats(self):
+        return {
+            'incidents': sum(1 for d in self._docs.values() if not d.get('removed')),
+            'version': self._version,
+            'floor': self._floor,
+            'full_loads': self.full_loads,
+            'delta_loads': self.delta_loads,
+            'served': self.served,
+            'update_errors': self.update_errors,
+        }
+
+
+live_incidents = LiveIncidentSnapshot()
+metrics.register('live_incidents', live_incidents.stats)
@@ -1,60 +1,58 @@
-from datetime import datetime, timedelta
-import random
+from datetime import timedelta
+import hashlib
+import hmac
+import secrets
+from config import Config
 from utils.time_utils import get_ist_now_naive
 
 class OTPModel:
+    """
+    One live OTP per (role, phone): the document _id is '<role>:<phone>', so issuing a code
+    replaces the previous one in a single upsert. Only an HMAC of the code is stored, and
+    verification is one find_one_and_delete matching the hash and the expiry.
+    """
     @staticmethod
     def generate_otp():
         """Generate a 6-digit OTP"""
-        return str(random.randint(100000, 999999))
-    
+        return str(secrets.randbelow(900000) + 100000)
+
+    @staticmethod
+    def _key(phone, role):
+        return f"{role}:{phone}"
+
+    @staticmethod
+    def _hash(phone, otp, role):
+        secret = (Config.OTP_HASH_KEY or Config.JWT_SECRET_KEY).encode()
+        return hmac.new(secret, f"{role}:{phone}:{otp}".encode(), hashlib.sha256).hexdigest()
+
     @staticmethod
     def create_otp(db, phone, otp, expiry_minutes=5, role='user'):
-        """Create OTP document with expiry. role: 'user' or 'ambulance'."""
+        """Create OTP document with expiry (replacing any earlier code). role: 'user' or 'ambulance'."""
         now = get_ist_now_naive()
-        expires_at = now + timedelta(minutes=expiry_minutes)
-        otp_doc = {
+        key = OTPModel._key(phone, role)
+        db.otps.replace_one({'_id': key}, {
             'phone': phone,
-            'otp': otp,
             'role': role,
+            'otp_hash': OTPModel._hash(phone, otp, role),
             'created_at': now,
-            'expires_at': expires_at,
-            'verified': False
-        }
-        db.otps.delete_many({'phone': phone, 'role': role})
-        result = db.otps.insert_one(otp_doc)
-        return result.inserted_id
+            'expires_at': now + timedelta(minutes=expiry_minutes),
+        }, upsert=True)
+        return key
 
     @staticmethod
     def verify_otp(db, phone, otp, role='user'):
-        """Verify OTP for given role (user or ambulance)."""
-        otp_doc = db.otps.find_one({
-            'phone': phone,
-            'otp': otp,
-            'role': role,
-            'verified': False
-        })
-        
-        if not otp_doc:
-            return False
-        
-        # Check if OTP has expired
-        if get_ist_now_naive() > otp_doc['expires_at']:
-            db.otps.delete_one({'_id': otp_doc['_id']})
-            return False
-        
-        # Mark as verified
-        db.otps.update_one(
-            {'_id': otp_doc['_id']},
-            {'$set': {'verified': True}}
-        )
-        
-        # Delete the OTP after verification
-        db.otps.delete_one({'_id': otp_doc['_id']})
-        
-        return True
-    
+        """Verify and consume the OTP for given role (user or ambulance) in one round trip."""
+        otp_doc = db.otps.find_one_and_delete({
+            '_id': OTPModel._key(phone, role),
+            'otp_hash': OTPModel._hash(phone, str(otp), role),
+            'expires_at': {'$gt': get_ist_now_naive()},
+        }, projection={'_id': 1})
+        return otp_doc is not None
+
     @staticmethod
     def cleanup_expired_otps(db):
-        """Remove expired OTPs"""
-        db.otps.delete_many({'expires_at': {'$lt': get_ist_now_naive()}})
+        """Remove expired OTPs (and plaintext codes stored before hashing)"""
+        db.otps.delete_many({'$or': [
+            {'expires_at': {'$lt': get_ist_now_naive()}},
+            {'otp_hash': {'$exists': False}},
+        ]})
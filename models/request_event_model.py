@@ -0,0 +1,220 @@
+"""
+Request lifecycle events and response-time rollups.
+
+RequestModel records every transition (created, offered, offer_declined, offers_expired,
+assigned, reassigned, unassigned, to_hospital, completed, fake, sla_breached) in
+db.request_events. Transitions that end an interval also add that interval to
+db.response_rollups. There is one rollup document per
+(granularity, period start, area, ambulance type). Each metric in it carries a count, a
+sum, min, max and a fixed log-spaced histogram, so percentiles for any window are read from
+at most periods x groups documents, whatever the history size:
+
+  assign     created -> first assignment
+  reassign   unassigned (ambulance reported an issue) -> next assignment
+  scene      assigned -> to_hospital (patient picked up)
+  hospital   to_hospital -> completed
+  total      created -> completed
+  ack        offer sent -> accepted (DISPATCH_MODE=offer)
+
+area is the geohash (ROLLUP_AREA_PRECISION) of the request location and the ambulance type
+is the assigned ambulance's (else the requested type). Every event also
+updates the '*' rows (all areas / all types), so unfiltered queries read one row per period.
+"""
+import bisect
+from datetime import timedelta
+
+from pymongo import UpdateOne
+
+from config import Config
+from utils import geohash, metrics
+from utils.time_utils import get_ist_now_naive
+
+METRICS = ('assign', 'reassign', 'scene', 'hospital', 'total', 'ack')
+GRANULARITIES = ('hour', 'day')
+ALL = '*'
+# Histogram bucket upper bounds in seconds (field 'hist'): 0.25 s .. ~6 h, 25% apart
+BUCKET_BOUNDS = [round(0.25 * 1.25 ** i, 2) for i in range(14)] + [round(5 * 1.25 ** i, 1) for i in range(33)]
+
+_stats = {'events': 0, 'errors': 0}
+
+
+def period_start(at, granularity):
+    if granularity == 'hour':
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _area(req):
+    loc = req.get('location') or {}
+    if loc.get('lat') is None or loc.get('lng') is None:
+        return 'unknown'
+    return geohash.encode(float(loc['lat']), float(loc['lng']), Config.ROLLUP_AREA_PRECISION)
+
+
+def _bucket(seconds):
+    return min(bisect.bisect_left(BUCKET_BOUNDS, seconds), len(BUCKET_BOUNDS))
+
+
+def percentile(buckets, count, q, lowest, highest):
+    """
+    Approximate q-quantile from a histogram ({bucket index: count}); linear within a bucket,
+    clamped to the observed min/max.
+    """
+    if not count:
+        return None
+    target = q * count
+    seen = 0
+    value = highest
+    for i in range(len(BUCKET_BOUNDS) + 1):
+        n = buckets.get(str(i), 0)
+        if n and seen + n >= target:
+            lo = BUCKET_BOUNDS[i - 1] if i > 0 else 0.0
+            hi = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else BUCKET_BOUNDS[-1] * 2
+            value = lo + (hi - lo) * (target - seen) / n
+            break
+        seen += n
+    return round(min(max(value, lowest), highest), 1)
+
+
+class RequestEventModel:
+    @staticmethod
+    def record(db, req, event, durations=None, at=None):
+        """
+        Log `event` for request `req` (post-transition document) and roll up `durations`
+        ({metric: seconds}). Never raises: analytics must not fail a dispatch write.
+        """
+        if not req:
+            return
+        try:
+            at = at or get_ist_now_naive()
+            area = _area(req)
+            amb_type = req.get('assigned_ambulance_type') or req.get('requested_ambulance_type') or 'any'
+            durations = {k: max(v, 0.0) for k, v in (durations or {}).items() if v is not None}
+            db.request_events.insert_one({
+                'request_id': req['_id'],
+                'event': event,
+                'at': at,
+                'ambulance_id': req.get('assigned_ambulance_id'),
+                'area': area,
+                'ambulance_type': amb_type,
+                'source': req.get('source'),
+                'durations': durations,
+            })
+            _stats['events'] += 1
+            if durations:
+                db.response_rollups.bulk_write(
+                    RequestEventModel._rollup_ops(at, area, amb_type, durations), ordered=False
+                )
+        except Exception as e:
+            _stats['errors'] += 1
+            print(f"Request event {event} not recorded: {e}")
+
+    @staticmethod
+    def _rollup_ops(at, area, amb_type, durations):
+        inc = {}
+        for name, seconds in durations.items():
+            inc[f"{name}.count"] = 1
+            inc[f"{name}.sum"] = seconds
+            inc[f"{name}.hist.{_bucket(seconds)}"] = 1
+        low = {f"{name}.min": seconds for name, seconds in durations.items()}
+        high = {f"{name}.max": seconds for name, seconds in durations.items()}
+        ops = []
+        for granularity in GRANULARITIES:
+            start = period_start(at, granularity)
+            for a, t in {(area, amb_type), (area, ALL), (ALL, amb_type), (ALL, ALL)}:
+                ops.append(UpdateOne(
+                    {'granularity': granularity, 'period': start, 'area': a, 'ambulance_type': t},
+                    {'$inc': inc, '$min': low, '$max': high},
+                    upsert=True
+                ))
+        return ops
+
+    @staticmethod
+    def get_for_request(db, request_id):
+        return list(db.request_events.find({'request_id': request_id}).sort('at', 1))
+
+    @staticmethod
+    def summary(db, start, end, granularity='hour', area=ALL, ambulance_type=ALL, group_by=None, series=False):
+        """
+        Merged response-time stats for periods in [start, end). group_by 'area' or
+        'ambulance_type' breaks the totals down by that dimension (the other one fixed).
+        """
+        query = {'granularity': granularity, 'period': {'$gte': period_start(start, granularity), '$lt': end}}
+        if group_by == 'area':
+            query.update(area={'$ne': ALL}, ambulance_type=ambulance_type)
+        elif group_by == 'ambulance_type':
+            query.update(area=area, ambulance_type={'$ne': ALL})
+        else:
+            query.update(area=area, ambulance_type=ambulance_type)
+
+        groups = {}
+        periods = {}
+        for row in db.response_rollups.find(query).sort('period', 1):
+            key = row[group_by] if group_by else ALL
+            _merge(groups.setdefault(key, {}), row)
+            if series and not group_by:
+                periods[row['period'].isoformat()] = _finish({}, row)
+        out = {
+            'granularity': granularity,
+            'from': period_start(start, granularity).isoformat(),
+            'to': end.isoformat(),
+            'area': area,
+            'ambulance_type': ambulance_type,
+        }
+        if group_by:
+            out['group_by'] = group_by
+            out['groups'] = {k: _finish(v) for k, v in sorted(groups.items())}
+        else:
+            out['metrics'] = _finish(groups.get(ALL, {}))
+            if series:
+                out['series'] = periods
+        return out
+
+    @staticmethod
+    def ensure_indexes(db):
+        db.request_events.create_index([('request_id', 1), ('at', 1)])
+        db.response_rollups.create_index(
+            [('granularity', 1), ('area', 1), ('ambulance_type', 1), ('period', 1)], unique=True
+        )
+        if Config.REQUEST_EVENT_RETENTION_DAYS > 0:
+            db.request_events.create_index('at', expireAfterSeconds=int(
+                timedelta(days=Config.REQUEST_EVENT_RETENTION_DAYS).total_seconds()
+            ))
+
+
+def _merge(acc, row):
+    for name in METRICS:
+        m = row.get(name)
+        if not m:
+            continue
+        a = acc.setdefault(name, {'count': 0, 'sum': 0.0, 'hist': {}, 'min': m['min'], 'max': m['max']})
+        a['count'] += m['count']
+        a['sum'] += m['sum']
+        for b, n in m['hist'].items():
+            a['hist'][b] = a['hist'].get(b, 0) + n
+        a['min'] = min(a['min'], m['min'])
+        a['max'] = max(a['max'], m['max'])
+    return acc
+
+
+def _finish(acc, row=None):
+    if row is not None:
+        acc = _merge(acc, row)
+    out = {}
+    for name in METRICS:
+        m = acc.get(name)
+        if not m or not m['count']:
+            continue
+        out[name] = {
+            'count': m['count'],
+            'mean_seconds': round(m['sum'] / m['count'], 1),
+            'min_seconds': round(m['min'], 1),
+            'max_seconds': round(m['max'], 1),
+            'p50_seconds': percentile(m['hist'], m['count'], 0.5, m['min'], m['max']),
+            'p90_seconds': percentile(m['hist'], m['count'], 0.9, m['min'], m['max']),
+            'p95_seconds': percentile(m['hist'], m['count'], 0.95, m['min'], m['max']),
+        }
+    return out
+
+
+metrics.register('request_events', lambda: dict(_stats))
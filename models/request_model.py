@@ -1,7 +1,26 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ReturnDocument
 from utils.time_utils import get_ist_now_naive
-from utils.distance import haversine_distance
+from config import Config
+from utils.distance import haversine_distance, rerank_by_drive_time
+from utils.db import dispatch_collection
+from utils.region import near_filter, region_of
+from models.live_incident_model import LiveIncidentModel, safe_update
+from models.request_event_model import RequestEventModel
+
+# Finished requests (and their tracks) moved out of the hot collections by ops/archive.py
+ARCHIVE_SUFFIX = '_archive'
+
+
+def find_with_archive(db, name, query, sort_field, direction, include_archive=False):
+    """find(query).sort() on the hot collection, plus its archive collection when asked."""
+    docs = list(db[name].find(query).sort(sort_field, direction))
+    if include_archive:
+        docs += list(db[name + ARCHIVE_SUFFIX].find(query).sort(sort_field, direction))
+        docs.sort(key=lambda d: d.get(sort_field) or datetime.min, reverse=direction < 0)
+    return docs
+
 
 class RequestModel:
     @staticmethod
@@ -16,40 +35,59 @@ class RequestModel:
             'selected_hospital': None,
             'requested_ambulance_type': requested_ambulance_type or 'any',  # any, basic_life, advance_life, icu_life
             'source': source,
+            'region': region_of(lat, lng),  # shard key prefix (utils/region.py)
             'created_at': get_ist_now_naive()
         }
-        result = db.requests.insert_one(request)
+        result = dispatch_collection(db).insert_one(request)
+        safe_update(LiveIncidentModel.request_changed, db, request)
+        RequestEventModel.record(db, request, 'created', at=request['created_at'])
         return result.inserted_id
 
+    @staticmethod
+    def _seconds(start, end):
+        return (end - start).total_seconds() if start and end else None
+
     @staticmethod
     def find_by_id(db, request_id):
         return db.requests.find_one({'_id': ObjectId(request_id)})
 
     @staticmethod
-    def assign_ambulance(db, request_id, ambulance_id, send_notification=True):
+    def assign_ambulance(db, request_id, ambulance_id, send_notification=True, require_pending=False):
         """
         Assign ambulance to request. If send_notification=True, sends SMS to ambulance driver.
-        Returns (request_doc, should_play_alarm) tuple.
+        require_pending=True only assigns a request that is still pending (None otherwise).
+        Returns the updated request document.
         """
         from models.ambulance_model import AmbulanceModel
+        from models.user_model import UserModel
         from utils.twilio_sms import send_sms, normalize_phone
         
         now = get_ist_now_naive()
-        db.requests.update_one(
-            {'_id': ObjectId(request_id)},
+        if not AmbulanceModel.claim(db, ambulance_id, request_id):
+            return None  # a concurrent dispatch took this ambulance
+        ambulance = AmbulanceModel.find_by_id(db, ambulance_id)
+        query = {'_id': ObjectId(request_id)}
+        if require_pending:
+            query['status'] = 'pending'
+        req = dispatch_collection(db).find_one_and_update(
+            query,
             {'$set': {
                 'assigned_ambulance_id': ObjectId(ambulance_id),
+                'assigned_ambulance_type': (ambulance or {}).get('ambulance_type'),
                 'status': 'assigned',
                 'assigned_at': now
-            }}
+            }, '$inc': {'assignment_count': 1}},
+            return_document=ReturnDocument.AFTER
         )
-        req = db.requests.find_one({'_id': ObjectId(request_id)})
+        if req is None:
+            AmbulanceModel.release(db, request_id)
+            return None
+        RequestModel._after_assign(db, req, now)
         
         # Send SMS notification to ambulance driver
         if send_notification:
-            ambulance = AmbulanceModel.find_by_id(db, ambulance_id)
             if ambulance and ambulance.get('phone'):
-                user = db.users.find_one({'_id': req['user_id']})
+                user = UserModel.find_by_id(db, req['user_id'])
                 user_name = user.get('name', 'User') if user else 'User'
                 location = req.get('location', {})
                 lat = location.get('lat', 0)
@@ -60,62 +98,299 @@ class RequestModel:
         
         return req
 
+    @staticmethod
+    def _after_assign(db, req, now, durations=None):
+        safe_update(LiveIncidentModel.request_changed, db, req)
+        durations = dict(durations or {})
+        if req.get('assignment_count', 1) > 1:
+            durations['reassign'] = RequestModel._seconds(req.get('unassigned_at'), now)
+            RequestEventModel.record(db, req, 'reassigned', durations, at=now)
+        else:
+            durations['assign'] = RequestModel._seconds(req.get('created_at'), now)
+            RequestEventModel.record(db, req, 'assigned', durations, at=now)
+
+    # --- offer dispatch (Config.DISPATCH_MODE == 'offer', see services/dispatch.py) ---
+
+    @staticmethod
+    def offer(db, request_id, ambulances, timeout_seconds, send_notification=True):
+        """
+        Offer a pending request to each of `ambulances` until now + timeout_seconds. The first
+        accept_offer() wins. Returns the updated request, or None if it is no longer pending.
+        """
+        from utils.twilio_sms import send_sms, normalize_phone
+        now = get_ist_now_naive()
+        expires_at = now + timedelta(seconds=timeout_seconds)
+        offers = [{
+            'ambulance_id': amb['_id'],
+            'status': 'pending',
+            'offered_at': now,
+            'expires_at': expires_at,
+        } for amb in ambulances]
+        req = dispatch_collection(db).find_one_and_update(
+            {'_id': ObjectId(request_id), 'status': 'pending'},
+            {'$push': {'offers': {'$each': offers}}, '$max': {'offer_expires_at': expires_at}},
+            return_document=ReturnDocument.AFTER
+        )
+        if req is None:
+            return None
+        RequestEventModel.record(db, req, 'offered', at=now)
+        if send_notification:
+            location = req.get('location', {})
+            message = (f"🚨 NEW EMERGENCY OFFER at {location.get('lat', 0):.4f}, {location.get('lng', 0):.4f}. "
+                       f"Accept in the app within {int(timeout_seconds)} s.")
+            for amb in ambulances:
+                if amb.get('phone'):
+                    send_sms(normalize_phone(amb['phone']), message)
+        return req
+
+    @staticmethod
+    def get_offers_for_ambulance(db, ambulance_id):
+        """Pending requests with an open (unexpired, unanswered) offer to this ambulance."""
+        return list(db.requests.find({
+            'status': 'pending',
+            'offers': {'$elemMatch': {
+                'ambulance_id': ObjectId(ambulance_id),
+                'status': 'pending',
+                'expires_at': {'$gt': get_ist_now_naive()},
+            }},
+        }).sort('created_at', 1))
+
+    @staticmethod
+    def accept_offer(db, request_id, ambulance_id):
+        """
+        Atomic claim: assigns the request to this ambulance only if it is still pending and the
+        ambulance holds an open offer. Other open offers are cancelled. Returns the request or None.
+        """
+        from models.ambulance_model import AmbulanceModel
+        now = get_ist_now_naive()
+        if not AmbulanceModel.claim(db, ambulance_id, request_id):
+            return None
+        ambulance = AmbulanceModel.find_by_id(db, ambulance_id)
+        req = dispatch_collection(db).find_one_and_update(
+            {
+                '_id': ObjectId(request_id),
+                'status': 'pending',
+                'offers': {'$elemMatch': {
+                    'ambulance_id': ObjectId(ambulance_id), 'status': 'pending', 'expires_at': {'$gt': now},
+                }},
+            },
+            {'$set': {
+                'assigned_ambulance_id': ObjectId(ambulance_id),
+                'assigned_ambulance_type': (ambulance or {}).get('ambulance_type'),
+                'status': 'assigned',
+                'assigned_at': now,
+                'offers.$.status': 'accepted',
+                'offers.$.responded_at': now,
+            }, '$unset': {'offer_expires_at': ''}, '$inc': {'assignment_count': 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if req is None:
+            AmbulanceModel.release(db, request_id)
+            return None
+        # Only the winner gets here, so rewriting the array cannot lose a concurrent answer
+        offers = [dict(o, status='cancelled') if o['status'] == 'pending' else o for o in req['offers']]
+        dispatch_collection(db).update_one(
+            {'_id': req['_id'], 'assigned_ambulance_id': ObjectId(ambulance_id)},
+            {'$set': {'offers': offers}}
+        )
+        req['offers'] = offers
+        accepted = next((o for o in offers if o['ambulance_id'] == ObjectId(ambulance_id) and o['status'] == 'accepted'), {})
+        RequestModel._after_assign(db, req, now, {'ack': RequestModel._seconds(accepted.get('offered_at'), now)})
+        return req
+
+    @staticmethod
+    def decline_offer(db, request_id, ambulance_id):
+        """Record a decline; when no open offer is left the request falls back right away."""
+        now = get_ist_now_naive()
+        req = dispatch_collection(db).find_one_and_update(
+            {
+                '_id': ObjectId(request_id),
+                'status': 'pending',
+                'offers': {'$elemMatch': {'ambulance_id': ObjectId(ambulance_id), 'status': 'pending'}},
+            },
+            {'$set': {'offers.$.status': 'declined', 'offers.$.responded_at': now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if req is None:
+            return None
+        RequestEventModel.record(db, req, 'offer_declined', at=now)
+        if not any(o['status'] == 'pending' for o in req.get('offers') or []):
+            # Expire the round now; the escalation scheduler re-offers on its next tick
+            dispatch_collection(db).update_one(
+                {'_id': req['_id'], 'status': 'pending', 'offer_expires_at': req.get('offer_expires_at')},
+                {'$set': {'offer_expires_at': now}}
+            )
+        return req
+
+    @staticmethod
+    def expire_offers(db, request_id, offer_expires_at):
+        """Close a timed-out round (open offers -> expired). False if the request moved on meanwhile."""
+        req = db.requests.find_one({'_id': ObjectId(request_id), 'status': 'pending', 'offer_expires_at': offer_expires_at})
+        if req is None:
+            return False
+        offers = [dict(o, status='expired') if o['status'] == 'pending' else o for o in req.get('offers') or []]
+        res = dispatch_collection(db).update_one(
+            {'_id': req['_id'], 'status': 'pending', 'offer_expires_at': offer_expires_at},
+            {'$set': {'offers': offers}, '$unset': {'offer_expires_at': ''}}
+        )
+        if res.modified_count:
+            RequestEventModel.record(db, req, 'offers_expired')
+        return bool(res.modified_count)
+
+    @staticmethod
+    def _transition(db, request_id, fields, first_set=None):
+        """
+        $set fields (and first_set only where not already set); returns (status before,
+        document after) from one findAndModify.
+        """
+        update = {'$set': fields}
+        if first_set:
+            update['$min'] = first_set
+        before = dispatch_collection(db).find_one_and_update(
+            {'_id': ObjectId(request_id)},
+            update,
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return None, None
+        after = dict(before, **fields)
+        for key, value in (first_set or {}).items():
+            after[key] = before.get(key) or value
+        return before.get('status'), after
+
+    @staticmethod
+    def _release_ambulance(db, request_id, previous='assigned'):
+        """The request left 'assigned': its ambulance can be dispatched again (AmbulanceModel.claim)."""
+        from models.ambulance_model import AmbulanceModel
+        if previous == 'assigned':
+            AmbulanceModel.release(db, request_id)
+
     @staticmethod
     def complete_request(db, request_id):
-        db.requests.update_one(
+        now = get_ist_now_naive()
+        previous, req = RequestModel._transition(db, request_id, {'status': 'completed', 'completed_at': now})
+        RequestModel._release_ambulance(db, request_id, previous)
+        safe_update(LiveIncidentModel.request_changed, db, req)
+        if req and previous != 'completed':
+            RequestEventModel.record(db, req, 'completed', {
+                'hospital': RequestModel._seconds(req.get('to_hospital_at'), now),
+                'total': RequestModel._seconds(req.get('created_at'), now),
+            }, at=now)
+        return req
+
+    @staticmethod
+    def unassign(db, request_id):
+        """Back to pending with no ambulance (the assigned one reported an issue)."""
+        req = dispatch_collection(db).find_one_and_update(
             {'_id': ObjectId(request_id)},
-            {'$set': {'status': 'completed'}}
+            {'$set': {
+                'assigned_ambulance_id': None,
+                'status': 'pending',
+                'assigned_at': None,
+                'unassigned_at': get_ist_now_naive(),
+                'offers': []
+            }, '$unset': {'escalation': '', 'offer_expires_at': ''}},  # a new wait: escalation and offers start over
+            return_document=ReturnDocument.AFTER
         )
-        return db.requests.find_one({'_id': ObjectId(request_id)})
+        RequestModel._release_ambulance(db, request_id)
+        safe_update(LiveIncidentModel.request_changed, db, req)
+        RequestEventModel.record(db, req, 'unassigned', at=req['unassigned_at'] if req else None)
+        return req
 
     @staticmethod
     def mark_as_fake(db, request_id):
         """Mark request as fake and return the request."""
-        db.requests.update_one(
+        req = dispatch_collection(db).find_one_and_update(
             {'_id': ObjectId(request_id)},
-            {'$set': {'status': 'fake', 'is_fake': True}}
+            {'$set': {'status': 'fake', 'is_fake': True}},
+            return_document=ReturnDocument.AFTER
         )
-        return db.requests.find_one({'_id': ObjectId(request_id)})
+        RequestModel._release_ambulance(db, request_id)
+        safe_update(LiveIncidentModel.request_changed, db, req)
+        RequestEventModel.record(db, req, 'fake')
+        return req
 
     @staticmethod
     def select_hospital(db, request_id, hospital):
-        db.requests.update_one(
-            {'_id': ObjectId(request_id)},
-            {'$set': {'selected_hospital': hospital, 'status': 'to_hospital'}}
+        now = get_ist_now_naive()
+        previous, req = RequestModel._transition(
+            db, request_id, {'selected_hospital': hospital, 'status': 'to_hospital'}, {'to_hospital_at': now}
         )
-        return db.requests.find_one({'_id': ObjectId(request_id)})
+        RequestModel._release_ambulance(db, request_id, previous)
+        safe_update(LiveIncidentModel.request_changed, db, req)
+        if req and previous != 'to_hospital':
+            RequestEventModel.record(db, req, 'to_hospital', {
+                'scene': RequestModel._seconds(req.get('assigned_at'), now)
+            }, at=now)
+        return req
 
     @staticmethod
-    def get_by_user(db, user_id, statuses=None):
+    def get_by_user(db, user_id, statuses=None, include_archive=False):
         """Get requests for a user. statuses: e.g. ['pending','assigned'] or None for all."""
         q = {'user_id': ObjectId(user_id)}
         if statuses:
             q['status'] = {'$in': statuses}
-        return list(db.requests.find(q).sort('created_at', -1))
+        return find_with_archive(db, 'requests', q, 'created_at', -1, include_archive)
 
     @staticmethod
-    def get_active_for_user(db, user_id):
-        """Get user's most recent non-completed request (pending, assigned, or to_hospital)."""
-        reqs = list(db.requests.find({
+    def _active_for_user_filter(user_id):
+        return {
             'user_id': ObjectId(user_id),
             'status': {'$in': ['pending', 'assigned', 'to_hospital']}
-        }).sort('created_at', -1).limit(1))
+        }
+
+    @staticmethod
+    def _active_for_ambulance_filter(ambulance_id):
+        return {
+            'assigned_ambulance_id': ObjectId(ambulance_id),
+            'status': {'$in': ['assigned', 'to_hospital']}
+        }
+
+    @staticmethod
+    def get_active_for_user(db, user_id):
+        """Get user's most recent non-completed request (pending, assigned, or to_hospital)."""
+        reqs = list(db.requests.find(
+            RequestModel._active_for_user_filter(user_id)
+        ).sort('created_at', -1).limit(1))
         return reqs[0] if reqs else None
 
     @staticmethod
-    def get_by_ambulance(db, ambulance_id):
-        return list(db.requests.find({
+    def get_by_ambulance(db, ambulance_id, include_archive=False):
+        """Requests assigned to the ambulance, newest first (archived ones only when asked)."""
+        return find_with_archive(db, 'requests', {
             'assigned_ambulance_id': ObjectId(ambulance_id)
-        }).sort('created_at', -1))
+        }, 'created_at', -1, include_archive)
 
     @staticmethod
-    def get_all_requests(db):
-        return list(db.requests.find().sort('created_at', -1))
+    def get_all_requests(db, include_archive=False):
+        return find_with_archive(db, 'requests', {}, 'created_at', -1, include_archive)
 
     @staticmethod
     def get_pending_requests(db):
         return list(db.requests.find({'status': 'pending'}).sort('created_at', -1))
 
+    @staticmethod
+    def _pending_candidates(db, query, amb_type, amb_loc):
+        """(distance km, request) for pending requests this ambulance type may serve."""
+        candidates = []
+        for req in db.requests.find(query).sort('created_at', 1):
+            # Check if ambulance type matches (or if request is 'any')
+            req_type = req.get('requested_ambulance_type', 'any')
+            if req_type != 'any' and amb_type != req_type and amb_type != 'any':
+                continue  # Type mismatch, skip
+
+            loc = (req.get('location') or {})
+            if loc.get('lat') is None or loc.get('lng') is None:
+                continue
+            d = haversine_distance(
+                float(amb_loc['lat']),
+                float(amb_loc['lng']),
+                float(loc['lat']),
+                float(loc['lng']),
+            )
+            candidates.append((d, req))
+        return candidates
+
     @staticmethod
     def assign_nearest_pending_to_ambulance(db, ambulance):
         """
@@ -130,52 +405,55 @@ class RequestModel:
             return None
 
         amb_type = ambulance.get('ambulance_type', 'any')
-        pending_cursor = db.requests.find({'status': 'pending'}).sort('created_at', 1)
-
-        nearest_req = None
-        nearest_dist = None
+        regional = near_filter(amb_loc['lat'], amb_loc['lng'])
+        candidates = RequestModel._pending_candidates(db, dict({'status': 'pending'}, **regional), amb_type, amb_loc)
+        if not candidates and regional:
+            # Nothing pending in the regions around the ambulance; look everywhere
+            candidates = RequestModel._pending_candidates(db, {'status': 'pending'}, amb_type, amb_loc)
 
-        for req in pending_cursor:
-            # Check if ambulance type matches (or if request is 'any')
-            req_type = req.get('requested_ambulance_type', 'any')
-            if req_type != 'any' and amb_type != req_type and amb_type != 'any':
-                continue  # Type mismatch, skip
-            
-            loc = (req.get('location') or {})
-            if loc.get('lat') is None or loc.get('lng') is None:
-                continue
-            d = haversine_distance(
-                float(amb_loc['lat']),
-                float(amb_loc['lng']),
-                float(loc['lat']),
-                float(loc['lng']),
+        if not candidates:
+            return None
+        candidates.sort(key=lambda x: x[0])
+        if Config.DISPATCH_USE_ROAD_ETA:
+            candidates = rerank_by_drive_time(
+                candidates, float(amb_loc['lat']), float(amb_loc['lng']),
+                lambda r: (float(r['location']['lat']), float(r['location']['lng'])), outbound=True,
             )
-            if nearest_dist is None or d < nearest_dist:
-                nearest_dist = d
-                nearest_req = req
-
-        if not nearest_req:
+        if Config.DISPATCH_MODE == 'offer':
+            # Offer the nearest request this ambulance has not been offered yet; nothing is assigned
+            for _d, req in candidates:
+                if all(o['ambulance_id'] != ambulance['_id'] for o in req.get('offers') or []):
+                    RequestModel.offer(db, str(req['_id']), [ambulance], Config.DISPATCH_OFFER_TIMEOUT_SECONDS)
+                    break
             return None
+        nearest_req = candidates[0][1]
 
-        assigned = RequestModel.assign_ambulance(db, str(nearest_req['_id']), str(ambulance['_id']), send_notification=True)
+        assigned = RequestModel.assign_ambulance(
+            db, str(nearest_req['_id']), str(ambulance['_id']), send_notification=True, require_pending=True
+        )
         return assigned
 
 
 class LocationTrackModel:
     """Track ambulance location during an assigned request (for dashboard map)."""
     @staticmethod
-    def add(db, request_id, ambulance_id, lat, lng):
-        doc = {
+    def _doc(request_id, ambulance_id, lat, lng):
+        return {
             'request_id': ObjectId(request_id),
             'ambulance_id': ObjectId(ambulance_id),
             'lat': float(lat),
             'lng': float(lng),
             'created_at': get_ist_now_naive()
         }
+
+    @staticmethod
+    def add(db, request_id, ambulance_id, lat, lng):
+        doc = LocationTrackModel._doc(request_id, ambulance_id, lat, lng)
         db.location_tracks.insert_one(doc)
+        safe_update(LiveIncidentModel.track_point, db, request_id, ambulance_id, lat, lng, doc['created_at'])
 
     @staticmethod
-    def get_track_for_request(db, request_id):
-        return list(db.location_tracks.find(
-            {'request_id': ObjectId(request_id)}
-        ).sort('created_at', 1))
+    def get_track_for_request(db, request_id, include_archive=False):
+        return find_with_archive(
+            db, 'location_tracks', {'request_id': ObjectId(request_id)}, 'created_at', 1, include_archive
+        )
@@ -17,9 +17,9 @@ def _parse_ts(ts):
 
 class SensorReadingModel:
     @staticmethod
-    def add(db, user_id, lat, lng, speed_kmh=None, accel_x=None, accel_y=None, accel_z=None,
-            gyro_x=None, gyro_y=None, gyro_z=None):
-        doc = {
+    def _doc(user_id, lat, lng, speed_kmh=None, accel_x=None, accel_y=None, accel_z=None,
+             gyro_x=None, gyro_y=None, gyro_z=None):
+        return {
             'user_id': ObjectId(user_id),
             'lat': float(lat) if lat is not None else None,
             'lng': float(lng) if lng is not None else None,
@@ -32,9 +32,20 @@ class SensorReadingModel:
             'gyro_z': float(gyro_z) if gyro_z is not None else None,
             'timestamp': get_ist_now_naive(),
         }
+
+    @staticmethod
+    def add(db, user_id, lat, lng, speed_kmh=None, accel_x=None, accel_y=None, accel_z=None,
+            gyro_x=None, gyro_y=None, gyro_z=None):
+        doc = SensorReadingModel._doc(user_id, lat, lng, speed_kmh, accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z)
         db.sensor_readings.insert_one(doc)
         return doc
 
+    @staticmethod
+    def latest_id(db, user_id):
+        """_id of the user's newest reading, or None."""
+        doc = db.sensor_readings.find_one({'user_id': ObjectId(user_id)}, {'_id': 1}, sort=[('timestamp', -1)])
+        return doc['_id'] if doc else None
+
     @staticmethod
     def get_recent_for_user(db, user_id, limit=100):
         """Get recent readings for detection window."""
@@ -1,6 +1,9 @@
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
 from utils.time_utils import get_ist_now_naive
+from utils.cache import profile_cache
+from utils.blacklist import blacklist
 
 class UserModel:
     @staticmethod
@@ -29,7 +32,10 @@ class UserModel:
 
     @staticmethod
     def find_by_id(db, user_id):
-        return db.users.find_one({'_id': ObjectId(user_id)})
+        """Cached for a few seconds (utils.cache.profile_cache); writes below invalidate it."""
+        return profile_cache.get_or_load(
+            db, 'user', user_id, lambda: db.users.find_one({'_id': ObjectId(user_id)})
+        )
 
     @staticmethod
     def update_profile(db, user_id, update_data):
@@ -37,46 +43,68 @@ class UserModel:
         if 'name' in update_data and 'date_of_birth' in update_data and 'gender' in update_data:
             if update_data.get('name') and update_data.get('date_of_birth') and update_data.get('gender'):
                 update_data['profile_completed'] = True
-        db.users.update_one(
+        updated = db.users.find_one_and_update(
             {'_id': ObjectId(user_id)},
-            {'$set': update_data}
+            {'$set': update_data},
+            return_document=ReturnDocument.AFTER
         )
-        return db.users.find_one({'_id': ObjectId(user_id)})
+        UserModel._cache_after_write(db, user_id, updated)
+        return updated
+
+    @staticmethod
+    def _location_update(lat, lng):
+        return {'$set': {
+            'location': {'lat': float(lat), 'lng': float(lng)},
+            'location_updated_at': get_ist_now_naive()
+        }}
 
     @staticmethod
     def update_location(db, user_id, lat, lng):
-        now = get_ist_now_naive()
-        db.users.update_one(
+        """Returns the updated document."""
+        updated = db.users.find_one_and_update(
             {'_id': ObjectId(user_id)},
-            {'$set': {
-                'location': {'lat': float(lat), 'lng': float(lng)},
-                'location_updated_at': now
-            }}
+            UserModel._location_update(lat, lng),
+            return_document=ReturnDocument.AFTER
         )
-        return db.users.find_one({'_id': ObjectId(user_id)})
+        UserModel._cache_after_write(db, user_id, updated)
+        return updated
+
+    @staticmethod
+    def set_location(db, user_id, lat, lng):
+        """Write-only update_location for callers that discard the document."""
+        result = db.users.update_one({'_id': ObjectId(user_id)}, UserModel._location_update(lat, lng))
+        profile_cache.invalidate(db, 'user', user_id)
+        return result.matched_count > 0
 
     @staticmethod
     def add_demerit_point(db, user_id):
-        """Add 1 demerit point. If >= 2, blacklist the user."""
-        user = db.users.find_one({'_id': ObjectId(user_id)})
-        if not user:
-            return None
-        current_points = user.get('demerit_points', 0)
-        new_points = current_points + 1
-        is_blacklisted = new_points >= 2
-        db.users.update_one(
+        """Add 1 demerit point (atomic $inc). If >= 2, blacklist the user."""
+        user = db.users.find_one_and_update(
             {'_id': ObjectId(user_id)},
-            {'$set': {
-                'demerit_points': new_points,
-                'is_blacklisted': is_blacklisted
-            }}
+            {'$inc': {'demerit_points': 1}},
+            return_document=ReturnDocument.AFTER
         )
-        return db.users.find_one({'_id': ObjectId(user_id)})
+        if user and user.get('demerit_points', 0) >= 2 and not user.get('is_blacklisted'):
+            # Only the write that crosses the threshold needs a second round trip
+            user = db.users.find_one_and_update(
+                {'_id': ObjectId(user_id)},
+                {'$set': {'is_blacklisted': True}},
+                return_document=ReturnDocument.AFTER
+            )
+        if user and user.get('demerit_points', 0) >= 2:
+            blacklist.add(user_id)
+        UserModel._cache_after_write(db, user_id, user)
+        return user
+
+    @staticmethod
+    def _cache_after_write(db, user_id, updated):
+        """Write-through: the post-update document replaces the cached profile."""
+        if updated is not None:
+            profile_cache.put(db, 'user', updated)
+        else:
+            profile_cache.invalidate(db, 'user', user_id)
 
     @staticmethod
     def is_blacklisted(db, user_id):
-        """Check if user is blacklisted."""
-        user = db.users.find_one({'_id': ObjectId(user_id)})
-        if not user:
-            return False
-        return user.get('is_blacklisted', False) or user.get('demerit_points', 0) >= 2
+        """Check if user is blacklisted (in-memory set kept in sync with the DB, utils/blacklist.py)."""
+        return blacklist.contains(db, user_id)
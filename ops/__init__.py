@@ -0,0 +1,8 @@
+"""
+Operational jobs run from the Flask CLI (`flask --app app <command>`), outside the request path.
+
+archive.py moves finished requests and their location tracks out of the hot collections.
+bulk.py streams whole collections to and from files (export/import).
+codecs.py reads and writes the compressed document files those jobs produce.
+sharding.py sets up region shard keys and zones for multi-node deployments (shard-setup).
+"""
@@ -0,0 +1,136 @@
+"""
+Hot/cold archival of finished requests: `flask --app app archive`.
+
+Requests that are completed or fake and older than ARCHIVE_AFTER_DAYS move, together with
+their location tracks, out of `requests` / `location_tracks`. The hot collections and their
+indexes then hold only recent data and stay in RAM. Destinations (ARCHIVE_TARGET or --to):
+
+  collection  requests_archive / location_tracks_archive in the same database. The list reads
+              reach them with include_archive=True (?include_archive=true on
+              /admin/all-requests and /ambulance/my-requests).
+  ndjson      compressed files under ARCHIVE_DIR (ops/codecs.py), one pair per batch
+  parquet     the same as Parquet (needs pyarrow)
+
+Work goes in batches of ARCHIVE_BATCH_SIZE requests, oldest first. Each batch is copied
+first: bulk upserts by _id, or files written under a temporary name and renamed. Only then
+is it deleted from the hot collections, tracks before requests, and its rows in the live
+incidents view (/admin/dashboard-map) are tombstoned. A run that stops part-way
+never loses a document. The next run picks up the same oldest batch again: upserts make the
+repeated copy a no-op, and the batch's files are rewritten under the same names with the
+documents already in them kept (tracks deleted by the stopped run exist only there).
+"""
+import os
+from datetime import timedelta
+
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+
+from config import Config
+from models.live_incident_model import LiveIncidentModel, safe_update
+from models.request_model import ARCHIVE_SUFFIX
+from ops.codecs import FORMATS, open_writer, read_batches
+from utils.db import dispatch_collection
+from utils.time_utils import get_ist_now_naive
+
+FINISHED = ['completed', 'fake']
+TARGETS = ('collection',) + tuple(FORMATS)
+_WRITE_CHUNK = 1000
+
+
+def _chunks(cursor, size):
+    chunk = []
+    for doc in cursor:
+        chunk.append(doc)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def eligible_filter(cutoff):
+    return {'status': {'$in': FINISHED}, 'created_at': {'$lt': cutoff}}
+
+
+def _copy_to_collection(db, name, chunks):
+    archive = dispatch_collection(db, name + ARCHIVE_SUFFIX)
+    copied = 0
+    for chunk in chunks:
+        archive.bulk_write([ReplaceOne({'_id': d['_id']}, d, upsert=True) for d in chunk], ordered=False)
+        copied += len(chunk)
+    return copied
+
+
+def _copy_to_file(directory, name, first_id, fmt, chunks):
+    """Write the batch's file; returns the documents copied from the hot collection."""
+    path = os.path.join(directory, f"{name}-{first_id}{FORMATS[fmt]}")
+    earlier = path if os.path.exists(path) else None
+    copied = set()
+    with open_writer(path, fmt) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+            copied.update(d['_id'] for d in chunk)
+        if earlier:
+            # A stopped run wrote this file; keep what it holds that is no longer hot
+            for docs in read_batches(earlier, _WRITE_CHUNK):
+                writer.write([d for d in docs if d['_id'] not in copied])
+    return len(copied)
+
+
+def archive_batch(db, cutoff, batch_size, target, directory=None):
+    """Move one batch; returns (requests moved, tracks moved), (0, 0) when nothing is left."""
+    reqs = list(db.requests.find(eligible_filter(cutoff)).sort('created_at', ASCENDING).limit(batch_size))
+    if not reqs:
+        return 0, 0
+    ids = [r['_id'] for r in reqs]
+    track_chunks = _chunks(
+        db.location_tracks.find({'request_id': {'$in': ids}}).sort('_id', ASCENDING), _WRITE_CHUNK
+    )
+    if target == 'collection':
+        tracks = _copy_to_collection(db, 'location_tracks', track_chunks)
+        _copy_to_collection(db, 'requests', [reqs])
+    else:
+        tracks = _copy_to_file(directory, 'location_tracks', ids[0], target, track_chunks)
+        _copy_to_file(directory, 'requests', ids[0], target, [reqs])
+
+    # Copies are complete; only now drop the hot documents (status re-checked)
+    dispatch_collection(db, 'location_tracks').delete_many({'request_id': {'$in': ids}})
+    moved = dispatch_collection(db).delete_many({'_id': {'$in': ids}, 'status': {'$in': FINISHED}}).deleted_count
+    # Fake requests are never tombstoned by the live view; archived ones must leave it too
+    kept = set(db.requests.distinct('_id', {'_id': {'$in': ids}}))   # reopened since the read
+    gone = [i for i in ids if i not in kept]
+    safe_update(LiveIncidentModel.requests_removed, db, gone)
+    return moved, tracks
+
+
+def archive_finished(db, older_than_days=None, batch_size=None, target=None, directory=None,
+                     max_batches=None, progress=None):
+    """Archive every eligible request (or max_batches batches). Returns totals."""
+    older_than_days = Config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+    target = target or Config.ARCHIVE_TARGET
+    directory = directory or Config.ARCHIVE_DIR
+    if target not in TARGETS:
+        raise ValueError(f"Unknown archive target '{target}' (one of {', '.join(TARGETS)})")
+    if target != 'collection':
+        os.makedirs(directory, exist_ok=True)
+    cutoff = get_ist_now_naive() - timedelta(days=older_than_days)
+    totals = {'requests': 0, 'location_tracks': 0, 'batches': 0}
+    while max_batches is None or totals['batches'] < max_batches:
+        moved, tracks = archive_batch(db, cutoff, batch_size, target, directory)
+        if not moved and not tracks:
+            break
+        totals['requests'] += moved
+        totals['location_tracks'] += tracks
+        totals['batches'] += 1
+        if progress:
+            progress(totals)
+    return totals
+
+
+def ensure_indexes(db):
+    # Batch selection on the hot set; the archive read paths used with include_archive
+    db.requests.create_index([('status', ASCENDING), ('created_at', ASCENDING)])
+    db['requests' + ARCHIVE_SUFFIX].create_index([('assigned_ambulance_id', ASCENDING), ('created_at', DESCENDING)])
+    db['requests' + ARCHIVE_SUFFIX].create_index([('user_id', ASCENDING), ('created_at', DESCENDING)])
+    db['requests' + ARCHIVE_SUFFIX].create_index([('created_at', DESCENDING)])
+    db['location_tracks' + ARCHIVE_SUFFIX].create_index([('request_id', ASCENDING), ('created_at', ASCENDING)])
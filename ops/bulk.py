@@ -0,0 +1,162 @@
+"""
+Bulk export/import of any collection: `flask --app app export` / `flask --app app import`.
+
+Export splits the collection into --parts ranges of `_id`. The split points are quantiles
+of a $sample of _ids (SPLIT_SAMPLES_PER_PART per range, sorted by the server). Without
+--query the sample is a random cursor, so finding them costs the same whatever the
+collection size; ranges come out about equal, not exact. Each range is
+streamed by its own thread through a cursor in BULK_BATCH_SIZE batches into one compressed
+file (ops/codecs.py): <dir>/<collection>-<part>.ndjson.gz or .parquet. A manifest.json next to
+the files records the collection, the filter, the ranges and the document counts. Memory
+stays at a few batches per thread whatever the collection size.
+
+Import streams every file of an export directory (or a single file) back in batches:
+insert_many(ordered=False), skipping documents whose _id already exists, so an interrupted
+import can be run again. With --upsert, documents replace existing ones by _id instead.
+Files are imported in parallel, one thread each.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from config import Config
+from ops.codecs import FORMATS, decode, encode, format_of, open_writer, read_batches
+
+MANIFEST = 'manifest.json'
+SPLIT_SAMPLES_PER_PART = 100
+_DUPLICATE_KEY = 11000
+
+
+def split_points(coll, parts, query=None):
+    """_id values that cut the (filtered) collection into `parts` ranges of about equal size."""
+    if parts <= 1:
+        return []
+    pipeline = [{'$match': query}] if query else []
+    pipeline += [
+        {'$sample': {'size': parts * SPLIT_SAMPLES_PER_PART}},
+        {'$project': {'_id': 1}},
+        {'$sort': {'_id': ASCENDING}},   # BSON order, also for mixed _id types
+    ]
+    ids = [d['_id'] for d in coll.aggregate(pipeline, allowDiskUse=True)]
+    if len(ids) < parts:
+        return []
+    points = []
+    for k in range(1, parts):
+        _id = ids[len(ids) * k // parts]
+        if not points or _id != points[-1]:   # $sample may return a document twice
+            points.append(_id)
+    return points
+
+
+def _range_query(query, lo, hi):
+    bounds = {}
+    if lo is not None:
+        bounds['$gte'] = lo
+    if hi is not None:
+        bounds['$lt'] = hi
+    if not bounds:
+        return dict(query)
+    return {'$and': [query, {'_id': bounds}]} if query else {'_id': bounds}
+
+
+def _export_range(coll, query, lo, hi, path, fmt, batch_size):
+    cursor = coll.find(_range_query(query, lo, hi), batch_size=batch_size).sort('_id', ASCENDING)
+    with open_writer(path, fmt) as writer:
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                writer.write(batch)
+                batch = []
+        writer.write(batch)
+    return writer.count
+
+
+def export_collection(db, name, directory, fmt='ndjson', parts=None, query=None, batch_size=None):
+    """Export collection `name` into directory; returns the manifest written there."""
+    parts = parts or Config.BULK_WORKERS
+    batch_size = batch_size or Config.BULK_BATCH_SIZE
+    query = query or {}
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}' (one of {', '.join(FORMATS)})")
+    os.makedirs(directory, exist_ok=True)
+    coll = db[name]
+    points = split_points(coll, parts, query)
+    ranges = list(zip([None] + points, points + [None]))
+    paths = [os.path.join(directory, f"{name}-{i:03d}{FORMATS[fmt]}") for i in range(len(ranges))]
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        counts = list(pool.map(
+            lambda job: _export_range(coll, query, job[0][0], job[0][1], job[1], fmt, batch_size),
+            zip(ranges, paths),
+        ))
+    manifest = {
+        'collection': name,
+        'format': fmt,
+        'query': json.loads(encode(query)),
+        'documents': sum(counts),
+        'files': [
+            {'file': os.path.basename(path), 'documents': count,
+             'from_id': json.loads(encode({'_id': lo}))['_id'], 'to_id': json.loads(encode({'_id': hi}))['_id']}
+            for path, count, (lo, hi) in zip(paths, counts, ranges)
+        ],
+    }
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _insert(coll, docs, upsert):
+    """Write one batch; returns documents written (existing _ids are skipped unless upsert)."""
+    if upsert:
+        result = coll.bulk_write([ReplaceOne({'_id': d['_id']}, d, upsert=True) for d in docs], ordered=False)
+        return result.upserted_count + result.modified_count
+    try:
+        return len(coll.insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        if any(err.get('code') != _DUPLICATE_KEY for err in e.details.get('writeErrors', [])):
+            raise
+        return e.details.get('nInserted', 0)
+
+
+def _import_file(coll, path, batch_size, upsert):
+    written = 0
+    for docs in read_batches(path, batch_size):
+        written += _insert(coll, docs, upsert)
+    return written
+
+
+def export_files(source):
+    """(collection name or None, file paths) for an export directory or a single file."""
+    if os.path.isdir(source):
+        manifest_path = os.path.join(source, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            return manifest['collection'], [os.path.join(source, entry['file']) for entry in manifest['files']]
+        paths = sorted(os.path.join(source, n) for n in os.listdir(source) if n.endswith(tuple(FORMATS.values())))
+        return None, paths
+    format_of(source)
+    return None, [source]
+
+
+def import_collection(db, source, name=None, upsert=False, batch_size=None):
+    """Import an export directory (or one file) into collection `name` (default: the manifest's)."""
+    batch_size = batch_size or Config.BULK_BATCH_SIZE
+    exported_name, paths = export_files(source)
+    name = name or exported_name
+    if not name:
+        raise ValueError('Collection name required (no manifest.json in the source)')
+    if not paths:
+        raise ValueError(f'No export files in {source}')
+    coll = db[name]
+    with ThreadPoolExecutor(max_workers=min(len(paths), Config.BULK_WORKERS)) as pool:
+        written = sum(pool.map(lambda path: _import_file(coll, path, batch_size, upsert), paths))
+    return {'collection': name, 'files': len(paths), 'documents': written}
+
+
+def parse_query(text):
+    """--query: a filter in MongoDB extended JSON, e.g. '{"created_at": {"$gte": {"$date": "2026-01-01T00:00:00Z"}}}'."""
+    return decode(text) if text else {}
@@ -0,0 +1,139 @@
+"""
+Compressed document files for archives and exports.
+
+  ndjson   gzip, one MongoDB extended-JSON document per line (bson.json_util, relaxed mode),
+           so ObjectIds and dates come back as they went in
+  parquet  needs pyarrow (not in requirements.txt). One row per document: `_id` as a string
+           and `doc` with the same extended JSON, one row group per written batch.
+           Heterogeneous documents do not fit a fixed columnar schema, so this keeps them
+           whole; DuckDB/pandas can still filter on `_id` and parse `doc`.
+
+Writers write to '<path>.part' and rename on close, so a file that exists is complete.
+"""
+import gzip
+import os
+
+from bson import json_util
+
+FORMATS = {'ndjson': '.ndjson.gz', 'parquet': '.parquet'}
+_JSON_OPTIONS = json_util.JSONOptions(json_mode=json_util.JSONMode.RELAXED)
+
+
+def encode(doc):
+    return json_util.dumps(doc, json_options=_JSON_OPTIONS)
+
+
+def decode(text):
+    return json_util.loads(text, json_options=_JSON_OPTIONS)
+
+
+def format_of(path):
+    for fmt, suffix in FORMATS.items():
+        if path.endswith(suffix):
+            return fmt
+    raise ValueError(f'Unknown file format: {path} (expected {", ".join(FORMATS.values())})')
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Parquet files need pyarrow (pip install pyarrow)')
+    return pyarrow, pyarrow.parquet
+
+
+class _Writer:
+    def __init__(self, path):
+        self.path = path
+        self.part = path + '.part'
+        self.count = 0
+
+    def write(self, docs):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def close(self):
+        self._close()
+        os.replace(self.part, self.path)
+
+    def abort(self):
+        self._close()
+        if os.path.exists(self.part):
+            os.remove(self.part)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class NDJSONWriter(_Writer):
+    def __init__(self, path, compresslevel=6):
+        super().__init__(path)
+        self._file = gzip.open(self.part, 'wt', encoding='utf-8', compresslevel=compresslevel)
+
+    def write(self, docs):
+        self._file.write(''.join(encode(d) + '\n' for d in docs))
+        self.count += len(docs)
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetWriter(_Writer):
+    def __init__(self, path):
+        super().__init__(path)
+        pa, pq = _pyarrow()
+        self._pa = pa
+        self._schema = pa.schema([('_id', pa.string()), ('doc', pa.string())])
+        self._writer = pq.ParquetWriter(self.part, self._schema, compression='zstd')
+
+    def write(self, docs):
+        if not docs:
+            return
+        table = self._pa.Table.from_arrays([
+            self._pa.array([str(d.get('_id')) for d in docs], self._pa.string()),
+            self._pa.array([encode(d) for d in docs], self._pa.string()),
+        ], schema=self._schema)
+        self._writer.write_table(table)
+        self.count += len(docs)
+
+    def _close(self):
+        self._writer.close()
+
+
+def open_writer(path, fmt=None):
+    """Writer for path; fmt defaults to the one the file suffix names."""
+    fmt = fmt or format_of(path)
+    if fmt == 'parquet':
+        return ParquetWriter(path)
+    if fmt == 'ndjson':
+        return NDJSONWriter(path)
+    raise ValueError(f'Unknown format: {fmt}')
+
+
+def read_batches(path, batch_size=1000):
+    """Yield lists of up to batch_size documents from a file written above (constant memory)."""
+    fmt = format_of(path)
+    if fmt == 'parquet':
+        _, pq = _pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size, columns=['doc']):
+            yield [decode(text) for text in batch.column(0).to_pylist()]
+        return
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                batch.append(decode(line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,97 @@
+"""
+Region sharding for multi-node deployments: `flask --app app shard-setup`.
+
+Shard keys (run against a mongos):
+
+  requests         {region: 1, _id: 1}. region is the geohash prefix of the request
+                   location (utils/region.py) and is fixed at creation, so a document
+                   never moves between shards.
+  location_tracks  {request_id: 'hashed'}
+  sensor_readings  {user_id: 'hashed'}
+  request_events   {request_id: 'hashed'}
+
+Every other collection stays unsharded on the database's primary shard. They are either
+small (ambulances, users, counters, leases) or short-lived behind TTL indexes. Ambulances
+carry a region as well, indexed with their status, so the dispatch candidate read is one
+index range. Their region changes as they drive, so it is not a shard key.
+
+Zones (--zones zones.json) pin region prefixes to shards so neighbouring regions share a
+shard and a dispatch query over the regions around a point goes to that shard alone:
+
+  {"west": {"shards": ["rs-west"], "prefixes": ["te", "tg"]},
+   "north": {"shards": ["rs-north"], "prefixes": ["tt", "tu"]}}
+
+Request writes by _id alone (status transitions) go to every shard until they find the
+document. findAndModify without the shard key needs MongoDB 7.1 or later.
+
+--backfill sets region on requests and ambulances written before the field existed.
+"""
+from pymongo import ASCENDING, UpdateOne
+from bson.min_key import MinKey
+
+from utils.region import region_of
+
+SHARD_KEYS = {
+    'requests': {'region': 1, '_id': 1},
+    'location_tracks': {'request_id': 'hashed'},
+    'sensor_readings': {'user_id': 'hashed'},
+    'request_events': {'request_id': 'hashed'},
+}
+_LOCATION_FIELDS = {'requests': 'location', 'ambulances': 'current_location'}
+# Sorts after every geohash character, so [prefix, prefix + '~') covers all regions under prefix
+_PREFIX_END = '~'
+
+
+def ensure_indexes(db):
+    db.requests.create_index([('region', ASCENDING), ('_id', ASCENDING)])
+    db.requests.create_index([('region', ASCENDING), ('status', ASCENDING), ('created_at', ASCENDING)])
+    db.ambulances.create_index([('region', ASCENDING), ('status', ASCENDING)])
+
+
+def backfill_regions(db, batch_size=1000):
+    """Set region on documents that have a location but no region; returns counts per collection."""
+    counts = {}
+    for name, field in _LOCATION_FIELDS.items():
+        counts[name] = 0
+        cursor = db[name].find({'region': {'$exists': False}, f'{field}.lat': {'$ne': None}}, {field: 1},
+                               batch_size=batch_size)
+        ops = []
+        for doc in cursor:
+            loc = doc.get(field) or {}
+            if loc.get('lat') is None or loc.get('lng') is None:
+                continue
+            ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'region': region_of(loc['lat'], loc['lng'])}}))
+            if len(ops) >= batch_size:
+                counts[name] += db[name].bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            counts[name] += db[name].bulk_write(ops, ordered=False).modified_count
+    return counts
+
+
+def shard_collections(db):
+    """enableSharding plus shardCollection for SHARD_KEYS (idempotent; needs a mongos)."""
+    admin = db.client.admin
+    admin.command('enableSharding', db.name)
+    ensure_indexes(db)
+    for name, key in SHARD_KEYS.items():
+        if 'hashed' in key.values():
+            db[name].create_index(list(key.items()))
+        admin.command('shardCollection', f'{db.name}.{name}', key=key)
+    return list(SHARD_KEYS)
+
+
+def apply_zones(db, zones):
+    """zones: {zone: {'shards': [...], 'prefixes': [...]}} -> zone ranges on requests.region."""
+    admin = db.client.admin
+    ns = f'{db.name}.requests'
+    for zone, spec in zones.items():
+        for shard in spec.get('shards', []):
+            admin.command('addShardToZone', shard, zone=zone)
+        for prefix in spec.get('prefixes', []):
+            admin.command(
+                'updateZoneKeyRange', ns,
+                min={'region': prefix, '_id': MinKey()},
+                max={'region': prefix + _PREFIX_END, '_id': MinKey()},
+                zone=zone,
+            )
@@ -0,0 +1,148 @@
+"""
+Concurrent-connection load test for the hot endpoints, to compare serving modes.
+
+Each concurrency level opens N keep-alive connections that loop on one request for
+--duration seconds; a level "holds" if errors stay under 1% and p95 under --p95-ms.
+With --sse the N connections instead hold /stream/updates open while one probe
+client measures /user/my-request latency next to them.
+
+Before/after on one worker each (same DB, same token):
+  gunicorn app:app --workers 1 --bind 127.0.0.1:8001
+  uvicorn asgi:app --workers 1 --port 8002
+  python perf/async_loadtest.py --url http://127.0.0.1:8001 --token $USER_JWT --label sync
+  python perf/async_loadtest.py --url http://127.0.0.1:8002 --token $USER_JWT --label asgi
+  python perf/async_loadtest.py --url http://127.0.0.1:8002 --token $USER_JWT --sse --label asgi-sse
+
+Stdlib only (asyncio streams, HTTP/1.1), so it runs anywhere the app does.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from http_client import Connection, percentile as _percentile
+
+
+async def _client(target, method, path, headers, body, stop_at, latencies, errors):
+    conn = Connection(*target)
+    while time.monotonic() < stop_at:
+        started = time.monotonic()
+        try:
+            status, _body = await asyncio.wait_for(conn.request(method, path, headers, body), timeout=30)
+            if status >= 500:
+                errors.append(status)
+            else:
+                latencies.append((time.monotonic() - started) * 1000)
+        except Exception as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            await asyncio.sleep(0.05)
+    conn.close()
+
+
+def _summary(level, duration, latencies, errors, p95_limit):
+    total = len(latencies) + len(errors)
+    p95 = _percentile(latencies, 0.95)
+    error_rate = len(errors) / total if total else 1.0
+    return {
+        'connections': level,
+        'requests': total,
+        'rps': round(total / duration, 1),
+        'p50_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'p95_ms': round(p95, 1) if p95 is not None else None,
+        'p99_ms': round(_percentile(latencies, 0.99), 1) if latencies else None,
+        'error_rate': round(error_rate, 4),
+        'holds': error_rate < 0.01 and p95 is not None and p95 <= p95_limit,
+    }
+
+
+async def run_level(target, level, args, headers, body):
+    latencies, errors = [], []
+    stop_at = time.monotonic() + args.duration
+    await asyncio.gather(*(
+        _client(target, args.method, args.path, headers, body, stop_at, latencies, errors) for _ in range(level)
+    ))
+    return _summary(level, args.duration, latencies, errors, args.p95_ms)
+
+
+async def _hold_stream(target, token, stop_at, state):
+    try:
+        reader, writer = await asyncio.open_connection(*target)
+        writer.write((f"GET /stream/updates?role=user&token={token} HTTP/1.1\r\nHost: {target[0]}\r\n"
+                      "Accept: text/event-stream\r\n\r\n").encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout=30)
+        if b' 200 ' not in status_line:
+            state['failed'] += 1
+            writer.close()
+            return
+        state['open'] += 1
+        while time.monotonic() < stop_at:
+            if not await asyncio.wait_for(reader.readline(), timeout=max(stop_at - time.monotonic(), 0.1)):
+                break
+    except asyncio.TimeoutError:
+        pass
+    except Exception:
+        state['failed'] += 1
+        return
+    writer.close()
+
+
+async def run_sse_level(target, level, args, headers):
+    state = {'open': 0, 'failed': 0}
+    stop_at = time.monotonic() + args.duration
+    holders = [asyncio.create_task(_hold_stream(target, args.token, stop_at, state)) for _ in range(level)]
+    latencies, errors = [], []
+    await _client(target, 'GET', '/user/my-request', headers, b'', stop_at, latencies, errors)
+    await asyncio.gather(*holders, return_exceptions=True)
+    out = _summary(level, args.duration, latencies, errors, args.p95_ms)
+    out.update(streams_open=state['open'], streams_failed=state['failed'])
+    out['holds'] = out['holds'] and state['failed'] == 0
+    return out
+
+
+async def main_async(args):
+    parts = urlsplit(args.url)
+    target = (parts.hostname, parts.port or 80)
+    headers = {'Authorization': f"Bearer {args.token}", 'Content-Type': 'application/json'}
+    body = args.body.encode() if args.body else b''
+    results = []
+    for level in [int(x) for x in args.levels.split(',')]:
+        if args.sse:
+            result = await run_sse_level(target, level, args, headers)
+        else:
+            result = await run_level(target, level, args, headers, body)
+        results.append(result)
+        print(json.dumps(result))
+        if not result['holds'] and not args.keep_going:
+            break
+    capacity = max((r['connections'] for r in results if r['holds']), default=0)
+    print(f"[{args.label}] capacity: {capacity} concurrent connections "
+          f"(p95 <= {args.p95_ms} ms, errors < 1%)")
+    if args.out:
+        with open(args.out, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'label': args.label, 'path': args.path, 'sse': args.sse,
+                                'capacity': capacity, 'levels': results}) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--token', required=True, help="access token for the endpoint's role")
+    parser.add_argument('--path', default='/user/my-request')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--body', default='', help="JSON body, e.g. for /sensor/submit")
+    parser.add_argument('--levels', default='1,5,10,25,50,100,200,400')
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per level")
+    parser.add_argument('--p95-ms', type=float, default=500.0)
+    parser.add_argument('--sse', action='store_true', help="hold N /stream/updates streams, probe /user/my-request")
+    parser.add_argument('--keep-going', action='store_true', help="run every level even after one fails")
+    parser.add_argument('--label', default='run')
+    parser.add_argument('--out', help="append a JSON line with all levels to this file")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
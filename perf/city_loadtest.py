@@ -0,0 +1,385 @@
+"""
+City simulation load test: users streaming sensors, ambulances moving and polling,
+emergencies at a fixed rate and admins watching the dashboard, all at once.
+
+Start the API against a scratch database with the fake SMS backend and DB op counting
+(one worker, so /admin/metrics sees every request):
+
+  export MONGO_URI=mongodb://localhost:27017/emergodb_loadtest
+  SMS_BACKEND=fake DB_OP_COUNTING=true gunicorn app:app --workers 1 --threads 8 --bind 127.0.0.1:8000
+
+Then run a scenario and save or compare a baseline:
+
+  python perf/city_loadtest.py --users 200 --ambulances 40 --duration 120 --save perf/baselines/city-200.json
+  python perf/city_loadtest.py --users 200 --ambulances 40 --duration 120 --compare perf/baselines/city-200.json
+
+Users and ambulances are seeded directly into MONGO_URI (tagged and removed afterwards),
+and tokens are minted with JWT_SECRET_KEY, so no OTP round trips are needed.
+Reported per endpoint: requests/s, p50/p95/p99 latency, errors and MongoDB commands per request.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from http_client import Connection, percentile  # noqa: E402
+
+CITY_CENTER = (18.5204, 73.8567)   # Pune
+CITY_RADIUS_DEG = 0.08             # ~9 km
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, label, ms, status):
+        if status is None or status >= 500:
+            self.errors[label] = self.errors.get(label, 0) + 1
+        else:
+            self.latencies.setdefault(label, []).append(ms)
+
+
+async def call(conn, rec, label, method, path, token, body=None):
+    payload = json.dumps(body).encode() if body is not None else b''
+    headers = {'Authorization': f"Bearer {token}", 'Content-Type': 'application/json'}
+    started = time.monotonic()
+    try:
+        status, raw = await asyncio.wait_for(conn.request(method, path, headers, payload), timeout=30)
+    except Exception:
+        conn.close()
+        rec.record(label, None, None)
+        return None, None
+    rec.record(label, (time.monotonic() - started) * 1000, status)
+    try:
+        return status, json.loads(raw) if raw else None
+    except ValueError:
+        return status, None
+
+
+def _random_point(rng):
+    return (CITY_CENTER[0] + rng.uniform(-CITY_RADIUS_DEG, CITY_RADIUS_DEG),
+            CITY_CENTER[1] + rng.uniform(-CITY_RADIUS_DEG, CITY_RADIUS_DEG))
+
+
+async def _every(interval, stop_at, rng):
+    """Sleep a jittered interval; False once the run is over."""
+    await asyncio.sleep(interval * rng.uniform(0.8, 1.2))
+    return time.monotonic() < stop_at
+
+
+async def user_actor(target, rec, user, args, state, stop_at, rng):
+    conn = Connection(*target)
+    lat, lng = _random_point(rng)
+    await asyncio.sleep(rng.uniform(0, 1 / args.sensor_hz))
+    while time.monotonic() < stop_at:
+        lat += rng.uniform(-0.0002, 0.0002)
+        lng += rng.uniform(-0.0002, 0.0002)
+        await call(conn, rec, 'POST /sensor/submit', 'POST', '/sensor/submit', user['token'], {
+            'lat': lat, 'lng': lng, 'speed_kmh': rng.uniform(15, 45),
+            'accel_x': rng.gauss(0, 0.4), 'accel_y': rng.gauss(0, 0.4), 'accel_z': 9.81 + rng.gauss(0, 0.3),
+            'gyro_x': rng.gauss(0, 2), 'gyro_y': rng.gauss(0, 2), 'gyro_z': rng.gauss(0, 2),
+        })
+        if user['id'] in state['active_users']:
+            await call(conn, rec, 'GET /user/my-request', 'GET', '/user/my-request', user['token'])
+        if not await _every(1 / args.sensor_hz, stop_at, rng):
+            break
+    conn.close()
+
+
+async def emergency_generator(target, rec, users, args, state, stop_at, rng):
+    conn = Connection(*target)
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(rng.expovariate(args.emergencies_per_min / 60))
+        if time.monotonic() >= stop_at:
+            break
+        idle = [u for u in users if u['id'] not in state['active_users']]
+        if not idle:
+            continue
+        user = rng.choice(idle)
+        lat, lng = _random_point(rng)
+        if rng.random() < args.auto_share:
+            status, _ = await call(conn, rec, 'POST /sensor/submit (crash)', 'POST', '/sensor/submit', user['token'], {
+                'lat': lat, 'lng': lng, 'speed_kmh': 0, 'shake_stop_detected': True,
+                'accel_x': 25.0, 'accel_y': 3.0, 'accel_z': 9.81, 'gyro_x': 60, 'gyro_y': 10, 'gyro_z': 5,
+            })
+        else:
+            status, _ = await call(conn, rec, 'POST /user/request-emergency', 'POST', '/user/request-emergency',
+                                   user['token'], {'lat': lat, 'lng': lng})
+        if status == 201:
+            state['active_users'].add(user['id'])
+            state['emergencies'] += 1
+    conn.close()
+
+
+async def ambulance_actor(target, rec, amb, args, state, stop_at, rng):
+    conn = Connection(*target)
+    lat, lng = amb['location']
+    next_poll = time.monotonic()
+    assigned_since = {}
+    while time.monotonic() < stop_at:
+        lat += rng.uniform(-0.0003, 0.0003)
+        lng += rng.uniform(-0.0003, 0.0003)
+        await call(conn, rec, 'POST /ambulance/update-location', 'POST', '/ambulance/update-location',
+                   amb['token'], {'lat': lat, 'lng': lng})
+        if time.monotonic() >= next_poll:
+            next_poll = time.monotonic() + args.poll_seconds
+            status, body = await call(conn, rec, 'GET /ambulance/assigned-details', 'GET',
+                                      '/ambulance/assigned-details', amb['token'])
+            assigned = (body or {}).get('assigned') if status == 200 else None
+            if assigned:
+                request_id = assigned['request_id']
+                since = assigned_since.setdefault(request_id, time.monotonic())
+                if time.monotonic() - since >= args.service_seconds:
+                    status, body = await call(conn, rec, 'PUT /ambulance/complete-request/<id>', 'PUT',
+                                              f"/ambulance/complete-request/{request_id}", amb['token'],
+                                              {'lat': lat, 'lng': lng})
+                    if status == 200:
+                        state['completed'] += 1
+                        state['active_users'].discard((body or {}).get('request', {}).get('user_id'))
+                        assigned_since.pop(request_id, None)
+        if not await _every(1 / args.location_hz, stop_at, rng):
+            break
+    conn.close()
+
+
+async def admin_actor(target, rec, token, args, stop_at, rng):
+    conn = Connection(*target)
+    await asyncio.sleep(rng.uniform(0, args.admin_poll_seconds))
+    while time.monotonic() < stop_at:
+        await call(conn, rec, 'GET /admin/dashboard-map', 'GET', '/admin/dashboard-map', token)
+        if not await _every(args.admin_poll_seconds, stop_at, rng):
+            break
+    conn.close()
+
+
+async def fetch_metrics(target, token):
+    conn = Connection(*target)
+    try:
+        status, raw = await conn.request('GET', '/admin/metrics', {'Authorization': f"Bearer {token}"})
+        return json.loads(raw) if status == 200 else {}
+    except Exception:
+        return {}
+    finally:
+        conn.close()
+
+
+# --- seeding -----------------------------------------------------------------
+
+def seed(db, args, run_tag, rng):
+    from models.user_model import UserModel
+    from models.ambulance_model import AmbulanceModel
+    from utils.time_utils import get_ist_now_naive
+    users, ambulances = [], []
+    for i in range(args.users):
+        uid = UserModel.create_user(db, f"+9190{run_tag % 100000:05d}{i:05d}", name=f"Load User {i}")
+        db.users.update_one({'_id': uid}, {'$set': {
+            'accident_detection_enabled': True, 'profile_completed': True, 'loadtest_run': run_tag,
+        }})
+        users.append({'id': str(uid)})
+    for i in range(args.ambulances):
+        aid = AmbulanceModel.create_ambulance(db, f"+9180{run_tag % 100000:05d}{i:05d}", name=f"Load Amb {i}")
+        location = _random_point(rng)
+        db.ambulances.update_one({'_id': aid}, {'$set': {
+            'status': 'active', 'profile_completed': True, 'loadtest_run': run_tag,
+            'current_location': {'lat': location[0], 'lng': location[1]},
+            'current_location_updated_at': get_ist_now_naive(),
+        }})
+        ambulances.append({'id': str(aid), 'location': location})
+    return users, ambulances
+
+
+def cleanup(db, run_tag):
+    user_ids = [u['_id'] for u in db.users.find({'loadtest_run': run_tag}, {'_id': 1})]
+    amb_ids = [a['_id'] for a in db.ambulances.find({'loadtest_run': run_tag}, {'_id': 1})]
+    request_ids = [r['_id'] for r in db.requests.find({'user_id': {'$in': user_ids}}, {'_id': 1})]
+    db.location_tracks.delete_many({'$or': [{'request_id': {'$in': request_ids}}, {'ambulance_id': {'$in': amb_ids}}]})
+    db.requests.delete_many({'_id': {'$in': request_ids}})
+    db.sensor_readings.delete_many({'user_id': {'$in': user_ids}})
+    db.users.delete_many({'loadtest_run': run_tag})
+    db.ambulances.delete_many({'loadtest_run': run_tag})
+
+
+def mint_tokens(users, ambulances, secret):
+    from datetime import timedelta
+    from flask import Flask
+    from flask_jwt_extended import JWTManager, create_access_token
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = secret
+    JWTManager(app)
+    with app.app_context():
+        expires = timedelta(hours=6)
+        for u in users:
+            u['token'] = create_access_token(identity=u['id'], additional_claims={'role': 'user'}, expires_delta=expires)
+        for a in ambulances:
+            a['token'] = create_access_token(identity=a['id'], additional_claims={'role': 'ambulance'}, expires_delta=expires)
+        return create_access_token(identity='admin', additional_claims={'role': 'admin'}, expires_delta=expires)
+
+
+# --- reporting ---------------------------------------------------------------
+
+# Flask endpoint names for the db_ops counters
+ENDPOINTS = {
+    'POST /sensor/submit': 'sensor.submit_readings',
+    'POST /sensor/submit (crash)': 'sensor.submit_readings',
+    'GET /user/my-request': 'user.my_request',
+    'POST /user/request-emergency': 'user.request_emergency',
+    'POST /ambulance/update-location': 'ambulance.update_location',
+    'GET /ambulance/assigned-details': 'ambulance.assigned_details',
+    'PUT /ambulance/complete-request/<id>': 'ambulance.complete_request',
+    'GET /admin/dashboard-map': 'admin.dashboard_map',
+}
+
+
+def _db_ops(before, after):
+    b, a = before.get('db_ops') or {}, after.get('db_ops') or {}
+    if a.get('enabled') is False:
+        return {}
+    out = {}
+    for endpoint, stats in a.items():
+        prev = b.get(endpoint, {'requests': 0, 'commands': 0})
+        requests = stats['requests'] - prev['requests']
+        if requests > 0:
+            out[endpoint] = round((stats['commands'] - prev['commands']) / requests, 2)
+    return out
+
+
+def build_report(rec, duration, db_ops, state, args):
+    endpoints = {}
+    for label in sorted(set(rec.latencies) | set(rec.errors)):
+        lat = rec.latencies.get(label, [])
+        errors = rec.errors.get(label, 0)
+        total = len(lat) + errors
+        endpoints[label] = {
+            'requests': total,
+            'rps': round(total / duration, 2),
+            'p50_ms': round(statistics.median(lat), 1) if lat else None,
+            'p95_ms': round(percentile(lat, 0.95), 1) if lat else None,
+            'p99_ms': round(percentile(lat, 0.99), 1) if lat else None,
+            'errors': errors,
+            'db_ops_per_request': db_ops.get(ENDPOINTS.get(label)),
+        }
+    return {
+        'scenario': {k: getattr(args, k) for k in (
+            'users', 'ambulances', 'admins', 'emergencies_per_min', 'sensor_hz', 'location_hz',
+            'poll_seconds', 'admin_poll_seconds', 'duration', 'seed')},
+        'emergencies': state['emergencies'],
+        'completed': state['completed'],
+        'endpoints': endpoints,
+    }
+
+
+def print_report(report):
+    print(f"\nemergencies created {report['emergencies']}, completed {report['completed']}")
+    print(f"{'endpoint':40s} {'req':>7s} {'rps':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'err':>5s} {'db/req':>7s}")
+    for label, s in report['endpoints'].items():
+        fmt = lambda v: f"{v:8.1f}" if v is not None else f"{'-':>8s}"  # noqa: E731
+        ops = f"{s['db_ops_per_request']:7.2f}" if s['db_ops_per_request'] is not None else f"{'-':>7s}"
+        print(f"{label:40s} {s['requests']:7d} {s['rps']:8.2f} {fmt(s['p50_ms'])} {fmt(s['p95_ms'])} "
+              f"{fmt(s['p99_ms'])} {s['errors']:5d} {ops}")
+
+
+def compare(report, baseline, tolerance):
+    """Regressions against a saved baseline: p95 beyond tolerance, more DB ops, new errors."""
+    problems = []
+    for label, base in baseline['endpoints'].items():
+        cur = report['endpoints'].get(label)
+        if not cur:
+            continue
+        if base['p95_ms'] and cur['p95_ms'] and cur['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            problems.append(f"{label}: p95 {base['p95_ms']} -> {cur['p95_ms']} ms")
+        if base['db_ops_per_request'] is not None and cur['db_ops_per_request'] is not None \
+                and cur['db_ops_per_request'] > base['db_ops_per_request'] + 0.5:
+            problems.append(f"{label}: db ops/request {base['db_ops_per_request']} -> {cur['db_ops_per_request']}")
+        base_rate = base['errors'] / base['requests'] if base['requests'] else 0
+        cur_rate = cur['errors'] / cur['requests'] if cur['requests'] else 0
+        if cur_rate > base_rate + 0.01:
+            problems.append(f"{label}: error rate {base_rate:.3f} -> {cur_rate:.3f}")
+    return problems
+
+
+async def run(args):
+    from pymongo import MongoClient
+    rng = random.Random(args.seed)
+    parts = urlsplit(args.url)
+    target = (parts.hostname, parts.port or 80)
+    client = MongoClient(args.mongo_uri)
+    db = client.get_default_database()
+    run_tag = int(time.time())
+    users, ambulances = seed(db, args, run_tag, rng)
+    admin_token = mint_tokens(users, ambulances, args.jwt_secret)
+    print(f"seeded {len(users)} users, {len(ambulances)} ambulances (run {run_tag})")
+
+    rec = Recorder()
+    state = {'active_users': set(), 'emergencies': 0, 'completed': 0}
+    try:
+        before = await fetch_metrics(target, admin_token)
+        started = time.monotonic()
+        stop_at = started + args.duration
+        tasks = [user_actor(target, rec, u, args, state, stop_at, random.Random(rng.random())) for u in users]
+        tasks += [ambulance_actor(target, rec, a, args, state, stop_at, random.Random(rng.random())) for a in ambulances]
+        tasks += [admin_actor(target, rec, admin_token, args, stop_at, random.Random(rng.random()))
+                  for _ in range(args.admins)]
+        tasks.append(emergency_generator(target, rec, users, args, state, stop_at, random.Random(rng.random())))
+        await asyncio.gather(*tasks)
+        duration = time.monotonic() - started
+        after = await fetch_metrics(target, admin_token)
+    finally:
+        if not args.keep_data:
+            cleanup(db, run_tag)
+        client.close()
+
+    report = build_report(rec, duration, _db_ops(before, after), state, args)
+    print_report(report)
+    if not (after.get('db_ops') or {}) or (after.get('db_ops') or {}).get('enabled') is False:
+        print("(db ops not reported: start the server with DB_OP_COUNTING=true)")
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        if problems:
+            sys.exit(1)
+        print(f"no regressions against {args.compare}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/emergodb_loadtest'))
+    parser.add_argument('--jwt-secret', default=os.getenv('JWT_SECRET_KEY', 'dev-secret-change-me'))
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--ambulances', type=int, default=20)
+    parser.add_argument('--admins', type=int, default=2)
+    parser.add_argument('--emergencies-per-min', type=float, default=6.0)
+    parser.add_argument('--auto-share', type=float, default=0.5, help="share of emergencies raised by crash detection")
+    parser.add_argument('--sensor-hz', type=float, default=1.0, help="sensor submits per user per second")
+    parser.add_argument('--location-hz', type=float, default=0.2, help="location updates per ambulance per second")
+    parser.add_argument('--poll-seconds', type=float, default=5.0, help="ambulance assigned-details poll interval")
+    parser.add_argument('--admin-poll-seconds', type=float, default=5.0)
+    parser.add_argument('--service-seconds', type=float, default=30.0, help="time an ambulance keeps a case")
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="write the report as a baseline JSON")
+    parser.add_argument('--compare', help="baseline JSON to check for regressions (exit 1 on regression)")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p95 growth vs baseline")
+    parser.add_argument('--keep-data', action='store_true', help="leave seeded users/ambulances/requests in the DB")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""
+Multi-node harness: a local replica set plus several API processes on one host, to check
+that nodes sharing one database stay consistent and to measure how throughput scales.
+
+Needs `mongod` on PATH (or --mongod) and gunicorn. Everything runs in a scratch directory
+that is removed at the end (unless --keep):
+
+  python perf/multinode.py --nodes 3 --members 3 --duration 20 --save perf/baselines/multinode.json
+
+Each node is `gunicorn app:app` on its own port with SHARDED_DISPATCH=true,
+RATE_LIMIT_BACKEND=mongo and the fake SMS backend, all pointed at the same replica set.
+
+Consistency checks (across nodes; a failure makes the exit status 1):
+  race          simultaneous emergencies spread over every node, more than there are
+                ambulances: no ambulance may end up on two active requests, and every
+                ambulance must be used
+  idempotency   one Idempotency-Key sent to every node at once creates exactly one request
+  read-after    a request created on one node is visible right away from every other node
+  blacklist     a user blacklisted by a direct database write (as another node would) is
+                refused by every node within BLACKLIST_SYNC_SECONDS
+
+Scaling: a closed loop of location updates and my-request polls against the first 1..N
+nodes for --duration seconds each, reporting requests/s, p95 and the scaling efficiency
+(throughput with k nodes / k x throughput with one). All nodes share one host's CPUs and
+one database, so efficiency here is a lower bound for separate machines.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from http_client import Connection, percentile  # noqa: E402
+from city_loadtest import CITY_CENTER, cleanup, mint_tokens, seed  # noqa: E402
+from ops.sharding import backfill_regions  # noqa: E402
+
+DB_NAME = 'emergodb_multinode'
+
+
+# --- processes ----------------------------------------------------------------
+
+def start_replica_set(mongod, members, base_port, workdir):
+    """Start `members` mongod processes as replica set rs0; returns (processes, uri)."""
+    from pymongo import MongoClient
+    procs = []
+    for i in range(members):
+        path = os.path.join(workdir, f'rs{i}')
+        os.makedirs(path, exist_ok=True)
+        procs.append(subprocess.Popen(
+            [mongod, '--replSet', 'rs0', '--port', str(base_port + i), '--dbpath', path,
+             '--bind_ip', '127.0.0.1', '--quiet', '--logpath', os.path.join(path, 'mongod.log')],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+    hosts = [f'127.0.0.1:{base_port + i}' for i in range(members)]
+    first = MongoClient(hosts[0], directConnection=True, serverSelectionTimeoutMS=30000)
+    first.admin.command('ping')
+    first.admin.command('replSetInitiate', {
+        '_id': 'rs0', 'members': [{'_id': i, 'host': h} for i, h in enumerate(hosts)],
+    })
+    deadline = time.monotonic() + 60
+    while not first.admin.command('hello').get('isWritablePrimary'):
+        if time.monotonic() > deadline:
+            raise RuntimeError('replica set did not elect a primary')
+        time.sleep(0.5)
+    first.close()
+    return procs, f"mongodb://{','.join(hosts)}/{DB_NAME}?replicaSet=rs0"
+
+
+def start_nodes(count, base_port, env, workers, threads):
+    procs = []
+    for i in range(count):
+        procs.append(subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', str(workers), '--threads', str(threads),
+             '--bind', f'127.0.0.1:{base_port + i}'],
+            cwd=str(ROOT), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+    return procs
+
+
+async def wait_http(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        conn = Connection('127.0.0.1', port)
+        try:
+            status, _ = await conn.request('GET', '/', {})
+            if status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f'node on port {port} did not start')
+
+
+def stop(procs):
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+# --- HTTP -----------------------------------------------------------------------
+
+async def call(port, method, path, token, body=None, headers=None):
+    conn = Connection('127.0.0.1', port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    hdrs = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json', 'Connection': 'close'}
+    hdrs.update(headers or {})
+    try:
+        status, raw = await asyncio.wait_for(conn.request(method, path, hdrs, payload), timeout=30)
+    finally:
+        conn.close()
+    try:
+        return status, json.loads(raw) if raw else None
+    except ValueError:
+        return status, None
+
+
+def _point(rng, spread=0.02):
+    return CITY_CENTER[0] + rng.uniform(-spread, spread), CITY_CENTER[1] + rng.uniform(-spread, spread)
+
+
+# --- consistency checks -----------------------------------------------------------
+
+async def check_race(db, ports, users, ambulances, rng):
+    from bson import ObjectId
+    calls = []
+    for i, user in enumerate(users):
+        lat, lng = _point(rng)
+        calls.append(call(ports[i % len(ports)], 'POST', '/user/request-emergency', user['token'],
+                          {'lat': lat, 'lng': lng}))
+    results = await asyncio.gather(*calls)
+    created = [body['request_id'] for status, body in results if status == 201]
+    reqs = list(db.requests.find({'_id': {'$in': [ObjectId(r) for r in created]}}))
+    per_ambulance = {}
+    for r in reqs:
+        if r.get('status') in ('assigned', 'to_hospital'):
+            per_ambulance.setdefault(r['assigned_ambulance_id'], []).append(r['_id'])
+    doubles = {str(a): len(rs) for a, rs in per_ambulance.items() if len(rs) > 1}
+    expected = min(len(created), len(ambulances))
+    return {
+        # Requests whose candidates were all claimed stay pending for the next location update
+        'ok': not doubles and len(created) == len(users),
+        'created': len(created), 'assigned': len(per_ambulance), 'expected_assigned': expected,
+        'double_assigned': doubles,
+    }
+
+
+async def check_idempotency(db, ports, user, rng):
+    from bson import ObjectId
+    lat, lng = _point(rng)
+    key = f'multinode-{rng.random()}'
+    results = await asyncio.gather(*(
+        call(port, 'POST', '/user/request-emergency', user['token'], {'lat': lat, 'lng': lng},
+             {'Idempotency-Key': key})
+        for port in ports
+    ))
+    ids = {body['request_id'] for status, body in results if status == 201}
+    count = db.requests.count_documents({'user_id': ObjectId(user['id'])})
+    return {'ok': count == 1 and len(ids) == 1, 'statuses': [s for s, _ in results], 'requests_created': count}
+
+
+async def check_read_after_write(ports, users, rng):
+    stale, lags = 0, []
+    for i, user in enumerate(users):
+        writer, reader = ports[i % len(ports)], ports[(i + 1) % len(ports)]
+        lat, lng = _point(rng)
+        status, body = await call(writer, 'POST', '/user/request-emergency', user['token'], {'lat': lat, 'lng': lng})
+        if status != 201:
+            continue
+        started = time.monotonic()
+        seen_first_time = True
+        while True:
+            _, mine = await call(reader, 'GET', '/user/my-request', user['token'])
+            if ((mine or {}).get('request') or {}).get('_id') == body['request_id']:
+                break
+            seen_first_time = False
+            if time.monotonic() - started > 10:
+                break
+            await asyncio.sleep(0.05)
+        if not seen_first_time:
+            stale += 1
+            lags.append(time.monotonic() - started)
+    return {'ok': stale == 0, 'checked': len(users), 'stale_reads': stale,
+            'max_lag_seconds': round(max(lags), 3) if lags else 0.0}
+
+
+async def check_blacklist(db, ports, user, sync_seconds, rng):
+    from bson import ObjectId
+    db.users.update_one({'_id': ObjectId(user['id'])}, {'$set': {'is_blacklisted': True}})
+    started = time.monotonic()
+    pending = set(ports)
+    lag = {}
+    while pending and time.monotonic() - started < sync_seconds * 3 + 5:
+        for port in list(pending):
+            lat, lng = _point(rng)
+            status, _ = await call(port, 'POST', '/user/request-emergency', user['token'], {'lat': lat, 'lng': lng})
+            if status == 403:
+                pending.discard(port)
+                lag[port] = round(time.monotonic() - started, 2)
+        await asyncio.sleep(0.25)
+    worst = max(lag.values()) if lag else None
+    return {'ok': not pending and worst <= sync_seconds + 1, 'seconds_to_refuse': lag, 'unrefused_nodes': sorted(pending)}
+
+
+# --- scaling ----------------------------------------------------------------------
+
+async def load_client(port, users, ambulances, stop_at, latencies, rng):
+    conn = Connection('127.0.0.1', port)
+    try:
+        while time.monotonic() < stop_at:
+            if rng.random() < 0.5:
+                amb = rng.choice(ambulances)
+                lat, lng = _point(rng)
+                method, path, token, body = 'POST', '/ambulance/update-location', amb['token'], {'lat': lat, 'lng': lng}
+            else:
+                method, path, token, body = 'GET', '/user/my-request', rng.choice(users)['token'], None
+            payload = json.dumps(body).encode() if body is not None else b''
+            started = time.monotonic()
+            try:
+                status, _ = await conn.request(method, path, {
+                    'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}, payload)
+            except Exception:
+                conn.close()
+                continue
+            if status < 500:
+                latencies.append((time.monotonic() - started) * 1000)
+    finally:
+        conn.close()
+
+
+async def measure_scaling(ports, users, ambulances, clients_per_node, duration, rng):
+    out = []
+    for k in range(1, len(ports) + 1):
+        latencies = []
+        stop_at = time.monotonic() + duration
+        await asyncio.gather(*(
+            load_client(ports[i % k], users, ambulances, stop_at, latencies, random.Random(rng.random()))
+            for i in range(clients_per_node * k)
+        ))
+        out.append({'nodes': k, 'rps': round(len(latencies) / duration, 1),
+                    'p95_ms': round(percentile(latencies, 0.95) or 0, 1)})
+    base = out[0]['rps'] or 1
+    for row in out:
+        row['efficiency'] = round(row['rps'] / (row['nodes'] * base), 2)
+    return out
+
+
+# --- main -----------------------------------------------------------------------
+
+async def run(args):
+    from pymongo import MongoClient
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='multinode-')
+    mongo_procs, node_procs = [], []
+    report = {}
+    try:
+        mongo_procs, uri = start_replica_set(args.mongod, args.members, args.mongo_port, workdir)
+        env = dict(os.environ, MONGO_URI=uri, JWT_SECRET_KEY=args.jwt_secret, SMS_BACKEND='fake',
+                   RATE_LIMIT_BACKEND='mongo', SHARDED_DISPATCH='true', LOAD_SHED_ENABLED='false',
+                   BLACKLIST_SYNC_SECONDS=str(args.blacklist_sync_seconds))
+        node_procs = start_nodes(args.nodes, args.port, env, args.workers, args.threads)
+        ports = [args.port + i for i in range(args.nodes)]
+        await asyncio.gather(*(wait_http(p) for p in ports))
+        print(f"replica set of {args.members} + {args.nodes} nodes up ({uri})")
+
+        client = MongoClient(uri)
+        db = client.get_default_database()
+        run_tag = int(time.time())
+        users, ambulances = seed(db, Namespace(users=args.users, ambulances=args.ambulances), run_tag, rng)
+        backfill_regions(db)  # seed() writes documents directly, without region
+        mint_tokens(users, ambulances, args.jwt_secret)
+
+        race_users, rest = users[:args.ambulances * 2], users[args.ambulances * 2:]
+        checks = {'race': await check_race(db, ports, race_users, ambulances, rng)}
+        checks['idempotency'] = await check_idempotency(db, ports, rest[0], rng)
+        checks['read_after_write'] = await check_read_after_write(ports, rest[1:1 + args.read_checks], rng)
+        checks['blacklist'] = await check_blacklist(db, ports, rest[1 + args.read_checks], args.blacklist_sync_seconds, rng)
+        for name, result in checks.items():
+            print(f"{'ok  ' if result['ok'] else 'FAIL'} {name}: {json.dumps({k: v for k, v in result.items() if k != 'ok'})}")
+
+        scaling = await measure_scaling(ports, users, ambulances, args.clients_per_node, args.duration, rng)
+        print(f"{'nodes':>5} {'req/s':>9} {'p95 ms':>8} {'efficiency':>10}")
+        for row in scaling:
+            print(f"{row['nodes']:>5} {row['rps']:>9} {row['p95_ms']:>8} {row['efficiency']:>10}")
+        report = {'checks': checks, 'scaling': scaling, 'scenario': {
+            k: getattr(args, k) for k in ('nodes', 'members', 'workers', 'threads', 'users', 'ambulances',
+                                          'clients_per_node', 'duration', 'seed')}}
+        if not args.keep:
+            cleanup(db, run_tag)
+        client.close()
+    finally:
+        stop(node_procs)
+        stop(mongo_procs)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"report saved to {args.save}")
+    if not all(result['ok'] for result in report.get('checks', {}).values()):
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongod', default='mongod')
+    parser.add_argument('--members', type=int, default=3, help="replica set members")
+    parser.add_argument('--mongo-port', type=int, default=27117)
+    parser.add_argument('--nodes', type=int, default=3, help="API processes")
+    parser.add_argument('--port', type=int, default=8100, help="first API port")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers per node")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--jwt-secret', default=os.getenv('JWT_SECRET_KEY', 'dev-secret-change-me'))
+    parser.add_argument('--users', type=int, default=120)
+    parser.add_argument('--ambulances', type=int, default=20)
+    parser.add_argument('--read-checks', type=int, default=20)
+    parser.add_argument('--blacklist-sync-seconds', type=float, default=2.0)
+    parser.add_argument('--clients-per-node', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=15.0, help="seconds per scaling step")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="write the report as JSON")
+    parser.add_argument('--keep', action='store_true', help="keep the scratch directory and seeded data")
+    args = parser.parse_args()
+    if args.users < args.ambulances * 2 + args.read_checks + 2:
+        parser.error('--users must be at least 2 x --ambulances + --read-checks + 2')
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Cold-boot benchmark: how long a fresh worker process takes to become ready.
+
+Each run starts a new interpreter (as gunicorn/uvicorn would on an autoscaled instance)
+and measures:
+  process_ms        interpreter start -> app object built (wall clock, from the parent)
+  import_ms         `import app` (or asgi) inside the child, i.e. create_app()
+  first_request_ms  first request through the test client (routing + JWT check, no DB)
+
+No database is needed: app creation must not touch the network. Warm-up is disabled
+so only the boot path is timed.
+
+  python perf/startup_benchmark.py --runs 10
+  python perf/startup_benchmark.py --target asgi --importtime 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import {module} as target
+t1 = time.perf_counter()
+flask_app = getattr(target, 'flask_app', None) or target.app
+client = flask_app.test_client()
+status = client.get('/user/me').status_code
+t2 = time.perf_counter()
+print(json.dumps({{'import_ms': (t1 - t0) * 1000, 'first_request_ms': (t2 - t1) * 1000, 'status': status,
+                   'heavy_loaded': sorted(m for m in ('numpy', 'sklearn', 'scipy', 'twilio', 'joblib') if m in sys.modules)}}))
+'''
+
+
+def _env():
+    env = dict(os.environ)
+    env['WARM_UP_ON_BOOT'] = 'false'
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+
+def run_once(module):
+    started = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', CHILD.format(module=module)], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True, check=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def import_profile(module, top):
+    """Slowest top-level packages (cumulative, so nested packages overlap) from `python -X importtime`."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        if '.' not in name and name != module:
+            rows.append((int(cumulative) / 1000, name))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def _stats(values):
+    values = sorted(values)
+    return {
+        'median': round(statistics.median(values), 1),
+        'p95': round(values[min(len(values) - 1, int(0.95 * len(values)))], 1),
+        'min': round(values[0], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['app', 'asgi'], default='app')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help="also list the N slowest imports")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    run_once(args.target)  # discard: fills the OS file cache like a second boot on the same host
+    runs = [run_once(args.target) for _ in range(args.runs)]
+    report = {
+        'target': args.target,
+        'runs': args.runs,
+        'process_ms': _stats([r['process_ms'] for r in runs]),
+        'import_ms': _stats([r['import_ms'] for r in runs]),
+        'first_request_ms': _stats([r['first_request_ms'] for r in runs]),
+        'heavy_modules_at_boot': runs[-1]['heavy_loaded'],
+    }
+    if args.importtime:
+        report['slowest_imports_ms'] = import_profile(args.target, args.importtime)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for key in ('process_ms', 'import_ms', 'first_request_ms'):
+        s = report[key]
+        print(f"{key:18s} median {s['median']:8.1f}  p95 {s['p95']:8.1f}  min {s['min']:8.1f}")
+    print(f"heavy modules loaded at boot: {', '.join(report['heavy_modules_at_boot']) or 'none'}")
+    for ms, name in report.get('slowest_imports_ms', []):
+        print(f"  {ms:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
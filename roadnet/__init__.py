@@ -0,0 +1,6 @@
+"""
+Offline road network for drive-time ETAs.
+
+graph.py builds a compact CSR drive-time graph from an OSM extract, alt.py adds
+landmark (ALT) preprocessing and A* search, and eta.py is the query API used by dispatch.
+"""
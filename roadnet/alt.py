@@ -0,0 +1,161 @@
+"""
+ALT (A*, Landmarks, Triangle inequality) preprocessing and multi-source/target search.
+
+For each landmark L we store d(L, v) and d(v, L) for every node. For any a, b:
+  d(a, b) >= max_L max(d(L, b) - d(L, a), d(a, L) - d(b, L))
+which is an admissible, consistent A* heuristic.
+"""
+import heapq
+import math
+from array import array
+
+import numpy as np
+
+UNREACHABLE = np.float32(np.inf)
+
+
+def _dijkstra_all(graph, source, reverse=False):
+    """Single-source shortest times to all nodes (scipy if available)."""
+    try:
+        from scipy.sparse.csgraph import dijkstra
+        return dijkstra(graph.to_scipy(reverse=reverse), indices=source).astype(np.float32)
+    except ImportError:
+        indptr = graph.rev_indptr if reverse else graph.indptr
+        indices = graph.rev_indices if reverse else graph.indices
+        weights = graph.rev_weights if reverse else graph.weights
+        dist = np.full(graph.n_nodes, np.inf, dtype=np.float64)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                nd = d + weights[i]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return dist.astype(np.float32)
+
+
+class Landmarks:
+    def __init__(self, nodes, d_from, d_to):
+        self.nodes = np.asarray(nodes, dtype=np.int32)
+        self.d_from = np.asarray(d_from, dtype=np.float32)  # (L, N): d(L, v)
+        self.d_to = np.asarray(d_to, dtype=np.float32)      # (L, N): d(v, L)
+
+    def arrays(self):
+        return {'lm_nodes': self.nodes, 'lm_from': self.d_from, 'lm_to': self.d_to}
+
+    @classmethod
+    def build(cls, graph, count=16, seed=0):
+        """Farthest-point landmark selection: each new landmark maximises its distance to the chosen ones."""
+        rng = np.random.default_rng(seed)
+        nodes, d_from, d_to = [], [], []
+        current = int(rng.integers(graph.n_nodes))
+        closest = np.full(graph.n_nodes, np.inf)
+        for _ in range(min(count, graph.n_nodes)):
+            nodes.append(current)
+            d_from.append(_dijkstra_all(graph, current))
+            d_to.append(_dijkstra_all(graph, current, reverse=True))
+            closest = np.minimum(closest, np.where(np.isfinite(d_from[-1]), d_from[-1], 0))
+            current = int(np.argmax(closest))
+        return cls(nodes, np.vstack(d_from), np.vstack(d_to))
+
+    def lower_bound(self, a, b):
+        """Lower bound on d(a, b) over all landmarks."""
+        forward = self.d_from[:, b] - self.d_from[:, a]
+        backward = self.d_to[:, a] - self.d_to[:, b]
+        bound = np.nanmax(np.maximum(forward, backward))
+        return float(bound) if np.isfinite(bound) and bound > 0 else 0.0
+
+    def best_for(self, pairs, limit=4):
+        """Indices of the `limit` landmarks giving the tightest bounds over (a, b) pairs."""
+        score = np.zeros(len(self.nodes))
+        for a, b in pairs:
+            score += np.nan_to_num(np.maximum(self.d_from[:, b] - self.d_from[:, a], self.d_to[:, a] - self.d_to[:, b]),
+                                   nan=0, posinf=0, neginf=0)
+        return np.argsort(-score)[:limit]
+
+
+class SearchView:
+    """
+    Flat array.array copies of the CSR and landmark rows. Indexing them yields plain
+    Python numbers, which keeps the search loop several times faster than numpy scalars.
+    """
+
+    def __init__(self, graph, landmarks=None):
+        self.indptr = array('q', graph.indptr.astype(np.int64).tobytes())
+        self.indices = array('i', graph.indices.astype(np.int32).tobytes())
+        self.weights = array('f', graph.weights.astype(np.float32).tobytes())
+        self.rev_indptr = array('q', graph.rev_indptr.astype(np.int64).tobytes())
+        self.rev_indices = array('i', graph.rev_indices.astype(np.int32).tobytes())
+        self.rev_weights = array('f', graph.rev_weights.astype(np.float32).tobytes())
+        self.landmarks = landmarks
+        if landmarks is not None:
+            self.lm_from = [array('f', row.astype(np.float32).tobytes()) for row in landmarks.d_from]
+            self.lm_to = [array('f', row.astype(np.float32).tobytes()) for row in landmarks.d_to]
+
+
+def multi_target_search(view, start, goals, reverse=False, max_seconds=math.inf, active=4):
+    """
+    A* from `start` until every node in `goals` is settled (or max_seconds is exceeded).
+    reverse=False: drive times start -> goal; reverse=True: drive times goal -> start
+    (search runs on the reverse graph). Returns {goal_node: seconds}.
+    The heuristic is the minimum over goals of each goal's ALT bound, which stays consistent.
+    """
+    goals = set(int(g) for g in goals)
+    if not goals:
+        return {}
+    if reverse:
+        indptr, indices, weights = view.rev_indptr, view.rev_indices, view.rev_weights
+    else:
+        indptr, indices, weights = view.indptr, view.indices, view.weights
+
+    goal_terms = {}
+    if view.landmarks is not None:
+        pairs = [(g, start) if reverse else (start, g) for g in goals]
+        chosen = view.landmarks.best_for(pairs, active)
+        for g in goals:
+            goal_terms[g] = [(view.lm_from[li], view.lm_to[li], view.lm_from[li][g], view.lm_to[li][g]) for li in chosen]
+
+    def h(v):
+        best = math.inf
+        for terms in goal_terms.values():
+            bound = 0.0
+            for f_row, t_row, f_g, t_g in terms:
+                if reverse:
+                    # bound on d(goal, v): d(L, v) - d(L, goal), d(goal, L) - d(v, L)
+                    b = max(f_row[v] - f_g, t_g - t_row[v])
+                else:
+                    # bound on d(v, goal): d(L, goal) - d(L, v), d(v, L) - d(goal, L)
+                    b = max(f_g - f_row[v], t_row[v] - t_g)
+                if b > bound:
+                    bound = b
+            if bound < best:
+                best = bound
+        return best if best != math.inf else 0.0
+
+    # Goals drop out of the heuristic once reached, so it tightens towards the remaining
+    # ones; it stays admissible but not consistent, hence re-expansion via the dist check.
+    dist = {start: 0.0}
+    found = {}
+    heap = [(h(start), 0.0, start)]
+    pop, push = heapq.heappop, heapq.heappush
+    while heap and len(found) < len(goals):
+        _f, d, u = pop(heap)
+        if d > dist[u]:
+            continue
+        if d > max_seconds:
+            break
+        if u in goals and u not in found:
+            found[u] = d
+            goal_terms.pop(u, None)
+        for i in range(indptr[u], indptr[u + 1]):
+            v = indices[i]
+            nd = d + weights[i]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                push(heap, (nd + h(v), nd, v))
+    return found
@@ -0,0 +1,156 @@
+"""
+Drive-time ETAs between lat/lng points over the preprocessed road graph.
+
+Points are snapped to the nearest graph node; the off-road gap is charged at
+SNAP_SPEED_KMH. One A* search answers one-to-many queries, so ranking k candidate
+ambulances against an incident costs a single search on the reverse graph.
+
+Build the graph file once per city extract:
+  python -m roadnet.eta build city.osm data/roadnet.npz --landmarks 16
+"""
+import argparse
+import threading
+import time
+from pathlib import Path
+
+from config import Config
+from utils import metrics
+from utils.geo_index import GridIndex
+from roadnet import graph as road_graph
+from roadnet.alt import Landmarks, SearchView, multi_target_search
+
+SNAP_CELL_DEG = 0.005      # ~550 m cells for node snapping
+MAX_SNAP_KM = 1.0          # points farther than this from any road are not routed
+SNAP_SPEED_KMH = 15        # speed charged for the gap between a point and its snapped node
+MAX_SEARCH_SECONDS = 2 * 3600
+
+
+class EtaEngine:
+    def __init__(self, graph, landmarks=None):
+        self.graph = graph
+        self.landmarks = landmarks
+        self._view = SearchView(graph, landmarks)
+        self._nodes = GridIndex(cell_deg=SNAP_CELL_DEG)
+        for i, (lat, lng) in enumerate(zip(graph.lat.tolist(), graph.lng.tolist())):
+            self._nodes.add(lat, lng, i)
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.snap_failures = 0
+        self.total_ms = 0.0
+
+    def snap(self, lat, lng):
+        """(node, seconds to reach it off-road) or None if no road within MAX_SNAP_KM."""
+        hits = self._nodes.nearest(float(lat), float(lng), k=1, radius_km=MAX_SNAP_KM)
+        if not hits:
+            return None
+        d_km, node = hits[0]
+        return node, d_km / SNAP_SPEED_KMH * 3600
+
+    def _query(self, lat, lng, points, reverse):
+        started = time.perf_counter()
+        origin = self.snap(lat, lng)
+        snapped = [self.snap(p[0], p[1]) for p in points]
+        out = [None] * len(points)
+        if origin is not None:
+            goals = {s[0] for s in snapped if s is not None}
+            times = multi_target_search(self._view, origin[0], goals, reverse=reverse, max_seconds=MAX_SEARCH_SECONDS)
+            for i, s in enumerate(snapped):
+                if s is not None and s[0] in times:
+                    out[i] = times[s[0]] + s[1] + origin[1]
+        with self._lock:
+            self.queries += 1
+            self.snap_failures += sum(1 for s in snapped if s is None) + (origin is None)
+            self.total_ms += (time.perf_counter() - started) * 1000
+        return out
+
+    def drive_times_to(self, lat, lng, sources):
+        """Seconds from each (lat, lng) in sources to the target point; None where unroutable."""
+        return self._query(lat, lng, sources, reverse=True)
+
+    def drive_times_from(self, lat, lng, targets):
+        """Seconds from the origin point to each (lat, lng) in targets; None where unroutable."""
+        return self._query(lat, lng, targets, reverse=False)
+
+    def stats(self):
+        return {
+            'nodes': self.graph.n_nodes,
+            'edges': self.graph.n_edges,
+            'landmarks': len(self.landmarks.nodes) if self.landmarks is not None else 0,
+            'queries': self.queries,
+            'snap_failures': self.snap_failures,
+            'avg_query_ms': round(self.total_ms / self.queries, 3) if self.queries else 0.0,
+        }
+
+
+_ENGINE = None
+_LOADED = False
+_LOCK = threading.Lock()
+
+
+def get_engine():
+    """Process-wide engine loaded lazily from Config.ROADNET_FILE; None if the file is missing."""
+    global _ENGINE, _LOADED
+    if not _LOADED:
+        with _LOCK:
+            if not _LOADED:
+                path = Config.ROADNET_FILE
+                if path and Path(path).exists():
+                    _ENGINE = EtaEngine(*road_graph.load(path))
+                _LOADED = True
+    return _ENGINE
+
+
+def set_engine(engine):
+    global _ENGINE, _LOADED
+    _ENGINE = engine
+    _LOADED = True
+
+
+metrics.register('road_eta', lambda: _ENGINE.stats() if _ENGINE is not None else {'loaded': False})
+
+
+def _build(args):
+    started = time.perf_counter()
+    graph = road_graph.RoadGraph.from_osm_xml(args.osm)
+    print(f"Graph: {graph.n_nodes} nodes, {graph.n_edges} edges ({time.perf_counter() - started:.1f}s)")
+    landmarks = None
+    if args.landmarks > 0:
+        started = time.perf_counter()
+        landmarks = Landmarks.build(graph, count=args.landmarks)
+        print(f"Landmarks: {len(landmarks.nodes)} ({time.perf_counter() - started:.1f}s)")
+    road_graph.save(args.out, graph, landmarks)
+    print(f"Wrote {args.out}")
+
+
+def _query(args):
+    engine = EtaEngine(*road_graph.load(args.graph))
+    (lat1, lng1), (lat2, lng2) = args.origin, args.target
+    seconds = engine.drive_times_from(lat1, lng1, [(lat2, lng2)])[0]
+    print('unroutable' if seconds is None else f"{seconds / 60:.1f} min")
+    print(engine.stats())
+
+
+def _point(value):
+    lat, lng = value.split(',')
+    return float(lat), float(lng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the offline road-network ETA graph")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="OSM XML extract -> .npz graph with landmarks")
+    build.add_argument('osm')
+    build.add_argument('out')
+    build.add_argument('--landmarks', type=int, default=16)
+    build.set_defaults(func=_build)
+    query = sub.add_parser('query', help="drive time between two lat,lng points")
+    query.add_argument('graph')
+    query.add_argument('origin', type=_point)
+    query.add_argument('target', type=_point)
+    query.set_defaults(func=_query)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Road graph in compressed sparse row (CSR) form.
+
+Nodes are OSM nodes used by drivable ways; edge weights are free-flow drive times in
+seconds. Forward and reverse adjacency are both stored so searches can run from a
+source or towards a target. Only the largest strongly connected component is kept,
+so every snapped point can reach every other.
+"""
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+import numpy as np
+
+# Default free-flow speeds (km/h) by OSM highway class
+SPEEDS_KMH = {
+    'motorway': 90, 'motorway_link': 50,
+    'trunk': 70, 'trunk_link': 40,
+    'primary': 50, 'primary_link': 35,
+    'secondary': 40, 'secondary_link': 30,
+    'tertiary': 35, 'tertiary_link': 25,
+    'unclassified': 25, 'residential': 20,
+    'living_street': 10, 'service': 15, 'road': 25,
+}
+
+
+def _haversine_m(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371000 * np.arcsin(np.sqrt(a))
+
+
+def _parse_speed(tag, default):
+    if not tag:
+        return default
+    try:
+        value = float(tag.split()[0])
+    except (ValueError, IndexError):
+        return default
+    return value * 1.609 if 'mph' in tag else value
+
+
+def _csr(n, src, dst, weight):
+    order = np.lexsort((dst, src))
+    src, dst, weight = src[order], dst[order], weight[order]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(indptr, src + 1, 1)
+    return np.cumsum(indptr), dst.astype(np.int32), weight.astype(np.float32)
+
+
+class RoadGraph:
+    def __init__(self, lat, lng, indptr, indices, weights, rev_indptr=None, rev_indices=None, rev_weights=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        if rev_indptr is None:
+            src = np.repeat(np.arange(len(self.lat)), np.diff(self.indptr))
+            rev_indptr, rev_indices, rev_weights = _csr(len(self.lat), self.indices.astype(np.int64), src, self.weights)
+        self.rev_indptr = np.asarray(rev_indptr, dtype=np.int64)
+        self.rev_indices = np.asarray(rev_indices, dtype=np.int32)
+        self.rev_weights = np.asarray(rev_weights, dtype=np.float32)
+
+    @property
+    def n_nodes(self):
+        return len(self.lat)
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    def to_scipy(self, reverse=False):
+        from scipy.sparse import csr_matrix
+        if reverse:
+            return csr_matrix((self.rev_weights, self.rev_indices, self.rev_indptr), shape=(self.n_nodes, self.n_nodes))
+        return csr_matrix((self.weights, self.indices, self.indptr), shape=(self.n_nodes, self.n_nodes))
+
+    def arrays(self):
+        return {
+            'lat': self.lat, 'lng': self.lng,
+            'indptr': self.indptr, 'indices': self.indices, 'weights': self.weights,
+            'rev_indptr': self.rev_indptr, 'rev_indices': self.rev_indices, 'rev_weights': self.rev_weights,
+        }
+
+    @classmethod
+    def from_edges(cls, lat, lng, src, dst, seconds):
+        """Build from edge arrays, keeping only the largest strongly connected component."""
+        lat, lng = np.asarray(lat), np.asarray(lng)
+        src, dst, seconds = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64), np.asarray(seconds)
+        n = len(lat)
+        try:
+            from scipy.sparse import coo_matrix
+            from scipy.sparse.csgraph import connected_components
+            _, labels = connected_components(coo_matrix((np.ones(len(src)), (src, dst)), shape=(n, n)), connection='strong')
+            keep = labels == np.bincount(labels).argmax()
+        except ImportError:
+            keep = np.ones(n, dtype=bool)
+        remap = np.full(n, -1, dtype=np.int64)
+        remap[keep] = np.arange(int(keep.sum()))
+        e = keep[src] & keep[dst]
+        src, dst, seconds = remap[src[e]], remap[dst[e]], seconds[e]
+        indptr, indices, weights = _csr(int(keep.sum()), src, dst, seconds)
+        return cls(lat[keep], lng[keep], indptr, indices, weights)
+
+    @classmethod
+    def from_osm_xml(cls, path, speeds=None):
+        """Parse an .osm XML extract (e.g. from osmium/Overpass) into a drive-time graph."""
+        speeds = speeds or SPEEDS_KMH
+        coords = {}
+        ways = []
+        for _event, el in ET.iterparse(str(path), events=('end',)):
+            if el.tag == 'node':
+                coords[int(el.get('id'))] = (float(el.get('lat')), float(el.get('lon')))
+                el.clear()
+            elif el.tag == 'way':
+                tags = {t.get('k'): t.get('v') for t in el.findall('tag')}
+                highway = tags.get('highway')
+                if highway in speeds and tags.get('access') not in ('no', 'private'):
+                    refs = [int(nd.get('ref')) for nd in el.findall('nd')]
+                    speed = _parse_speed(tags.get('maxspeed'), speeds[highway])
+                    oneway = tags.get('oneway')
+                    if oneway is None and (highway.startswith('motorway') or tags.get('junction') == 'roundabout'):
+                        oneway = 'yes'
+                    ways.append((refs, speed, oneway))
+                el.clear()
+
+        ids = {}
+        src, dst, speed_kmh = [], [], []
+        for refs, speed, oneway in ways:
+            refs = [r for r in refs if r in coords]
+            for a, b in zip(refs, refs[1:]):
+                ia = ids.setdefault(a, len(ids))
+                ib = ids.setdefault(b, len(ids))
+                if oneway == '-1':
+                    ia, ib = ib, ia
+                src.append(ia)
+                dst.append(ib)
+                speed_kmh.append(speed)
+                if oneway not in ('yes', 'true', '1', '-1'):
+                    src.append(ib)
+                    dst.append(ia)
+                    speed_kmh.append(speed)
+        node_ids = np.empty(len(ids), dtype=np.int64)
+        for osm_id, idx in ids.items():
+            node_ids[idx] = osm_id
+        lat = np.array([coords[i][0] for i in node_ids])
+        lng = np.array([coords[i][1] for i in node_ids])
+        src, dst = np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+        length_m = _haversine_m(lat[src], lng[src], lat[dst], lng[dst])
+        seconds = np.maximum(length_m / (np.array(speed_kmh) / 3.6), 0.1)
+        return cls.from_edges(lat, lng, src, dst, seconds)
+
+
+def save(path, graph, landmarks=None):
+    data = graph.arrays()
+    if landmarks is not None:
+        data.update(landmarks.arrays())
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(path, **data)
+
+
+def load(path):
+    """Returns (RoadGraph, Landmarks or None)."""
+    from roadnet.alt import Landmarks
+    data = np.load(path)
+    graph = RoadGraph(data['lat'], data['lng'], data['indptr'], data['indices'], data['weights'],
+                      data['rev_indptr'], data['rev_indices'], data['rev_weights'])
+    landmarks = Landmarks(data['lm_nodes'], data['lm_from'], data['lm_to']) if 'lm_nodes' in data else None
+    return graph, landmarks
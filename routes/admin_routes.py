@@ -1,16 +1,20 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required
-from models.user_model import UserModel
-from models.ambulance_model import AmbulanceModel
-from models.request_model import RequestModel, LocationTrackModel
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import create_access_token
+from models.request_model import RequestModel
+from models.live_incident_model import live_incidents
 from utils.auth import role_required
+from utils import metrics
+from utils.db import reporting_db
+from utils.map_tiles import map_tiles
 from config import Config
-from bson import ObjectId
+from utils.time_utils import get_ist_now_naive
 
 admin_bp = Blueprint('admin', __name__)
 
 def init_admin_routes(app, db):
     admin_bp.db = db
+    # Dashboards and history tolerate replication lag; keep them off the primary
+    admin_bp.reporting_db = reporting_db(db)
     app.register_blueprint(admin_bp, url_prefix='/admin')
 
 @admin_bp.route('/login', methods=['POST'])
@@ -32,11 +36,10 @@ def login():
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/all-users', methods=['GET'])
-@jwt_required()
 @role_required('admin')
 def all_users():
     try:
-        users = list(admin_bp.db.users.find())
+        users = list(admin_bp.reporting_db.users.find())
         for u in users:
             u['_id'] = str(u['_id'])
         return jsonify({'users': users, 'count': len(users)}), 200
@@ -44,92 +47,216 @@ def all_users():
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/all-ambulances', methods=['GET'])
-@jwt_required()
 @role_required('admin')
 def all_ambulances():
     try:
-        ambulances = list(admin_bp.db.ambulances.find())
+        ambulances = list(admin_bp.reporting_db.ambulances.find())
         for a in ambulances:
             a['_id'] = str(a['_id'])
         return jsonify({'ambulances': ambulances, 'count': len(ambulances)}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _serialize_offers(r):
+    if r.get('offers'):
+        r['offers'] = [dict(o, ambulance_id=str(o['ambulance_id'])) for o in r['offers']]
+
 @admin_bp.route('/all-requests', methods=['GET'])
-@jwt_required()
 @role_required('admin')
 def all_requests():
     try:
-        requests = RequestModel.get_all_requests(admin_bp.db)
+        include_archive = request.args.get('include_archive', 'false').lower() == 'true'
+        requests = RequestModel.get_all_requests(admin_bp.reporting_db, include_archive)
         for r in requests:
             r['_id'] = str(r['_id'])
             r['user_id'] = str(r['user_id'])
             if r.get('assigned_ambulance_id'):
                 r['assigned_ambulance_id'] = str(r['assigned_ambulance_id'])
+            _serialize_offers(r)
         return jsonify({'requests': requests, 'count': len(requests)}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/escalations', methods=['GET'])
+@role_required('admin')
+def escalations():
+    """Pending requests with their escalation state (oldest first) and the current queue owner."""
+    try:
+        from services.escalation import LEASE_NAME
+        from utils.lease import Lease
+        pending = list(admin_bp.db.requests.find({'status': 'pending'}).sort('created_at', 1))
+        for r in pending:
+            r['_id'] = str(r['_id'])
+            r['user_id'] = str(r['user_id'])
+            if r.get('assigned_ambulance_id'):
+                r['assigned_ambulance_id'] = str(r['assigned_ambulance_id'])
+            _serialize_offers(r)
+        lease = Lease.current(admin_bp.db, LEASE_NAME)
+        return jsonify({
+            'pending': pending,
+            'count': len(pending),
+            'sla_breached': sum(1 for r in pending if (r.get('escalation') or {}).get('sla_breached_at')),
+            'owner': {'holder': lease.get('holder'), 'expires_at': lease.get('expires_at')} if lease else None,
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @admin_bp.route('/dashboard-map', methods=['GET'])
-@jwt_required()
 @role_required('admin')
 def dashboard_map():
     """
     For central dashboard: each request as accident marker + assigned ambulance + ambulance track.
     Frontend can plot: accident at request.location, assigned ambulance, and track polyline.
     Excludes completed requests from map (but they remain in list view).
+    Served from the live incidents view (models.live_incident_model). The response carries a
+    version; with ?since=<version> only incidents changed after it are returned, plus the ids
+    that left the map ('removed') and the current track colours.
+    """
+    try:
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return jsonify({'error': 'since must be an integer version'}), 400
+        body = live_incidents.render(admin_bp.db, since, current_app.json.dumps)
+        return current_app.response_class(body + '\n', mimetype='application/json'), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/map-data', methods=['GET'])
+@role_required('admin')
+def map_data():
+    """
+    Map view at city scale: ?bbox=min_lng,min_lat,max_lng,max_lat&zoom=<web map zoom>.
+    Below MAP_DETAIL_ZOOM returns geohash cells with incident/ambulance counts; at or above it
+    returns the individual incidents (dashboard-map rows) and ambulances inside the box.
+    """
+    try:
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(v) for v in request.args.get('bbox', '').split(','))
+            zoom = int(request.args.get('zoom', ''))
+        except ValueError:
+            return jsonify({'error': 'bbox=min_lng,min_lat,max_lng,max_lat and integer zoom are required'}), 400
+        if min_lat > max_lat or min_lng > max_lng:
+            return jsonify({'error': 'bbox min must not exceed max'}), 400
+        bbox = (min_lat, min_lng, max_lat, max_lng)
+        map_tiles.refresh(admin_bp.db)
+        if zoom >= Config.MAP_DETAIL_ZOOM:
+            detail = map_tiles.detail(bbox, Config.MAP_MAX_DETAIL_POINTS)
+            if detail is not None:
+                incidents, ambulances = detail
+                return jsonify({'mode': 'detail', 'zoom': zoom, 'incidents': incidents, 'ambulances': ambulances}), 200
+        precision, cells = map_tiles.clusters(bbox, zoom)
+        return jsonify({'mode': 'clusters', 'zoom': zoom, 'precision': precision, 'cells': cells}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/response-times', methods=['GET'])
+@role_required('admin')
+def response_times():
     """
+    Response-time percentiles from the hourly/daily rollups (models.request_event_model).
+    Query: granularity=hour|day (default hour), from/to ISO datetimes (default: last 24 h),
+    area (geohash) and ambulance_type filters, group_by=area|ambulance_type, series=true.
+    """
+    try:
+        from datetime import datetime, timedelta
+        from models.request_event_model import RequestEventModel, GRANULARITIES, ALL
+        granularity = request.args.get('granularity', 'hour')
+        group_by = request.args.get('group_by')
+        if granularity not in GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+        if group_by not in (None, 'area', 'ambulance_type'):
+            return jsonify({'error': 'group_by must be area or ambulance_type'}), 400
+        try:
+            end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else get_ist_now_naive()
+            start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(days=1)
+        except ValueError:
+            return jsonify({'error': 'from/to must be ISO datetimes (IST)'}), 400
+        summary = RequestEventModel.summary(
+            admin_bp.reporting_db, start, end, granularity=granularity,
+            area=request.args.get('area', ALL), ambulance_type=request.args.get('ambulance_type', ALL),
+            group_by=group_by, series=request.args.get('series', 'false').lower() == 'true',
+        )
+        return jsonify(summary), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _hour_of_week_arg():
+    from analytics.demand import hour_of_week
+    value = request.args.get('hour_of_week')
+    if value is None:
+        return hour_of_week(get_ist_now_naive())
+    value = int(value)
+    if not 0 <= value < 168:
+        raise ValueError('hour_of_week must be 0..167 (0 = Sunday 00:00)')
+    return value
+
+@admin_bp.route('/demand/heatmap', methods=['GET'])
+@role_required('admin')
+def demand_heatmap():
+    """Expected requests per hour by grid cell for ?hour_of_week= (default: now); ?top= limits cells."""
+    try:
+        from analytics.demand import get_model
+        try:
+            how = _hour_of_week_arg()
+            top = int(request.args.get('top', 500))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        model = get_model(admin_bp.db)
+        if model is None:
+            return jsonify({'error': 'No demand model yet; POST /admin/demand/rebuild'}), 404
+        return jsonify({
+            'hour_of_week': how,
+            'cell_deg': model.cell_deg,
+            'weeks': model.weeks,
+            'built_at': model.built_at.isoformat() if model.built_at else None,
+            'cells': model.heatmap(how, top=top),
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/demand/standby', methods=['GET'])
+@role_required('admin')
+def demand_standby():
+    """Recommended standby positions for idle ambulances at ?hour_of_week= (default: now)."""
+    try:
+        from analytics.demand import get_model, idle_ambulances, recommend_standby
+        try:
+            how = _hour_of_week_arg()
+            radius_km = float(request.args['radius_km']) if request.args.get('radius_km') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        model = get_model(admin_bp.db)
+        if model is None:
+            return jsonify({'error': 'No demand model yet; POST /admin/demand/rebuild'}), 404
+        return jsonify(recommend_standby(model, how, idle_ambulances(admin_bp.db), radius_km=radius_km)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/demand/rebuild', methods=['POST'])
+@role_required('admin')
+def demand_rebuild():
+    """Rebuild the demand model from request history. Body: { "days": optional window }."""
+    try:
+        from analytics.demand import build_model, save_model
+        days = (request.get_json(silent=True) or {}).get('days')
+        model = build_model(admin_bp.reporting_db, days=int(days) if days else None)
+        if model is None:
+            return jsonify({'error': 'No requests in range'}), 404
+        save_model(admin_bp.db, model)
+        rows, cols = model.shape
+        return jsonify({'message': 'Demand model rebuilt', 'requests': model.requests, 'weeks': model.weeks,
+                        'rows': rows, 'cols': cols, 'cell_deg': model.cell_deg}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/metrics', methods=['GET'])
+@role_required('admin')
+def worker_metrics():
+    """Counters and cache stats for the worker process that served this request."""
     try:
-        requests = RequestModel.get_all_requests(admin_bp.db)
-        out = []
-        # Color palette for different ambulances
-        colors = ['#3b82f6', '#ef4444', '#10b981', '#f59e0b', '#8b5cf6', '#ec4899', '#06b6d4', '#84cc16']
-        ambulance_colors = {}  # Map ambulance_id to color
-        
-        for req in requests:
-            # Skip completed requests from map (but keep in list)
-            if req.get('status') == 'completed':
-                continue
-                
-            r = {
-                'id': str(req['_id']),
-                'location': req.get('location'),
-                'status': req.get('status'),
-                'created_at': req.get('created_at').isoformat() if req.get('created_at') else None,
-                'assigned_ambulance_id': str(req['assigned_ambulance_id']) if req.get('assigned_ambulance_id') else None,
-                'assigned_ambulance': None,
-                'track': [],
-                'track_color': None
-            }
-            r['selected_hospital'] = req.get('selected_hospital')
-            if req.get('assigned_ambulance_id'):
-                amb_id_str = str(req['assigned_ambulance_id'])
-                amb = AmbulanceModel.find_by_id(admin_bp.db, amb_id_str)
-                if amb:
-                    # Assign color to ambulance if not already assigned
-                    if amb_id_str not in ambulance_colors:
-                        color_idx = len(ambulance_colors) % len(colors)
-                        ambulance_colors[amb_id_str] = colors[color_idx]
-                    r['track_color'] = ambulance_colors[amb_id_str]
-                    
-                    r['assigned_ambulance'] = {
-                        'id': amb_id_str,
-                        'name': amb.get('name'),
-                        'phone': amb.get('phone'),
-                        'vehicle_number': amb.get('vehicle_number'),
-                        'driving_license': amb.get('driving_license'),
-                        'age': amb.get('age'),
-                        'gender': amb.get('gender'),
-                        'status': amb.get('status'),
-                        'current_location': amb.get('current_location'),
-                        'current_location_updated_at': amb.get('current_location_updated_at').isoformat() if amb.get('current_location_updated_at') else None,
-                    }
-                track = LocationTrackModel.get_track_for_request(admin_bp.db, r['id'])
-                r['track'] = [
-                    {'lat': t['lat'], 'lng': t['lng'], 'created_at': t.get('created_at').isoformat() if t.get('created_at') else None}
-                    for t in track
-                ]
-            out.append(r)
-        return jsonify({'requests': out, 'count': len(out)}), 200
+        return jsonify(metrics.snapshot()), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,12 +1,15 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, get_jwt_identity
 from models.ambulance_model import AmbulanceModel
 from models.request_model import RequestModel, LocationTrackModel
 from models.user_model import UserModel
 from models.otp_model import OTPModel
 from utils.auth import role_required
-from utils.otp import send_otp_logic
-from utils.distance import find_nearest_ambulance
+from utils.otp import send_otp_logic, send_otp_wait, verify_otp_wait
+from utils.rate_limit import too_many
+from services.dispatch import dispatch
+from utils.hospitals import get_catalogue
+from config import Config
 from bson import ObjectId
 
 ambulance_bp = Blueprint('ambulance', __name__)
@@ -18,6 +21,37 @@ def _serialize_ambulance(a):
     a['_id'] = str(a['_id'])
     return a
 
+def _request_row(req, user):
+    """my-requests entry: request with the reporting user's name/phone."""
+    r = dict(req)
+    r['_id'] = str(r['_id'])
+    r['user_id'] = str(r['user_id'])
+    r['assigned_ambulance_id'] = str(r['assigned_ambulance_id']) if r.get('assigned_ambulance_id') else None
+    r.pop('offers', None)
+    if user:
+        r['user_name'] = user.get('name')
+        r['user_phone'] = user.get('phone')
+    r['accident_location'] = r.get('location')
+    return r
+
+def _assigned_payload(req, user, amb):
+    """assigned-details body: directions run from the ambulance to the accident, then to the hospital."""
+    accident = req.get('location') or {}
+    origin = (amb.get('current_location') or {}) if amb else {}
+    dest = req.get('selected_hospital') if req.get('status') == 'to_hospital' else accident
+    return {
+        'request_id': str(req['_id']),
+        'status': req.get('status'),
+        'user_name': user.get('name') if user else None,
+        'user_phone': user.get('phone') if user else None,
+        'accident_location': accident,
+        'selected_hospital': req.get('selected_hospital'),
+        'directions': {
+            'origin': origin,
+            'destination': dest
+        }
+    }
+
 def init_ambulance_routes(app, db):
     ambulance_bp.db = db
     app.register_blueprint(ambulance_bp, url_prefix='/ambulance')
@@ -29,6 +63,9 @@ def send_otp():
         phone = data.get('phone')
         if not phone:
             return jsonify({'error': 'Phone number is required'}), 400
+        wait = send_otp_wait(ambulance_bp.db, request, phone, 'ambulance')
+        if wait:
+            return too_many(wait)
         send_otp_logic(ambulance_bp.db, phone, role='ambulance')
         return jsonify({'message': 'OTP sent successfully'}), 200
     except Exception as e:
@@ -42,6 +79,9 @@ def verify_otp():
         otp = data.get('otp')
         if not phone or not otp:
             return jsonify({'error': 'Phone number and OTP are required'}), 400
+        wait = verify_otp_wait(ambulance_bp.db, phone, 'ambulance')
+        if wait:
+            return too_many(wait)
         if not OTPModel.verify_otp(ambulance_bp.db, phone, otp, role='ambulance'):
             return jsonify({'error': 'Invalid or expired OTP'}), 400
         ambulance = AmbulanceModel.find_by_phone(ambulance_bp.db, phone)
@@ -73,7 +113,6 @@ def verify_otp():
         return jsonify({'error': str(e)}), 500
 
 @ambulance_bp.route('/me', methods=['GET'])
-@jwt_required()
 @role_required('ambulance')
 def get_me():
     """Get current ambulance profile (for pre-populating forms)."""
@@ -87,7 +126,6 @@ def get_me():
         return jsonify({'error': str(e)}), 500
 
 @ambulance_bp.route('/update-profile', methods=['POST'])
-@jwt_required()
 @role_required('ambulance')
 def update_profile():
     try:
@@ -105,7 +143,6 @@ def update_profile():
         return jsonify({'error': str(e)}), 500
 
 @ambulance_bp.route('/status', methods=['PUT'])
-@jwt_required()
 @role_required('ambulance')
 def toggle_status():
     """Set status to active only if profile and location are set."""
@@ -160,17 +197,11 @@ def toggle_status():
         return jsonify({'error': str(e)}), 500
 
 @ambulance_bp.route('/update-location', methods=['POST'])
-@jwt_required()
 @role_required('ambulance')
 def update_location():
     """Update current location for THIS ambulance only; if has active assigned request, log to track for dashboard."""
     try:
         ambulance_id = get_jwt_identity()
-        # Verify ambulance exists
-        ambulance = AmbulanceModel.find_by_id(ambulance_bp.db, ambulance_id)
-        if not ambulance:
-            return jsonify({'error': 'Ambulance not found'}), 404
-        
         data = request.get_json() or {}
         lat = data.get('lat')
         lng = data.get('lng')
@@ -178,14 +209,14 @@ def update_location():
             return jsonify({'error': 'lat and lng are required'}), 400
         lat, lng = float(lat), float(lng)
         
-        # Update location for THIS specific ambulance only
-        AmbulanceModel.update_location(ambulance_bp.db, ambulance_id, lat, lng)
+        # Update location for THIS specific ambulance only (write-only; no match = unknown ambulance)
+        if not AmbulanceModel.set_location(ambulance_bp.db, ambulance_id, lat, lng):
+            return jsonify({'error': 'Ambulance not found'}), 404
         
         # Log to track if has active assignment
-        assigned = list(ambulance_bp.db.requests.find({
-            'assigned_ambulance_id': ObjectId(ambulance_id),
-            'status': {'$in': ['assigned', 'to_hospital']}
-        }).limit(1))
+        assigned = list(ambulance_bp.db.requests.find(
+            RequestModel._active_for_ambulance_filter(ambulance_id)
+        ).limit(1))
         if assigned:
             LocationTrackModel.add(ambulance_bp.db, str(assigned[0]['_id']), ambulance_id, lat, lng)
         
@@ -194,66 +225,96 @@ def update_location():
         return jsonify({'error': str(e)}), 500
 
 @ambulance_bp.route('/my-requests', methods=['GET'])
-@jwt_required()
 @role_required('ambulance')
 def my_requests():
     try:
         ambulance_id = get_jwt_identity()
-        requests = RequestModel.get_by_ambulance(ambulance_bp.db, ambulance_id)
-        out = []
-        for req in requests:
-            r = dict(req)
-            r['_id'] = str(r['_id'])
-            r['user_id'] = str(r['user_id'])
-            r['assigned_ambulance_id'] = str(r['assigned_ambulance_id']) if r.get('assigned_ambulance_id') else None
-            user = UserModel.find_by_id(ambulance_bp.db, r['user_id'])
-            if user:
-                r['user_name'] = user.get('name')
-                r['user_phone'] = user.get('phone')
-            r['accident_location'] = r.get('location')
-            out.append(r)
+        include_archive = request.args.get('include_archive', 'false').lower() == 'true'
+        requests = RequestModel.get_by_ambulance(ambulance_bp.db, ambulance_id, include_archive)
+        out = [
+            _request_row(req, UserModel.find_by_id(ambulance_bp.db, str(req['user_id'])))
+            for req in requests
+        ]
         return jsonify({'requests': out, 'count': len(out)}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ambulance_bp.route('/assigned-details', methods=['GET'])
-@jwt_required()
 @role_required('ambulance')
 def assigned_details():
     """Get current assigned request: user name, phone, accident location, and directions (origin=ambulance, destination=accident)."""
     try:
         ambulance_id = get_jwt_identity()
-        assigned = list(ambulance_bp.db.requests.find({
-            'assigned_ambulance_id': ObjectId(ambulance_id),
-            'status': {'$in': ['assigned', 'to_hospital']}
-        }).sort('created_at', -1).limit(1))
+        assigned = list(ambulance_bp.db.requests.find(
+            RequestModel._active_for_ambulance_filter(ambulance_id)
+        ).sort('created_at', -1).limit(1))
         if not assigned:
             return jsonify({'assigned': None, 'message': 'No active assignment'}), 200
         req = assigned[0]
         user = UserModel.find_by_id(ambulance_bp.db, str(req['user_id']))
         amb = AmbulanceModel.find_by_id(ambulance_bp.db, ambulance_id)
-        accident = req.get('location') or {}
-        origin = (amb.get('current_location') or {}) if amb else {}
-        dest = req.get('selected_hospital') if req.get('status') == 'to_hospital' else accident
-        return jsonify({
-            'assigned': {
+        return jsonify({'assigned': _assigned_payload(req, user, amb)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ambulance_bp.route('/offers', methods=['GET'])
+@role_required('ambulance')
+def my_offers():
+    """Open dispatch offers for this ambulance (offer mode): accept or decline before expires_at."""
+    try:
+        ambulance_id = ObjectId(get_jwt_identity())
+        out = []
+        for req in RequestModel.get_offers_for_ambulance(ambulance_bp.db, ambulance_id):
+            mine = next(o for o in req['offers'] if o['ambulance_id'] == ambulance_id and o['status'] == 'pending')
+            out.append({
                 'request_id': str(req['_id']),
-                'status': req.get('status'),
-                'user_name': user.get('name') if user else None,
-                'user_phone': user.get('phone') if user else None,
-                'accident_location': accident,
-                'selected_hospital': req.get('selected_hospital'),
-                'directions': {
-                    'origin': origin,
-                    'destination': dest
-                }
-            }
-        }), 200
+                'accident_location': req.get('location'),
+                'requested_ambulance_type': req.get('requested_ambulance_type'),
+                'source': req.get('source'),
+                'offered_at': mine['offered_at'],
+                'expires_at': mine['expires_at'],
+            })
+        return jsonify({'offers': out, 'count': len(out)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ambulance_bp.route('/offers/<request_id>/accept', methods=['POST'])
+@role_required('ambulance')
+def accept_offer(request_id):
+    """Claim an offered request. 409 when another ambulance got it first or the offer expired."""
+    try:
+        ambulance_id = get_jwt_identity()
+        try:
+            ObjectId(request_id)
+        except Exception:
+            return jsonify({'error': 'Invalid request ID format'}), 400
+        if AmbulanceModel.has_active_assignment(ambulance_bp.db, ambulance_id):
+            return jsonify({'error': 'Complete your current assignment first'}), 409
+        req = RequestModel.accept_offer(ambulance_bp.db, request_id, ambulance_id)
+        if not req:
+            return jsonify({'error': 'Offer no longer available'}), 409
+        user = UserModel.find_by_id(ambulance_bp.db, str(req['user_id']))
+        amb = AmbulanceModel.find_by_id(ambulance_bp.db, ambulance_id)
+        return jsonify({'message': 'Request assigned to you', 'assigned': _assigned_payload(req, user, amb)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ambulance_bp.route('/offers/<request_id>/decline', methods=['POST'])
+@role_required('ambulance')
+def decline_offer(request_id):
+    try:
+        ambulance_id = get_jwt_identity()
+        try:
+            ObjectId(request_id)
+        except Exception:
+            return jsonify({'error': 'Invalid request ID format'}), 400
+        if not RequestModel.decline_offer(ambulance_bp.db, request_id, ambulance_id):
+            return jsonify({'error': 'Offer no longer open'}), 409
+        return jsonify({'message': 'Offer declined'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ambulance_bp.route('/select-hospital', methods=['POST'])
-@jwt_required()
 @role_required('ambulance')
 def select_hospital():
     try:
@@ -268,13 +329,38 @@ def select_hospital():
             return jsonify({'error': 'Request not found'}), 404
         if str(req.get('assigned_ambulance_id')) != ambulance_id:
             return jsonify({'error': 'Unauthorized'}), 403
-        RequestModel.select_hospital(ambulance_bp.db, request_id, {'name': hospital.get('name', 'Hospital'), 'lat': float(hospital['lat']), 'lng': float(hospital['lng'])})
-        return jsonify({'message': 'Hospital selected', 'status': 'to_hospital'}), 200
+        selected = {'name': hospital.get('name', 'Hospital'), 'lat': float(hospital['lat']), 'lng': float(hospital['lng'])}
+        catalogue = get_catalogue()
+        if len(catalogue):
+            known = catalogue.match(hospital)
+            if known:
+                selected = {'id': known['id'], 'name': known['name'], 'lat': known['lat'], 'lng': known['lng']}
+            elif Config.HOSPITAL_CATALOGUE_STRICT:
+                return jsonify({'error': 'Hospital not found in catalogue'}), 400
+        RequestModel.select_hospital(ambulance_bp.db, request_id, selected)
+        return jsonify({'message': 'Hospital selected', 'status': 'to_hospital', 'hospital': selected}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@ambulance_bp.route('/nearby-hospitals', methods=['GET'])
+@role_required('ambulance')
+def nearby_hospitals():
+    """Nearest catalogue hospitals by great-circle distance. Query: lat, lng, k (10), radius in metres (5000), capability (comma-separated)."""
+    try:
+        lat = request.args.get('lat', type=float)
+        lng = request.args.get('lng', type=float)
+        if lat is None or lng is None:
+            return jsonify({'error': 'lat and lng are required'}), 400
+        k = min(max(request.args.get('k', 10, type=int), 1), 50)
+        radius_m = min(max(request.args.get('radius', 5000, type=float), 100), 100000)
+        capabilities = [c.strip() for c in (request.args.get('capability') or '').split(',') if c.strip()]
+        catalogue = get_catalogue()
+        hospitals = catalogue.nearby(lat, lng, k=k, radius_km=radius_m / 1000, capabilities=capabilities)
+        return jsonify({'hospitals': hospitals, 'count': len(hospitals), 'catalogue_size': len(catalogue)}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @ambulance_bp.route('/complete-request/<request_id>', methods=['PUT'])
-@jwt_required()
 @role_required('ambulance')
 def complete_request(request_id):
     try:
@@ -302,7 +388,7 @@ def complete_request(request_id):
         # Update location if provided (non-blocking - don't fail if this errors)
         if lat is not None and lng is not None:
             try:
-                AmbulanceModel.update_location(ambulance_bp.db, ambulance_id, float(lat), float(lng))
+                AmbulanceModel.set_location(ambulance_bp.db, ambulance_id, float(lat), float(lng))
             except Exception:
                 pass
         
@@ -320,12 +406,12 @@ def complete_request(request_id):
         completed['_id'] = str(completed['_id'])
         completed['user_id'] = str(completed['user_id'])
         completed['assigned_ambulance_id'] = str(completed['assigned_ambulance_id']) if completed.get('assigned_ambulance_id') else None
+        completed.pop('offers', None)
         return jsonify({'message': 'Request completed successfully', 'request': completed}), 200
     except Exception as e:
         return jsonify({'error': f'Failed to complete request: {str(e)}'}), 500
 
 @ambulance_bp.route('/report-issue/<request_id>', methods=['POST'])
-@jwt_required()
 @role_required('ambulance')
 def report_issue(request_id):
     """Report an issue (engine failure, puncture, etc.) and reassign to nearest available ambulance."""
@@ -354,14 +440,7 @@ def report_issue(request_id):
         
         # Unassign current ambulance
         current_ambulance = AmbulanceModel.find_by_id(ambulance_bp.db, ambulance_id)
-        ambulance_bp.db.requests.update_one(
-            {'_id': ObjectId(request_id)},
-            {'$set': {
-                'assigned_ambulance_id': None,
-                'status': 'pending',
-                'assigned_at': None
-            }}
-        )
+        RequestModel.unassign(ambulance_bp.db, request_id)
         
         # Set current ambulance to inactive temporarily
         AmbulanceModel.update_status(ambulance_bp.db, ambulance_id, 'inactive')
@@ -373,16 +452,20 @@ def report_issue(request_id):
         requested_type = req.get('requested_ambulance_type', 'any')
         
         if lat and lng:
-            ambulances = AmbulanceModel.get_all_with_location(ambulance_bp.db, exclude_assigned=True)
             # Exclude the current ambulance
-            ambulances = [a for a in ambulances if str(a['_id']) != ambulance_id]
-            nearest = find_nearest_ambulance(ambulances, lat, lng, prefer_active=True, requested_type=requested_type)
+            sent = dispatch(ambulance_bp.db, request_id, lat, lng, requested_type=requested_type,
+                            exclude={ObjectId(ambulance_id)})
             
-            if nearest:
-                RequestModel.assign_ambulance(ambulance_bp.db, request_id, str(nearest['_id']), send_notification=True)
+            if sent and Config.DISPATCH_MODE == 'offer':
+                return jsonify({
+                    'message': 'Issue reported. Request offered to nearby ambulances.',
+                    'status': 'pending',
+                    'offered_ambulance_ids': [str(a['_id']) for a in sent]
+                }), 200
+            if sent:
                 return jsonify({
                     'message': f'Issue reported. Request reassigned to nearest available ambulance.',
-                    'reassigned_ambulance_id': str(nearest['_id'])
+                    'reassigned_ambulance_id': str(sent[0]['_id'])
                 }), 200
             else:
                 return jsonify({
@@ -398,7 +481,6 @@ def report_issue(request_id):
         return jsonify({'error': f'Failed to report issue: {str(e)}'}), 500
 
 @ambulance_bp.route('/report-fake/<request_id>', methods=['POST'])
-@jwt_required()
 @role_required('ambulance')
 def report_fake(request_id):
     """Report that a request is fake (no accident at destination). Adds demerit point to user."""
@@ -0,0 +1,381 @@
+"""
+Async (Starlette + Motor) versions of the hot endpoints, served by asgi.py.
+
+Same paths, auth rules and response bodies as the Flask routes they shadow:
+  POST /sensor/submit, POST /ambulance/update-location,
+  GET /user/my-request, GET /ambulance/my-requests, GET /ambulance/assigned-details
+plus GET /stream/updates, a Server-Sent Events feed of the caller's active request
+(users) or assignment (ambulances) that replaces polling those endpoints. While the event
+bus (utils/event_bus.py) is live a stream re-reads only when a document it shows changes.
+
+Rare branches with many writes (accident confirmed -> create + assign) run the sync
+code in a thread against the pymongo database in app.state.sync_db.
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from datetime import date
+
+import jwt
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.http import http_date
+
+from config import Config
+from ml import detection_prefilter
+from ml.accident_detector import predict
+from models.async_models import (
+    AsyncUserModel, AsyncAmbulanceModel, AsyncRequestModel, AsyncLocationTrackModel, AsyncSensorReadingModel,
+)
+from models.idempotency_model import IdempotencyModel
+from routes.user_routes import _request_payload
+from routes.ambulance_routes import _request_row, _assigned_payload
+from routes.sensor_routes import _dispatch_detected
+from utils import idempotency
+from utils.auth import identity_of, verified_claims
+from utils.event_bus import RESET, event_bus
+
+
+def _json_default(o):
+    # Match Flask's provider: dates as RFC 822 strings
+    if isinstance(o, date):
+        return http_date(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _dumps(body):
+    return json.dumps(body, default=_json_default, sort_keys=True, separators=(',', ':'))
+
+
+class JSONResponse(Response):
+    media_type = 'application/json'
+
+    def render(self, content):
+        return (_dumps(content) + '\n').encode('utf-8')
+
+
+def _authenticate(request, required_role):
+    """
+    Verify the flask_jwt_extended access token (header, or ?token= for EventSource).
+    Returns (identity, None) or (None, error response) with flask_jwt_extended's status codes.
+    """
+    token = None
+    header = request.headers.get('authorization', '')
+    if header.startswith('Bearer '):
+        token = header[7:]
+    elif request.query_params.get('token'):
+        token = request.query_params['token']
+    if not token:
+        return None, JSONResponse({'msg': 'Missing Authorization Header'}, status_code=401)
+    try:
+        claims = verified_claims(token)
+    except jwt.ExpiredSignatureError:
+        return None, JSONResponse({'msg': 'Token has expired'}, status_code=401)
+    except jwt.InvalidTokenError as e:
+        return None, JSONResponse({'msg': str(e)}, status_code=422)
+    if claims.get('type', 'access') != 'access':
+        return None, JSONResponse({'msg': 'Only non-refresh tokens are allowed'}, status_code=422)
+    if claims.get('role') != required_role:
+        return None, JSONResponse({'error': 'Insufficient permissions'}, status_code=403)
+    return identity_of(claims), None
+
+
+async def _json_body(request):
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return {}
+
+
+async def sensor_submit(request):
+    user_id, denied = _authenticate(request, 'user')
+    if denied:
+        return denied
+    try:
+        data = await _json_body(request)
+        key = request.headers.get(idempotency.HEADER)
+        if not key:
+            body, status = await _sensor_submit(request.app.state.db, request.app.state.sync_db, user_id, data)
+            return JSONResponse(body, status_code=status)
+
+        # Same contract as @idempotent: claim or replay the key before the reading is stored
+        sync_db = request.app.state.sync_db
+        args = (sync_db, 'sensor-submit', user_id, key)
+        early = await run_in_threadpool(idempotency.claim, *args, IdempotencyModel.fingerprint(data))
+        if early is not None:
+            body, status, replayed = early
+            return JSONResponse(body, status_code=status,
+                                headers={'Idempotent-Replayed': 'true'} if replayed else None)
+        try:
+            body, status = await _sensor_submit(request.app.state.db, sync_db, user_id, data)
+        except Exception:
+            await run_in_threadpool(idempotency.settle, *args)
+            raise
+        await run_in_threadpool(idempotency.settle, *args, status, body)
+        return JSONResponse(body, status_code=status)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def _sensor_submit(db, sync_db, user_id, data):
+    """Body of POST /sensor/submit -> (body, status)."""
+    user = await AsyncUserModel.find_by_id(db, user_id)
+    if not user:
+        return {'error': 'User not found'}, 404
+    if not user.get('accident_detection_enabled'):
+        return {'error': 'Accident detection not enabled'}, 400
+
+    lat = data.get('lat')
+    lng = data.get('lng')
+    if lat is None or lng is None:
+        return {'error': 'lat and lng required'}, 400
+    shake_stop_flag = bool(data.get('shake_stop_detected', False))
+
+    previous_id = await AsyncSensorReadingModel.latest_id(db, user_id) if Config.SENSOR_PREFILTER_ENABLED else None
+    reading = await AsyncSensorReadingModel.add(
+        db, user_id, lat=lat, lng=lng,
+        speed_kmh=data.get('speed_kmh'),
+        accel_x=data.get('accel_x'), accel_y=data.get('accel_y'), accel_z=data.get('accel_z'),
+        gyro_x=data.get('gyro_x'), gyro_y=data.get('gyro_y'), gyro_z=data.get('gyro_z'),
+    )
+    if Config.SENSOR_PREFILTER_ENABLED and not detection_prefilter.should_evaluate(
+        user_id, previous_id, reading, shake_stop_flag
+    ):
+        return {
+            'message': 'Reading saved',
+            'accident_detected': False,
+            'probability': 0.0,
+            'shake_stop_flag': shake_stop_flag,
+            'prefiltered': True,
+        }, 200
+
+    readings = await AsyncSensorReadingModel.get_recent_for_user(db, user_id)
+    if Config.SENSOR_PREFILTER_ENABLED:
+        detection_prefilter.seed(user_id, readings)
+    if len(readings) < 1 and not shake_stop_flag:
+        return {'message': 'Reading saved', 'accident_detected': False}, 200
+
+    # Model inference is CPU work; keep it off the event loop
+    is_accident, prob = await run_in_threadpool(predict, readings, shake_stop_flag=shake_stop_flag)
+    if not is_accident:
+        return {
+            'message': 'Reading saved',
+            'accident_detected': False,
+            'probability': prob,
+            'shake_stop_flag': shake_stop_flag,
+            'readings_count': len(readings),
+        }, 200
+
+    return await run_in_threadpool(
+        _dispatch_detected, sync_db, user_id, lat, lng, readings, shake_stop_flag,
+    )
+
+
+async def ambulance_update_location(request):
+    ambulance_id, denied = _authenticate(request, 'ambulance')
+    if denied:
+        return denied
+    db = request.app.state.db
+    try:
+        data = await _json_body(request)
+        lat = data.get('lat')
+        lng = data.get('lng')
+        if lat is None or lng is None:
+            return JSONResponse({'error': 'lat and lng are required'}, status_code=400)
+        lat, lng = float(lat), float(lng)
+
+        if not await AsyncAmbulanceModel.set_location(db, ambulance_id, lat, lng):
+            return JSONResponse({'error': 'Ambulance not found'}, status_code=404)
+
+        assigned = await AsyncRequestModel.get_active_for_ambulance(db, ambulance_id)
+        if assigned:
+            await AsyncLocationTrackModel.add(db, str(assigned['_id']), ambulance_id, lat, lng)
+        return JSONResponse({'message': 'Location updated successfully'})
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def _my_request_body(db, user_id):
+    req = await AsyncRequestModel.get_active_for_user(db, user_id)
+    if not req:
+        return {'request': None, 'message': 'No active request'}
+    amb = track = None
+    if req.get('assigned_ambulance_id'):
+        amb, track = await asyncio.gather(
+            AsyncAmbulanceModel.find_by_id(db, str(req['assigned_ambulance_id'])),
+            AsyncLocationTrackModel.get_track_for_request(db, str(req['_id'])),
+        )
+    return {'request': _request_payload(req, amb, track)}
+
+
+async def _assigned_details_body(db, ambulance_id):
+    req = await AsyncRequestModel.get_active_for_ambulance(db, ambulance_id)
+    if not req:
+        return {'assigned': None, 'message': 'No active assignment'}
+    user, amb = await asyncio.gather(
+        AsyncUserModel.find_by_id(db, str(req['user_id'])),
+        AsyncAmbulanceModel.find_by_id(db, ambulance_id),
+    )
+    return {'assigned': _assigned_payload(req, user, amb)}
+
+
+async def user_my_request(request):
+    user_id, denied = _authenticate(request, 'user')
+    if denied:
+        return denied
+    try:
+        return JSONResponse(await _my_request_body(request.app.state.db, user_id))
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def ambulance_my_requests(request):
+    ambulance_id, denied = _authenticate(request, 'ambulance')
+    if denied:
+        return denied
+    db = request.app.state.db
+    try:
+        include_archive = request.query_params.get('include_archive', 'false').lower() == 'true'
+        requests = await AsyncRequestModel.get_by_ambulance(db, ambulance_id, include_archive)
+        users = await asyncio.gather(*(AsyncUserModel.find_by_id(db, str(r['user_id'])) for r in requests))
+        out = [_request_row(req, user) for req, user in zip(requests, users)]
+        return JSONResponse({'requests': out, 'count': len(out)})
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def ambulance_assigned_details(request):
+    ambulance_id, denied = _authenticate(request, 'ambulance')
+    if denied:
+        return denied
+    try:
+        return JSONResponse(await _assigned_details_body(request.app.state.db, ambulance_id))
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+_OBJECT_ID = re.compile(r'^[0-9a-f]{24}$')
+# Fields of a changed request / track that name the users and ambulances whose view it touches
+_REF_FIELDS = ('user_id', 'assigned_ambulance_id', 'request_id', 'ambulance_id')
+
+
+def _ids_in(body):
+    """Every document id (id / *_id field holding an ObjectId string) in a response body."""
+    out = set()
+    if isinstance(body, dict):
+        for key, value in body.items():
+            if (key == 'id' or key.endswith('_id')) and isinstance(value, str) and _OBJECT_ID.match(value):
+                out.add(value)
+            else:
+                out |= _ids_in(value)
+    elif isinstance(body, list):
+        for value in body:
+            out |= _ids_in(value)
+    return out
+
+
+class _StreamWaiters:
+    """
+    SSE streams parked until a document they show changes. A stream's topics are document id
+    strings (the caller and every id in its last body); the event bus thread wakes the ones
+    an event names.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = {}   # id -> set of (loop, asyncio.Event)
+
+    def park(self, waiter, topics, previous=()):
+        with self._lock:
+            for topic in previous:
+                self._topics.get(topic, set()).discard(waiter)
+                if not self._topics.get(topic):
+                    self._topics.pop(topic, None)
+            for topic in topics:
+                self._topics.setdefault(topic, set()).add(waiter)
+
+    def on_change(self, db, event):
+        with self._lock:
+            if event.op == RESET:
+                waiters = set().union(*self._topics.values())
+            else:
+                topics = {str(event.id)} | {str(event.doc[f]) for f in _REF_FIELDS if event.doc and event.doc.get(f)}
+                waiters = set().union(*(self._topics.get(t, ()) for t in topics))
+        for loop, wake in waiters:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass   # loop closed: the stream is gone
+
+
+_waiters = _StreamWaiters()
+event_bus.subscribe(_waiters.on_change)
+
+
+async def stream_updates(request):
+    """
+    SSE: `event: update` with the /user/my-request (role user) or /ambulance/assigned-details
+    (role ambulance) body whenever it changes; a comment line every SSE_KEEPALIVE_SECONDS.
+    The stream closes after SSE_MAX_SECONDS and EventSource reconnects (re-checking the token).
+    The body is re-read on every change event naming one of its documents, else every
+    SSE_POLL_SECONDS while the event bus is down.
+    """
+    role = request.query_params.get('role', 'user')
+    if role not in ('user', 'ambulance'):
+        return JSONResponse({'error': 'role must be user or ambulance'}, status_code=400)
+    identity, denied = _authenticate(request, role)
+    if denied:
+        return denied
+    db = request.app.state.db
+    load = _my_request_body if role == 'user' else _assigned_details_body
+
+    async def events():
+        last = None
+        last_sent = time.monotonic()
+        deadline = last_sent + Config.SSE_MAX_SECONDS
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        topics = set()
+        yield f"retry: {int(Config.SSE_POLL_SECONDS * 1000)}\n\n"
+        try:
+            while time.monotonic() < deadline and not await request.is_disconnected():
+                waiter[1].clear()
+                try:
+                    body = await load(db, identity)
+                except Exception as e:
+                    body = {'error': str(e)}
+                current = {identity} | _ids_in(body)
+                if current != topics:
+                    _waiters.park(waiter, current, topics)
+                    topics = current
+                payload = _dumps(body)
+                if payload != last:
+                    last = payload
+                    last_sent = time.monotonic()
+                    yield f"event: update\ndata: {payload}\n\n"
+                elif time.monotonic() - last_sent >= Config.SSE_KEEPALIVE_SECONDS:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+                wait = Config.SSE_KEEPALIVE_SECONDS if event_bus.live else Config.SSE_POLL_SECONDS
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), max(0.0, min(wait, deadline - time.monotonic())))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            _waiters.park(waiter, (), topics)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+routes = [
+    Route('/sensor/submit', sensor_submit, methods=['POST']),
+    Route('/ambulance/update-location', ambulance_update_location, methods=['POST']),
+    Route('/user/my-request', user_my_request, methods=['GET']),
+    Route('/ambulance/my-requests', ambulance_my_requests, methods=['GET']),
+    Route('/ambulance/assigned-details', ambulance_assigned_details, methods=['GET']),
+    Route('/stream/updates', stream_updates, methods=['GET']),
+]
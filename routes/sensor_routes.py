@@ -1,14 +1,16 @@
 """Sensor data and accident detection routes."""
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import get_jwt_identity
 from models.user_model import UserModel
 from models.sensor_reading_model import SensorReadingModel
 from models.accident_alert_model import AccidentAlertModel
 from models.request_model import RequestModel
-from models.ambulance_model import AmbulanceModel
 from utils.auth import role_required
-from utils.distance import find_nearest_ambulance
+from utils.idempotency import idempotent
+from services.dispatch import dispatch
 from ml.accident_detector import predict, extract_features
+from ml import detection_prefilter
+from config import Config
 
 sensor_bp = Blueprint('sensor', __name__)
 
@@ -38,18 +40,67 @@ def _get_trigger_reasons(readings):
     return reasons
 
 
+def _dispatch_detected(db, user_id, lat, lng, readings, shake_stop_flag):
+    """
+    Detector fired: apply the blacklist and cooldown checks, then create the auto-detected
+    request and assign the nearest ambulance. Returns (body, status); shared with the ASGI app.
+    """
+    if UserModel.is_blacklisted(db, user_id):
+        return {'error': 'Account blacklisted'}, 403
+
+    from datetime import timedelta
+    from bson import ObjectId
+    from utils.time_utils import get_ist_now_naive
+    recent = db.requests.find_one({
+        'user_id': ObjectId(user_id),
+        'source': 'auto_detected',
+        'status': {'$in': ['pending', 'assigned', 'to_hospital']},
+        'created_at': {'$gte': get_ist_now_naive() - timedelta(seconds=ALERT_COOLDOWN_SECONDS)}
+    })
+    if recent:
+        return {'message': 'Cooldown active', 'accident_detected': True}, 200
+
+    # No verification calls - directly create request and assign ambulance
+    reasons = _get_trigger_reasons(readings)
+    if shake_stop_flag:
+        reasons.append('shake_stop_detected_by_frontend')
+
+    request_id = RequestModel.create_request(db, user_id, lat, lng, source='auto_detected')
+    UserModel.set_location(db, user_id, lat, lng)
+
+    # Clean up old sensor readings after emergency is created
+    SensorReadingModel.cleanup_old(db, max_age_seconds=10)
+    detection_prefilter.forget(user_id)
+
+    sent = dispatch(db, request_id, lat, lng)
+    offer_mode = Config.DISPATCH_MODE == 'offer'
+
+    body = {
+        'message': 'Accident detected. Emergency request created and ambulance assigned.',
+        'accident_detected': True,
+        'request_id': str(request_id),
+        'ambulance_assigned': bool(sent) and not offer_mode,
+        'trigger_reasons': reasons,
+    }
+    if offer_mode:
+        body['message'] = 'Accident detected. Emergency request created and offered to nearby ambulances.'
+        body['offers_sent'] = len(sent)
+    return body, 201
+
+
 def init_sensor_routes(app, db):
     sensor_bp.db = db
     app.register_blueprint(sensor_bp, url_prefix='/sensor')
 
 
 @sensor_bp.route('/submit', methods=['POST'])
-@jwt_required()
 @role_required('user')
+@idempotent('sensor-submit', lambda: sensor_bp.db)
 def submit_readings():
     """
     Submit sensor data. If accident detected, create request and assign ambulance (no verification calls).
     Accepts shake_stop_detected flag from frontend for demo-mode detection.
+    Retries carrying the same Idempotency-Key get the first response back and store no new reading.
     """
     try:
         user_id = get_jwt_identity()
@@ -70,7 +121,9 @@ def submit_readings():
         shake_stop_flag = bool(data.get('shake_stop_detected', False))
         peak_accel = data.get('peak_accel', 0)
 
-        SensorReadingModel.add(
+        # Newest stored reading before this one: the prefilter may only skip if it saw it
+        previous_id = SensorReadingModel.latest_id(sensor_bp.db, user_id) if Config.SENSOR_PREFILTER_ENABLED else None
+        reading = SensorReadingModel.add(
             sensor_bp.db, user_id,
             lat=lat, lng=lng,
             speed_kmh=data.get('speed_kmh'),
@@ -78,7 +131,21 @@ def submit_readings():
             gyro_x=data.get('gyro_x'), gyro_y=data.get('gyro_y'), gyro_z=data.get('gyro_z'),
         )
 
+        # Idle/cruising stream far below every rule: skip the window read and the model
+        if Config.SENSOR_PREFILTER_ENABLED and not detection_prefilter.should_evaluate(
+            user_id, previous_id, reading, shake_stop_flag
+        ):
+            return jsonify({
+                'message': 'Reading saved',
+                'accident_detected': False,
+                'probability': 0.0,
+                'shake_stop_flag': shake_stop_flag,
+                'prefiltered': True,
+            }), 200
+
         readings = SensorReadingModel.get_recent_for_user(sensor_bp.db, user_id)
+        if Config.SENSOR_PREFILTER_ENABLED:
+            detection_prefilter.seed(user_id, readings)
         if len(readings) < 1 and not shake_stop_flag:
             return jsonify({'message': 'Reading saved', 'accident_detected': False}), 200
 
@@ -93,50 +160,13 @@ def submit_readings():
                 'readings_count': len(readings),
             }), 200
 
-        if UserModel.is_blacklisted(sensor_bp.db, user_id):
-            return jsonify({'error': 'Account blacklisted'}), 403
-
-        from datetime import timedelta
-        from bson import ObjectId
-        from utils.time_utils import get_ist_now_naive
-        recent = sensor_bp.db.requests.find_one({
-            'user_id': ObjectId(user_id),
-            'source': 'auto_detected',
-            'status': {'$in': ['pending', 'assigned', 'to_hospital']},
-            'created_at': {'$gte': get_ist_now_naive() - timedelta(seconds=ALERT_COOLDOWN_SECONDS)}
-        })
-        if recent:
-            return jsonify({'message': 'Cooldown active', 'accident_detected': True}), 200
-
-        # No verification calls - directly create request and assign ambulance
-        reasons = _get_trigger_reasons(readings)
-        if shake_stop_flag:
-            reasons.append('shake_stop_detected_by_frontend')
-
-        request_id = RequestModel.create_request(sensor_bp.db, user_id, lat, lng, source='auto_detected')
-        UserModel.update_location(sensor_bp.db, user_id, lat, lng)
-
-        # Clean up old sensor readings after emergency is created
-        SensorReadingModel.cleanup_old(sensor_bp.db, max_age_seconds=10)
-
-        ambulances = AmbulanceModel.get_all_with_location(sensor_bp.db, exclude_assigned=True)
-        nearest = find_nearest_ambulance(ambulances, lat, lng, prefer_active=True)
-        if nearest:
-            RequestModel.assign_ambulance(sensor_bp.db, str(request_id), str(nearest['_id']))
-
-        return jsonify({
-            'message': 'Accident detected. Emergency request created and ambulance assigned.',
-            'accident_detected': True,
-            'request_id': str(request_id),
-            'ambulance_assigned': bool(nearest),
-            'trigger_reasons': reasons,
-        }), 201
+        body, status = _dispatch_detected(sensor_bp.db, user_id, lat, lng, readings, shake_stop_flag)
+        return jsonify(body), status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @sensor_bp.route('/submit-batch', methods=['POST'])
-@jwt_required()
 @role_required('user')
 def submit_batch():
     """Submit multiple readings at once (e.g. from buffered mobile data)."""
@@ -169,7 +199,6 @@ def submit_batch():
 
 
 @sensor_bp.route('/status', methods=['GET'])
-@jwt_required()
 @role_required('user')
 def alert_status():
     """Get current accident alert status for user."""
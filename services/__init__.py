@@ -0,0 +1,7 @@
+"""
+Background services that run inside the web workers.
+
+dispatch.py assigns or offers a pending request to ambulances (Config.DISPATCH_MODE).
+escalation.py retries dispatch for pending requests with a widening search (one owner
+across all workers, elected through a MongoDB lease).
+"""
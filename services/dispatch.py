@@ -0,0 +1,81 @@
+"""
+Dispatching a pending request to ambulances, in one of two modes (Config.DISPATCH_MODE):
+
+  direct  assign the best eligible ambulance outright and SMS the driver (the default).
+  offer   send time-boxed offers (DISPATCH_OFFER_TIMEOUT_SECONDS) to the DISPATCH_OFFER_FANOUT
+          best eligible ambulances at once. The first driver to accept claims the request
+          atomically (RequestModel.accept_offer) and the other offers are cancelled. When
+          every offer is declined or the round times out, the escalation scheduler
+          (services/escalation.py) sends a new round to ambulances not offered yet.
+
+Offer mode relies on the escalation scheduler for timeouts, so keep ESCALATION_ENABLED on.
+Offer-to-accept latency is rolled up as the 'ack' metric, and time to a confirmed unit is
+'assign' (GET /admin/response-times).
+"""
+from config import Config
+from utils import metrics
+from utils.region import near_filter
+
+# Direct mode tries the next best ambulance when a concurrent dispatch claimed one first
+DIRECT_CANDIDATES = 3
+_stats = {'assigned': 0, 'offer_rounds': 0, 'offers_sent': 0, 'no_candidates': 0, 'claim_conflicts': 0}
+
+
+def offered_ambulance_ids(req):
+    return {o['ambulance_id'] for o in (req or {}).get('offers') or []}
+
+
+def dispatch(db, request_id, lat, lng, requested_type=None, ambulances=None, exclude=(),
+             prefer_within_km=None, send_notification=True):
+    """
+    Dispatch a pending request per DISPATCH_MODE. ambulances: candidate docs (default: every
+    free ambulance with a location); exclude: ambulance ids to skip; prefer_within_km: rank
+    those within this distance first (see rank_ambulances). Returns the ambulances assigned
+    (direct, at most one) or offered (offer); empty when nothing was sent.
+    """
+    from models.ambulance_model import AmbulanceModel
+    from models.request_model import RequestModel
+    from utils.distance import rank_ambulances
+
+    offer_mode = Config.DISPATCH_MODE == 'offer'
+
+    def best(candidates):
+        if exclude:
+            candidates = [a for a in candidates if a['_id'] not in exclude]
+        return rank_ambulances(
+            candidates, lat, lng, prefer_active=True, requested_type=requested_type,
+            prefer_within_km=prefer_within_km,
+        )[:Config.DISPATCH_OFFER_FANOUT if offer_mode else DIRECT_CANDIDATES]
+
+    regional = ambulances is None and near_filter(lat, lng)
+    if ambulances is None:
+        # SHARDED_DISPATCH: the regions around the request first (one shard), then everywhere
+        ambulances = AmbulanceModel.get_all_with_location(db, exclude_assigned=True, near=(lat, lng))
+    ranked = best(ambulances)
+    if not ranked and regional:
+        ranked = best(AmbulanceModel.get_all_with_location(db, exclude_assigned=True))
+    if not ranked:
+        _stats['no_candidates'] += 1
+        return []
+
+    if offer_mode:
+        req = RequestModel.offer(db, request_id, ranked, Config.DISPATCH_OFFER_TIMEOUT_SECONDS, send_notification)
+        if req is None:
+            return []
+        _stats['offer_rounds'] += 1
+        _stats['offers_sent'] += len(ranked)
+        return ranked
+
+    for amb in ranked:
+        # None when another dispatch claimed this ambulance first (or the request is no longer pending)
+        req = RequestModel.assign_ambulance(
+            db, str(request_id), str(amb['_id']), send_notification=send_notification, require_pending=True
+        )
+        if req is not None:
+            _stats['assigned'] += 1
+            return [amb]
+        _stats['claim_conflicts'] += 1
+    return []
+
+
+metrics.register('dispatch', lambda: dict(_stats, mode=Config.DISPATCH_MODE))
@@ -0,0 +1,253 @@
+"""
+Escalation scheduler for requests left pending (no free ambulance when they came in).
+
+One process at a time owns the queue: every worker runs the loop, but only the holder of
+the 'escalation' lease (utils/lease.py) works it. The owner keeps a heap of
+(next attempt time, request id) fed from the pending requests in MongoDB every
+ESCALATION_SYNC_SECONDS, and on each due attempt:
+
+  - retries dispatch with the same candidates as the first dispatch (any distance, any type
+    when none of the requested type is free), so a free ambulance is never passed over,
+  - ranks ambulances within a radius that grows by ESCALATION_RADIUS_GROWTH per attempt
+    (ESCALATION_BASE_RADIUS_KM .. ESCALATION_MAX_RADIUS_KM) ahead of the farther ones,
+  - prefers the requested ambulance type until the request is ESCALATION_RELAX_TYPE_SECONDS
+    old, then ranks every type by distance alone,
+  - backs off between attempts (doubling from ESCALATION_FIRST_RETRY_SECONDS up to
+    ESCALATION_MAX_RETRY_SECONDS),
+  - flags the request and alerts admins once it has waited ESCALATION_SLA_SECONDS.
+
+In offer mode (services/dispatch.py) an attempt sends a round of offers instead, to
+ambulances not offered yet. The loop also closes rounds that timed out or were all
+declined, and queues the next round at once.
+
+Attempt state lives on the request (`escalation` field), so a new owner resumes where the
+old one stopped. Assignment only succeeds while the request is still pending, so a stale
+owner or a concurrent route can never assign one request twice.
+"""
+import atexit
+import heapq
+import threading
+from datetime import timedelta
+
+from bson import ObjectId
+
+from config import Config
+from utils import metrics
+from utils.db import dispatch_collection
+from utils.lease import Lease
+from utils.time_utils import get_ist_now_naive
+
+LEASE_NAME = 'escalation'
+_PENDING_FIELDS = {'location': 1, 'requested_ambulance_type': 1, 'created_at': 1, 'unassigned_at': 1,
+                   'escalation': 1, 'user_id': 1, 'source': 1, 'offers': 1, 'offer_expires_at': 1}
+
+
+def radius_for(attempt):
+    return min(Config.ESCALATION_BASE_RADIUS_KM * Config.ESCALATION_RADIUS_GROWTH ** (attempt - 1),
+               Config.ESCALATION_MAX_RADIUS_KM)
+
+
+def retry_delay(attempt):
+    return min(Config.ESCALATION_FIRST_RETRY_SECONDS * 2 ** (attempt - 1), Config.ESCALATION_MAX_RETRY_SECONDS)
+
+
+def _waiting_since(req):
+    """Requests put back to pending by an ambulance issue wait from then, not from creation."""
+    return req.get('unassigned_at') or req['created_at']
+
+
+class EscalationScheduler:
+    def __init__(self):
+        self._lease = Lease(LEASE_NAME, Config.ESCALATION_LEASE_SECONDS)
+        self._heap = []      # (due_at, request id)
+        self._due = {}       # request id -> due_at of its live heap entry
+        self._synced_at = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self.stats_counts = {'attempts': 0, 'assigned': 0, 'offer_rounds': 0, 'rounds_closed': 0,
+                             'sla_alerts': 0, 'errors': 0}
+
+    # --- lifecycle ----------------------------------------------------------------
+
+    def start(self, db):
+        """Start the background loop once per process (safe to call on every request)."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(db,), name='escalation', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop, db)
+
+    def stop(self, db):
+        self._stop.set()
+        try:
+            self._lease.release(db)
+        except Exception:
+            pass
+
+    def _run(self, db):
+        while not self._stop.wait(Config.ESCALATION_TICK_SECONDS):
+            try:
+                self.tick(db)
+            except Exception as e:
+                self.stats_counts['errors'] += 1
+                print(f"Escalation tick failed: {e}")
+
+    def tick(self, db, now=None):
+        was_leader = self._lease.held
+        if not self._lease.acquire(db):
+            if was_leader:
+                self._heap, self._due, self._synced_at = [], {}, None
+            return
+        now = now or get_ist_now_naive()
+        if self._synced_at is None or (now - self._synced_at).total_seconds() >= Config.ESCALATION_SYNC_SECONDS:
+            self._sync(db, now)
+        if Config.DISPATCH_MODE == 'offer':
+            self._close_offer_rounds(db, now)
+        self._run_due(db, now)
+
+    # --- queue --------------------------------------------------------------------
+
+    def _schedule(self, request_id, due_at):
+        if self._due.get(request_id) == due_at:
+            return
+        self._due[request_id] = due_at
+        heapq.heappush(self._heap, (due_at, request_id))
+
+    def _sync(self, db, now):
+        """Queue every pending request not queued yet; forget the ones no longer pending."""
+        pending = set()
+        for req in db.requests.find({'status': 'pending'}, {'escalation': 1, 'created_at': 1, 'unassigned_at': 1}):
+            key = str(req['_id'])
+            pending.add(key)
+            if key in self._due:
+                continue
+            state = req.get('escalation') or {}
+            due = state.get('next_at') or _waiting_since(req) + timedelta(seconds=Config.ESCALATION_FIRST_RETRY_SECONDS)
+            self._schedule(key, due)
+        for key in [k for k in self._due if k not in pending]:
+            del self._due[key]   # its heap entry is skipped when popped
+        self._synced_at = now
+
+    def _close_offer_rounds(self, db, now):
+        from models.request_model import RequestModel
+        for req in db.requests.find({'status': 'pending', 'offer_expires_at': {'$lte': now}}, {'offer_expires_at': 1}):
+            if RequestModel.expire_offers(db, req['_id'], req['offer_expires_at']):
+                self.stats_counts['rounds_closed'] += 1
+                self._schedule(str(req['_id']), now)
+
+    def _pop_due(self, now):
+        out = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, key = heapq.heappop(self._heap)
+            if self._due.get(key) == due_at:
+                del self._due[key]
+                out.append(key)
+        return out
+
+    def _run_due(self, db, now):
+        keys = self._pop_due(now)
+        if not keys:
+            return
+        from models.ambulance_model import AmbulanceModel
+        reqs = list(db.requests.find(
+            {'_id': {'$in': [ObjectId(k) for k in keys]}, 'status': 'pending'}, _PENDING_FIELDS
+        ))
+        if not reqs:
+            return
+        # One ambulance read per tick however many requests are due, oldest request first
+        free = AmbulanceModel.get_all_with_location(db, exclude_assigned=True)
+        for req in sorted(reqs, key=_waiting_since):
+            try:
+                taken = {a['_id'] for a in self._attempt(db, req, free, now)}
+                if taken:
+                    free = [a for a in free if a['_id'] not in taken]
+            except Exception as e:
+                self.stats_counts['errors'] += 1
+                print(f"Escalation attempt for {req['_id']} failed: {e}")
+
+    # --- one attempt --------------------------------------------------------------
+
+    def _attempt(self, db, req, free, now):
+        """Try to dispatch req; returns the ambulances assigned/offered (and reschedules otherwise)."""
+        from services.dispatch import dispatch, offered_ambulance_ids
+
+        key = str(req['_id'])
+        if req.get('offer_expires_at') and req['offer_expires_at'] > now:
+            # A round is still open; look again when it closes
+            self._schedule(key, req['offer_expires_at'])
+            return []
+        state = req.get('escalation') or {}
+        attempt = state.get('attempts', 0) + 1
+        waited = (now - _waiting_since(req)).total_seconds()
+        radius = radius_for(attempt)
+        relaxed = waited >= Config.ESCALATION_RELAX_TYPE_SECONDS
+        loc = req.get('location') or {}
+        self.stats_counts['attempts'] += 1
+
+        sent = []
+        if loc.get('lat') is not None and loc.get('lng') is not None:
+            sent = dispatch(
+                db, key, float(loc['lat']), float(loc['lng']),
+                requested_type=None if relaxed else req.get('requested_ambulance_type'), ambulances=free,
+                exclude=offered_ambulance_ids(req), prefer_within_km=radius,
+            )
+        update = {
+            'escalation.attempts': attempt,
+            'escalation.radius_km': radius,
+            'escalation.type_relaxed': relaxed,
+            'escalation.last_attempt_at': now,
+        }
+        if sent and Config.DISPATCH_MODE != 'offer':
+            update['escalation.next_at'] = None
+            dispatch_collection(db).update_one({'_id': req['_id']}, {'$set': update})
+            self.stats_counts['assigned'] += 1
+            return sent
+
+        # Nothing assigned yet: retry after the backoff, or when the offer round closes
+        if sent:
+            self.stats_counts['offer_rounds'] += 1
+            next_at = now + timedelta(seconds=Config.DISPATCH_OFFER_TIMEOUT_SECONDS)
+        else:
+            next_at = now + timedelta(seconds=retry_delay(attempt))
+        update['escalation.next_at'] = next_at
+        dispatch_collection(db).update_one({'_id': req['_id'], 'status': 'pending'}, {'$set': update})
+        self._schedule(key, next_at)
+        if waited >= Config.ESCALATION_SLA_SECONDS and not state.get('sla_breached_at'):
+            self._sla_breached(db, req, now, waited)
+        return sent
+
+    def _sla_breached(self, db, req, now, waited):
+        from models.request_event_model import RequestEventModel
+        from utils.twilio_sms import send_sms, normalize_phone
+
+        # Conditional so a takeover mid-attempt cannot alert twice
+        res = dispatch_collection(db).update_one(
+            {'_id': req['_id'], 'escalation.sla_breached_at': None},
+            {'$set': {'escalation.sla_breached_at': now}}
+        )
+        if not res.modified_count:
+            return
+        self.stats_counts['sla_alerts'] += 1
+        RequestEventModel.record(db, req, 'sla_breached', at=now)
+        loc = req.get('location') or {}
+        message = (f"⚠️ Request {req['_id']} unassigned for {int(waited // 60)} min "
+                   f"(no free ambulance) at {loc.get('lat', 0):.4f}, {loc.get('lng', 0):.4f}.")
+        print(message)
+        for phone in Config.ESCALATION_ALERT_PHONES:
+            send_sms(normalize_phone(phone), message)
+
+    def stats(self):
+        return dict(
+            self.stats_counts,
+            leader=self._lease.held,
+            queued=len(self._due),
+            next_due=min(self._due.values()).isoformat() if self._due else None,
+        )
+
+
+scheduler = EscalationScheduler()
+metrics.register('escalation', scheduler.stats)
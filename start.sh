@@ -1,7 +1,7 @@
 #!/bin/bash
 # Startup script for production
-# Cleans up expired OTPs and starts gunicorn
+# Runs one-time maintenance (expired OTP cleanup) once, then starts gunicorn
 
-python -c "from app import app, mongo; from models.otp_model import OTPModel; app.app_context().push(); OTPModel.cleanup_expired_otps(mongo.db)"
+flask --app app maintenance || echo "Maintenance failed; starting anyway"
 
 gunicorn app:app --bind 0.0.0.0:$PORT --workers 2 --timeout 120
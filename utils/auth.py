@@ -1,19 +1,113 @@
+"""
+Token verification for the routes.
+
+role_required verifies the access token on its own (no @jwt_required() needed above it).
+The first request with a token goes through flask_jwt_extended; the verified header and
+claims are then kept in claims_cache, keyed by the raw token, until the token expires, so
+later requests with the same token skip the signature check and JSON decoding. Only access
+tokens that passed verification are cached. get_jwt() / get_jwt_identity() work as usual.
+
+verified_claims() gives the ASGI routes and the load shedder the same cache. It decodes
+through flask_jwt_extended.decode_token in the app registered with init_auth(), so every
+path accepts exactly the tokens JWTManager does (algorithms, leeway, audience, issuer,
+identity claim).
+"""
+import time
 from functools import wraps
-from flask import jsonify
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
+
+import jwt
+from flask import g, has_app_context, jsonify, request
+from flask_jwt_extended import decode_token, verify_jwt_in_request, get_jwt_identity, get_jwt, get_jwt_header
+from flask_jwt_extended.exceptions import JWTExtendedException
+
+from config import Config
+from utils import metrics
+from utils.cache import TTLCache
+
+claims_cache = TTLCache(maxsize=Config.JWT_CLAIMS_CACHE_SIZE, ttl=Config.JWT_ACCESS_TOKEN_EXPIRES.total_seconds())
+_jwt_app = None
+
+
+def init_auth(app):
+    """Use app's JWTManager settings for tokens verified outside a Flask request."""
+    global _jwt_app
+    _jwt_app = app
+
+
+def identity_of(claims):
+    """The identity in verified claims (JWT_IDENTITY_CLAIM, 'sub' by default)."""
+    return claims.get(_jwt_app.config['JWT_IDENTITY_CLAIM'] if _jwt_app else 'sub')
+
+
+def bearer_token(authorization):
+    return authorization[7:] if authorization and authorization.startswith('Bearer ') else None
+
+
+def _remember(token, header, claims):
+    if claims.get('type', 'access') != 'access' or identity_of(claims) is None:
+        return
+    ttl = claims['exp'] - time.time() if 'exp' in claims else None
+    if ttl is None or ttl > 0:
+        claims_cache.set(token, (header, claims), ttl=ttl)
+
+
+def verified_claims(token):
+    """Claims of a valid token (cached for access tokens); raises jwt.InvalidTokenError otherwise."""
+    cached = claims_cache.get(token)
+    if cached is not None:
+        return cached[1]
+    if has_app_context():
+        claims = _decode(token)
+    else:
+        with _jwt_app.app_context():
+            claims = _decode(token)
+    _remember(token, jwt.get_unverified_header(token), claims)
+    return claims
+
+
+def _decode(token):
+    try:
+        return decode_token(token)
+    except JWTExtendedException as e:   # e.g. a missing identity claim
+        raise jwt.InvalidTokenError(str(e)) from e
+
+
+def _restore_jwt_context(header, claims):
+    """
+    What verify_jwt_in_request() stores, so get_jwt() / get_jwt_identity() read a cached
+    token. flask_jwt_extended has no public setter: these g attributes are its private
+    storage as of the pinned 4.6.0 (requirements.txt); check them when upgrading.
+    """
+    g._jwt_extended_jwt_user = None
+    g._jwt_extended_jwt_header = header
+    g._jwt_extended_jwt = claims
+    g._jwt_extended_jwt_location = 'headers'
+
+
+def _verify():
+    token = bearer_token(request.headers.get('Authorization', ''))
+    cached = claims_cache.get(token) if token else None
+    if cached is None:
+        # Full verification; raises flask_jwt_extended's errors (401/422 via JWTManager)
+        if verify_jwt_in_request() is not None and token:
+            _remember(token, get_jwt_header(), get_jwt())
+        return get_jwt()
+    header, claims = cached
+    _restore_jwt_context(header, claims)
+    return claims
+
 
 def role_required(required_role):
-    """Decorator to check user role"""
+    """Decorator to verify the access token and check user role"""
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            verify_jwt_in_request()
-            claims = get_jwt()
+            claims = _verify()
             role = claims.get('role')
-            
+
             if role != required_role:
                 return jsonify({'error': 'Insufficient permissions'}), 403
-            
+
             return f(*args, **kwargs)
         return decorated_function
     return decorator
@@ -26,3 +120,6 @@ def get_current_role():
     """Get current user role from JWT"""
     claims = get_jwt()
     return claims.get('role')
+
+
+metrics.register('jwt_claims_cache', claims_cache.stats)
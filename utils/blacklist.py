@@ -0,0 +1,85 @@
+"""
+In-memory set of blacklisted user ids, so the blacklist check on the emergency and sensor
+paths is a set lookup instead of a profile read.
+
+Each worker reloads the set from MongoDB every BLACKLIST_SYNC_SECONDS (one indexed query for
+the ids only) and adds a user as soon as this worker blacklists them. Changes made on other
+workers arrive through the event bus (utils/event_bus.py) as they happen; without it a user
+blacklisted elsewhere is refused here within one sync interval.
+"""
+import threading
+import time
+
+from config import Config
+from utils import metrics
+from utils.event_bus import RESET, event_bus
+
+# The rule UserModel.add_demerit_point enforces
+BLACKLIST_FILTER = {'$or': [{'is_blacklisted': True}, {'demerit_points': {'$gte': 2}}]}
+
+
+class Blacklist:
+    def __init__(self):
+        self._ids = frozenset()
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.syncs = 0
+        self.checks = 0
+
+    def _stale(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at >= Config.BLACKLIST_SYNC_SECONDS
+
+    def sync(self, db):
+        ids = frozenset(str(doc['_id']) for doc in db.users.find(BLACKLIST_FILTER, {'_id': 1}))
+        with self._lock:
+            self._ids = ids
+            self._synced_at = time.monotonic()
+            self.syncs += 1
+
+    def contains(self, db, user_id):
+        self.checks += 1
+        if self._stale():
+            # One thread reloads; the others keep using the current set (unless there is none yet)
+            if self._sync_lock.acquire(blocking=self._synced_at is None):
+                try:
+                    if self._stale():
+                        self.sync(db)
+                finally:
+                    self._sync_lock.release()
+        return str(user_id) in self._ids
+
+    def add(self, user_id):
+        with self._lock:
+            self._ids = self._ids | {str(user_id)}
+
+    def discard(self, user_id):
+        with self._lock:
+            self._ids = self._ids - {str(user_id)}
+
+    def on_change(self, db, event):
+        """Event bus subscriber for users: apply the rule to the changed document."""
+        if event.op == RESET:
+            self._synced_at = None
+        elif event.doc is not None and (event.doc.get('is_blacklisted') or (event.doc.get('demerit_points') or 0) >= 2):
+            self.add(event.id)
+        else:
+            self.discard(event.id)
+
+    def stats(self):
+        return {
+            'size': len(self._ids),
+            'syncs': self.syncs,
+            'checks': self.checks,
+            'sync_age_seconds': round(time.monotonic() - self._synced_at, 1) if self._synced_at else None,
+        }
+
+    @staticmethod
+    def ensure_indexes(db):
+        db.users.create_index('is_blacklisted', sparse=True)
+        db.users.create_index('demerit_points', sparse=True)
+
+
+blacklist = Blacklist()
+metrics.register('blacklist', blacklist.stats)
+event_bus.subscribe(blacklist.on_change, ['users'])
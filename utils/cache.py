@@ -0,0 +1,239 @@
+"""
+Small caches for hot read paths.
+
+TTLCache is a thread-safe LRU with per-entry expiry and hit/miss counters.
+profile_cache holds user/ambulance documents for a few seconds so the request path
+does not re-read the same profile several times; model write methods invalidate it.
+
+By default each worker keeps its own in-memory copy. Writes on other workers and nodes
+reach it through the event bus (utils/event_bus.py), which drops the changed profile, so
+the TTL only bounds staleness while the bus is down. Set PROFILE_CACHE_URL to a redis://
+URL to share one cache between workers and nodes (writes then invalidate everywhere);
+'memory://' or empty selects the in-memory stand-in.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from config import Config
+from utils import metrics
+from utils.event_bus import RESET, event_bus
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize=10000, ttl=5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or item[0] <= now:
+                if item is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class LocalBackend:
+    """In-memory stand-in for the shared cache service (per worker)."""
+    name = 'memory'
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize, ttl)
+
+    def get(self, key):
+        doc = self._cache.get(key)
+        return dict(doc) if doc is not None else None
+
+    def set(self, key, doc):
+        self._cache.set(key, doc)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class RedisBackend:
+    """Shared cache service; documents are stored BSON-encoded with a TTL."""
+    name = 'redis'
+
+    def __init__(self, url, ttl):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.2)
+        self._ttl_ms = int(ttl * 1000)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key):
+        import bson
+        try:
+            raw = self._client.get(key)
+        except Exception:
+            self.errors += 1
+            return None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bson.decode(raw)
+
+    def set(self, key, doc):
+        import bson
+        try:
+            self._client.set(key, bson.encode(doc), px=self._ttl_ms)
+        except Exception:
+            self.errors += 1
+
+    def delete(self, key):
+        try:
+            self._client.delete(key)
+        except Exception:
+            self.errors += 1
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'ttl_seconds': self._ttl_ms / 1000,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def _make_backend(url, maxsize, ttl):
+    if url and not url.startswith('memory://'):
+        return RedisBackend(url, ttl)
+    return LocalBackend(maxsize, ttl)
+
+
+class ProfileCache:
+    """Read-through cache of user/ambulance documents keyed by (db name, kind, id)."""
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self.enabled = Config.PROFILE_CACHE_TTL_SECONDS > 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = _make_backend(
+                Config.PROFILE_CACHE_URL, Config.PROFILE_CACHE_MAX_ENTRIES, Config.PROFILE_CACHE_TTL_SECONDS
+            )
+        return self._backend
+
+    def use_backend(self, backend):
+        """Swap the backend (e.g. LocalBackend in place of the shared service)."""
+        self._backend = backend
+
+    @staticmethod
+    def _key(db, kind, doc_id):
+        return f"profile:{db.name}:{kind}:{doc_id}"
+
+    def get_or_load(self, db, kind, doc_id, loader):
+        if not self.enabled:
+            return loader()
+        key = self._key(db, kind, doc_id)
+        doc = self.backend.get(key)
+        if doc is not None:
+            return doc
+        doc = loader()
+        if doc is not None:
+            self.backend.set(key, doc)
+            return dict(doc)
+        return doc
+
+    async def aget_or_load(self, db, kind, doc_id, loader):
+        """get_or_load for the ASGI app: loader is a coroutine function (Motor query)."""
+        if not self.enabled:
+            return await loader()
+        key = self._key(db, kind, doc_id)
+        doc = self.backend.get(key)
+        if doc is not None:
+            return doc
+        doc = await loader()
+        if doc is not None:
+            self.backend.set(key, doc)
+            return dict(doc)
+        return doc
+
+    def put(self, db, kind, doc):
+        if self.enabled and doc is not None:
+            self.backend.set(self._key(db, kind, doc['_id']), dict(doc))
+
+    def invalidate(self, db, kind, doc_id):
+        if self.enabled:
+            self.backend.delete(self._key(db, kind, doc_id))
+
+    def on_change(self, db, event):
+        """Event bus subscriber: drop profiles written elsewhere (a shared backend needs nothing)."""
+        if not self.enabled or self.backend.name != LocalBackend.name:
+            return
+        if event.op == RESET:
+            self.backend.clear()
+        else:
+            self.backend.delete(self._key(db, _KINDS[event.collection], event.id))
+
+    def stats(self):
+        if not self.enabled:
+            return {'enabled': False}
+        return dict(self.backend.stats(), enabled=True, backend=self.backend.name)
+
+
+profile_cache = ProfileCache()
+metrics.register('profile_cache', profile_cache.stats)
+_KINDS = {'users': 'user', 'ambulances': 'ambulance'}
+event_bus.subscribe(profile_cache.on_change, _KINDS)
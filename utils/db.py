@@ -0,0 +1,255 @@
+"""
+MongoDB client settings, per-purpose handles and connection-pool metrics.
+
+client_options() is passed to every client (PyMongo(app) in app.py, Motor in asgi.py) so
+pool size, idle time, server selection and the per-operation timeoutMS are bounded and a
+stalled primary fails a request in seconds instead of hanging the worker.
+
+  reporting_db(db)          dashboards/history: reads go to secondaries when available
+  dispatch_collection(db)   request create/assign/transition writes: majority write concern
+
+pool_metrics (a pymongo ConnectionPoolListener) is exported as 'mongo_pool' in /admin/metrics.
+With DB_OP_COUNTING, command_counter attributes commands to the Flask endpoint running on
+the issuing thread ('db_ops' in /admin/metrics).
+LazyDatabase defers client creation (and mongodb+srv DNS lookups) from app boot to first use.
+"""
+import threading
+import time
+from collections import deque
+
+from pymongo import ReadPreference, WriteConcern
+from pymongo.monitoring import CommandListener, ConnectionPoolListener
+from pymongo.read_preferences import Secondary, SecondaryPreferred, Nearest
+
+from config import Config
+from utils import metrics
+
+_READ_PREFERENCES = {
+    'primary': lambda _s: ReadPreference.PRIMARY,
+    'primaryPreferred': lambda _s: ReadPreference.PRIMARY_PREFERRED,
+    'secondary': lambda s: Secondary(max_staleness=s),
+    'secondaryPreferred': lambda s: SecondaryPreferred(max_staleness=s),
+    'nearest': lambda s: Nearest(max_staleness=s),
+}
+
+
+def read_preference(name, max_staleness=-1):
+    if name not in _READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference {name!r}; expected one of {', '.join(_READ_PREFERENCES)}")
+    return _READ_PREFERENCES[name](max_staleness)
+
+
+def _write_concern(w):
+    return WriteConcern(w=int(w) if str(w).isdigit() else w)
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """Per-server pool counters plus a window of recent checkout wait times."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._pending = {}  # thread id -> checkout start (checkouts are synchronous per thread)
+        self._pools = {}
+        self._waits_ms = deque(maxlen=window)
+
+    def _pool(self, address):
+        key = f"{address[0]}:{address[1]}" if isinstance(address, tuple) else str(address)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                'open': 0, 'in_use': 0, 'waiting': 0, 'checkouts': 0,
+                'checkout_failures': {}, 'cleared': 0, 'created': 0, 'closed': 0,
+            }
+        return pool
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)['cleared'] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['open'] += 1
+            pool['created'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['open'] = max(pool['open'] - 1, 0)
+            pool['closed'] += 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._pending[threading.get_ident()] = time.perf_counter()
+            self._pool(event.address)['waiting'] += 1
+
+    def _finish_wait(self, pool):
+        started = self._pending.pop(threading.get_ident(), None)
+        pool['waiting'] = max(pool['waiting'] - 1, 0)
+        return (time.perf_counter() - started) * 1000 if started is not None else None
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            self._finish_wait(pool)
+            reason = str(event.reason)
+            pool['checkout_failures'][reason] = pool['checkout_failures'].get(reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            wait_ms = self._finish_wait(pool)
+            if wait_ms is not None:
+                self._waits_ms.append(wait_ms)
+            pool['in_use'] += 1
+            pool['checkouts'] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['in_use'] = max(pool['in_use'] - 1, 0)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            pools = {k: dict(v, checkout_failures=dict(v['checkout_failures'])) for k, v in self._pools.items()}
+
+        def pct(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 3) if waits else 0.0
+
+        return {
+            'max_pool_size': Config.MONGO_MAX_POOL_SIZE,
+            'wait_queue_timeout_ms': Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            'checkout_wait_ms': {'p50': pct(0.5), 'p95': pct(0.95), 'max': round(waits[-1], 3) if waits else 0.0},
+            'waiting': sum(p['waiting'] for p in pools.values()),
+            'in_use': sum(p['in_use'] for p in pools.values()),
+            'servers': pools,
+        }
+
+
+pool_metrics = PoolMetrics()
+metrics.register('mongo_pool', pool_metrics.stats)
+
+
+class CommandCounter(CommandListener):
+    """MongoDB commands per request, keyed by endpoint (sync Flask requests only)."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._endpoints = {}  # endpoint -> [requests, commands, {command name: count}]
+
+    def begin(self):
+        self._local.ops = {}
+
+    def end(self, endpoint):
+        ops = getattr(self._local, 'ops', None)
+        self._local.ops = None
+        if ops is None:
+            return
+        with self._lock:
+            entry = self._endpoints.setdefault(endpoint or 'unknown', [0, 0, {}])
+            entry[0] += 1
+            for name, count in ops.items():
+                entry[1] += count
+                entry[2][name] = entry[2].get(name, 0) + count
+
+    def started(self, event):
+        ops = getattr(self._local, 'ops', None)
+        if ops is not None:
+            ops[event.command_name] = ops.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': requests,
+                    'commands': commands,
+                    'per_request': round(commands / requests, 3) if requests else 0.0,
+                    'by_command': dict(by_command),
+                }
+                for endpoint, (requests, commands, by_command) in self._endpoints.items()
+            }
+
+
+command_counter = CommandCounter()
+metrics.register('db_ops', lambda: command_counter.stats() if Config.DB_OP_COUNTING else {'enabled': False})
+
+
+def client_options():
+    """Keyword arguments for MongoClient / AsyncIOMotorClient."""
+    opts = {
+        'maxPoolSize': Config.MONGO_MAX_POOL_SIZE,
+        'minPoolSize': Config.MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': Config.MONGO_MAX_IDLE_TIME_MS,
+        'waitQueueTimeoutMS': Config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'connectTimeoutMS': Config.MONGO_CONNECT_TIMEOUT_MS,
+        'event_listeners': [pool_metrics],
+    }
+    if Config.DB_OP_COUNTING:
+        opts['event_listeners'].append(command_counter)
+    if Config.MONGO_TIMEOUT_MS > 0:
+        opts['timeoutMS'] = Config.MONGO_TIMEOUT_MS
+    if Config.MONGO_READ_PREFERENCE:
+        opts['read_preference'] = read_preference(Config.MONGO_READ_PREFERENCE)
+    return opts
+
+
+class LazyDatabase:
+    """Proxy for a pymongo Database created by factory() on first attribute access."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._db = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._db is not None
+
+    def get(self):
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._factory()
+        return self._db
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __getitem__(self, name):
+        return self.get()[name]
+
+
+def reporting_db(db):
+    """Handle for dashboard/history reads (Config.MONGO_REPORTING_READ_PREFERENCE)."""
+    if isinstance(db, LazyDatabase) and not db.loaded:
+        return LazyDatabase(lambda: reporting_db(db.get()))
+    return db.with_options(read_preference=read_preference(
+        Config.MONGO_REPORTING_READ_PREFERENCE, Config.MONGO_REPORTING_MAX_STALENESS_SECONDS
+    ))
+
+
+def dispatch_collection(db, name='requests'):
+    """Collection handle for dispatch writes (Config.MONGO_DISPATCH_WRITE_CONCERN)."""
+    return db.get_collection(name, write_concern=_write_concern(Config.MONGO_DISPATCH_WRITE_CONCERN))
@@ -1,5 +1,7 @@
 import math
 
+from config import Config
+
 def haversine_distance(lat1, lng1, lat2, lng2):
     lat1, lng1, lat2, lng2 = map(math.radians, [lat1, lng1, lat2, lng2])
     dlat = lat2 - lat1
@@ -20,24 +22,90 @@ def ambulances_sorted_by_distance(ambulances, target_lat, target_lng):
     out.sort(key=lambda x: x[0])
     return out
 
-def find_nearest_ambulance(ambulances, target_lat, target_lng, prefer_active=True, requested_type=None):
+def rerank_by_drive_time(sorted_list, lat, lng, locate, outbound=False, limit=None):
     """
-    Prefer nearest ACTIVE ambulance; if none active, return nearest any.
-    ambulances: list of docs with current_location and status.
+    Re-order the first `limit` (distance_km, doc) pairs by road drive time between (lat, lng)
+    and locate(doc). outbound=False: doc -> point (ambulance driving to an incident);
+    outbound=True: point -> doc. Pairs the road graph cannot route keep their haversine order
+    behind the routed ones. Returns the list unchanged when no road graph is loaded.
+    """
+    from roadnet.eta import get_engine
+    engine = get_engine()
+    if engine is None or len(sorted_list) < 2:
+        return sorted_list
+    limit = limit or Config.ROAD_ETA_CANDIDATES
+    head, tail = sorted_list[:limit], sorted_list[limit:]
+    points = [locate(doc) for _d, doc in head]
+    if outbound:
+        times = engine.drive_times_from(lat, lng, points)
+    else:
+        times = engine.drive_times_to(lat, lng, points)
+    order = sorted(range(len(head)), key=lambda i: (times[i] is None, times[i] if times[i] is not None else head[i][0]))
+    return [head[i] for i in order] + tail
+
+
+def _ambulance_point(amb):
+    loc = amb['current_location']
+    return float(loc['lat']), float(loc['lng'])
+
+
+def rank_ambulances(ambulances, target_lat, target_lng, prefer_active=True, requested_type=None, drive_time=None,
+                    max_distance_km=None, strict_type=False, prefer_within_km=None):
+    """
+    Eligible ambulances best first: ACTIVE ones before the rest, each group nearest first
+    (by road drive time for the active group when drive_time is on).
     requested_type: 'any', 'basic_life', 'advance_life', 'icu_life' - filters by ambulance_type
+    (falls back to every type when none match, unless strict_type)
+    drive_time: re-rank the nearest few by road drive time (default Config.DISPATCH_USE_ROAD_ETA)
+    max_distance_km: ignore ambulances farther than this (straight line)
+    prefer_within_km: rank ambulances within this distance (active first) ahead of the farther
+    ones, without excluding those
     """
     sorted_list = ambulances_sorted_by_distance(ambulances, target_lat, target_lng)
+    if max_distance_km is not None:
+        sorted_list = [(d, amb) for d, amb in sorted_list if d <= max_distance_km]
     if not sorted_list:
-        return None
+        return []
     
     # Filter by requested type if specified
     if requested_type and requested_type != 'any':
         matching = [(d, amb) for d, amb in sorted_list if amb.get('ambulance_type') == requested_type]
         if matching:
             sorted_list = matching
-    
-    if prefer_active:
-        for _d, amb in sorted_list:
-            if amb.get('status') == 'active':
-                return amb
-    return sorted_list[0][1] if sorted_list else None
+        elif strict_type:
+            return []
+
+    if drive_time is None:
+        drive_time = Config.DISPATCH_USE_ROAD_ETA
+    if prefer_within_km is not None:
+        near = [(d, amb) for d, amb in sorted_list if d <= prefer_within_km]
+        far = [(d, amb) for d, amb in sorted_list if d > prefer_within_km]
+        return (_active_first(near, target_lat, target_lng, prefer_active, drive_time)
+                + _active_first(far, target_lat, target_lng, prefer_active, drive_time))
+    return _active_first(sorted_list, target_lat, target_lng, prefer_active, drive_time)
+
+
+def _active_first(sorted_list, target_lat, target_lng, prefer_active, drive_time):
+    if not prefer_active:
+        active, rest = sorted_list, []
+    else:
+        active = [(d, amb) for d, amb in sorted_list if amb.get('status') == 'active']
+        rest = [(d, amb) for d, amb in sorted_list if amb.get('status') != 'active']
+    if drive_time:
+        if active:
+            active = rerank_by_drive_time(active, target_lat, target_lng, _ambulance_point)
+        else:
+            rest = rerank_by_drive_time(rest, target_lat, target_lng, _ambulance_point)
+    return [amb for _d, amb in active + rest]
+
+
+def find_nearest_ambulance(ambulances, target_lat, target_lng, prefer_active=True, requested_type=None, drive_time=None,
+                           max_distance_km=None, strict_type=False):
+    """
+    Prefer nearest ACTIVE ambulance; if none active, return nearest any.
+    ambulances: list of docs with current_location and status.
+    Same filters as rank_ambulances.
+    """
+    ranked = rank_ambulances(ambulances, target_lat, target_lng, prefer_active, requested_type, drive_time,
+                             max_distance_km, strict_type)
+    return ranked[0] if ranked else None
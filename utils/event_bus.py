@@ -0,0 +1,255 @@
+"""
+Change events from MongoDB fanned out to in-process subscribers, so per-worker caches and
+views stay current when another worker or node writes.
+
+Each process runs one consumer thread (event_bus.start, idempotent). It opens one change
+stream over requests, ambulances, location_tracks and users with full_document='updateLookup',
+and calls every subscriber with an Event per change. The resume token is kept in memory: after
+a network error or a primary step-down the stream resumes where it stopped, so nothing is
+missed. When the oplog no longer has that point (or the token is refused), the stream restarts
+from now and subscribers get a RESET event. They must then drop whatever they derived.
+
+A standalone mongod has no change streams. The bus then polls every EVENT_BUS_POLL_SECONDS
+instead:
+
+  requests         new request_events entries (every lifecycle transition), one batched
+                   read of the requests they name
+  location_tracks  documents with a newer _id
+  ambulances       documents with a newer updated_at (stamped by AmbulanceModel writes)
+  users            not polled; user caches keep their own sync intervals
+
+Polling can miss an insert whose _id was generated before, but committed after, one that was
+already seen. Subscribers therefore keep their TTL/sync safety nets and use the bus to be
+fresh sooner, not as their only source of truth.
+
+Subscribers run on the consumer thread (keep them short; hand off to a loop with
+call_soon_threadsafe) and an exception in one never stops the others.
+"""
+import atexit
+import threading
+import time
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from config import Config
+from utils import metrics
+
+COLLECTIONS = ('requests', 'ambulances', 'location_tracks', 'users')
+INSERT = 'insert'
+UPDATE = 'update'
+REPLACE = 'replace'
+DELETE = 'delete'
+RESET = 'reset'      # events may have been missed: drop everything derived from COLLECTIONS
+
+_OPERATIONS = (INSERT, UPDATE, REPLACE, DELETE)
+# $changeStream is only supported on replica sets / sharded clusters
+_UNSUPPORTED_CODES = (40573,)
+# ChangeStreamHistoryLost, InvalidResumeToken, ChangeStreamFatalError
+_HISTORY_LOST_CODES = (286, 260, 280)
+_POLL_BATCH = 1000
+
+
+class Event:
+    """One change: collection, op (INSERT/UPDATE/REPLACE/DELETE/RESET), _id, document after it."""
+    __slots__ = ('collection', 'op', 'id', 'doc', 'fields')
+
+    def __init__(self, collection, op, doc_id=None, doc=None, fields=()):
+        self.collection = collection
+        self.op = op
+        self.id = doc_id
+        self.doc = doc            # None for DELETE / RESET, or when the document is gone already
+        self.fields = frozenset(fields)   # updated field names (change-stream UPDATE only)
+
+    def __repr__(self):
+        return f"Event({self.collection}, {self.op}, {self.id})"
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers = []    # (handler, collections or None)
+        self._thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._token = None
+        self._positions = None    # polling mode: last request_events _id, track _id, ambulance updated_at
+        self.mode = None          # 'change_stream' | 'poll' | None (not running)
+        self.counts = {name: 0 for name in COLLECTIONS}
+        self.resets = 0
+        self.restarts = 0
+        self.errors = 0
+        self.subscriber_errors = 0
+        self.last_event_at = None
+
+    @property
+    def live(self):
+        """True while events are flowing (either mode); subscribers may skip their own polling."""
+        return self.mode is not None
+
+    def subscribe(self, handler, collections=None):
+        """handler(db, event) for changes in `collections` (default all) and every RESET."""
+        self._subscribers.append((handler, frozenset(collections) if collections else None))
+
+    # --- lifecycle ----------------------------------------------------------------
+
+    def start(self, db):
+        """Start the consumer once per process (safe to call on every request)."""
+        if self._thread is not None or not Config.EVENT_BUS_ENABLED:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(db,), name='event-bus', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, db):
+        polling = False
+        while not self._stop.is_set():
+            try:
+                if polling:
+                    self._poll_loop(db)
+                else:
+                    self._watch(db)
+            except (NotImplementedError, OperationFailure) as e:
+                if not polling and (isinstance(e, NotImplementedError) or e.code in _UNSUPPORTED_CODES):
+                    polling = True
+                    continue
+                self._failed(e)
+                if isinstance(e, OperationFailure) and e.code in _HISTORY_LOST_CODES:
+                    self._token = None
+                    self._publish(db, Event(None, RESET))
+            except Exception as e:
+                self._failed(e)
+            self._stop.wait(Config.EVENT_BUS_RETRY_SECONDS)
+        self.mode = None
+
+    def _failed(self, error):
+        self.mode = None
+        self.errors += 1
+        self.restarts += 1
+        print(f"Event bus stream failed: {error}")
+
+    # --- delivery -----------------------------------------------------------------
+
+    def _publish(self, db, event):
+        if event.op == RESET:
+            self.resets += 1
+        else:
+            self.counts[event.collection] += 1
+            self.last_event_at = time.monotonic()
+        for handler, collections in self._subscribers:
+            if collections is not None and event.op != RESET and event.collection not in collections:
+                continue
+            try:
+                handler(db, event)
+            except Exception as e:
+                self.subscriber_errors += 1
+                print(f"Event bus subscriber {getattr(handler, '__qualname__', handler)} failed: {e}")
+
+    # --- change streams -----------------------------------------------------------
+
+    def _watch(self, db):
+        pipeline = [{'$match': {'ns.coll': {'$in': list(COLLECTIONS)}, 'operationType': {'$in': list(_OPERATIONS)}}}]
+        with db.watch(pipeline, full_document='updateLookup', resume_after=self._token,
+                      max_await_time_ms=int(Config.EVENT_BUS_POLL_SECONDS * 1000)) as stream:
+            self.mode = 'change_stream'
+            while not self._stop.is_set():
+                change = stream.try_next()
+                self._token = stream.resume_token
+                if change is None:
+                    continue
+                update = change.get('updateDescription') or {}
+                self._publish(db, Event(
+                    change['ns']['coll'], change['operationType'], change['documentKey']['_id'],
+                    change.get('fullDocument'), update.get('updatedFields', {}).keys() | set(update.get('removedFields', [])),
+                ))
+
+    # --- polling fallback ---------------------------------------------------------
+
+    @staticmethod
+    def _latest(coll, field):
+        doc = coll.find_one({field: {'$ne': None}}, {field: 1}, sort=[(field, DESCENDING)])
+        return doc[field] if doc else None
+
+    def _poll_loop(self, db):
+        if self._positions is None:
+            # Start from now: earlier changes are already reflected in whatever subscribers load
+            self._positions = {
+                'request_events': self._latest(db.request_events, '_id'),
+                'location_tracks': self._latest(db.location_tracks, '_id'),
+                'ambulances': self._latest(db.ambulances, 'updated_at'),
+                'ambulance_ids': set(),   # seen with exactly that updated_at
+            }
+        self.mode = 'poll'
+        while not self._stop.is_set():
+            self._poll_requests(db)
+            self._poll_tracks(db)
+            self._poll_ambulances(db)
+            self._stop.wait(Config.EVENT_BUS_POLL_SECONDS)
+
+    @staticmethod
+    def _after(field, position):
+        return {field: {'$gt': position}} if position is not None else {}
+
+    def _poll_requests(self, db):
+        entries = list(db.request_events.find(
+            self._after('_id', self._positions['request_events']), {'request_id': 1}
+        ).sort('_id', ASCENDING).limit(_POLL_BATCH))
+        if not entries:
+            return
+        ids = list(dict.fromkeys(e['request_id'] for e in entries))
+        docs = {d['_id']: d for d in db.requests.find({'_id': {'$in': ids}})}
+        for request_id in ids:
+            doc = docs.get(request_id)
+            self._publish(db, Event('requests', UPDATE if doc else DELETE, request_id, doc))
+        self._positions['request_events'] = entries[-1]['_id']
+
+    def _poll_tracks(self, db):
+        docs = list(db.location_tracks.find(self._after('_id', self._positions['location_tracks']))
+                    .sort('_id', ASCENDING).limit(_POLL_BATCH))
+        for doc in docs:
+            self._publish(db, Event('location_tracks', INSERT, doc['_id'], doc))
+        if docs:
+            self._positions['location_tracks'] = docs[-1]['_id']
+
+    def _poll_ambulances(self, db):
+        # $gte: a write stamped with the same time as the last one seen may land after it.
+        # Ambulances are few, so no batch limit.
+        since, seen = self._positions['ambulances'], self._positions['ambulance_ids']
+        query = {'updated_at': {'$gte': since}} if since is not None else {'updated_at': {'$ne': None}}
+        for doc in db.ambulances.find(query).sort('updated_at', ASCENDING):
+            if doc['updated_at'] == since and doc['_id'] in seen:
+                continue
+            if doc['updated_at'] != since:
+                since, seen = doc['updated_at'], set()
+            seen.add(doc['_id'])
+            self._publish(db, Event('ambulances', UPDATE, doc['_id'], doc))
+        self._positions['ambulances'], self._positions['ambulance_ids'] = since, seen
+
+    # --- maintenance / metrics ----------------------------------------------------
+
+    @staticmethod
+    def ensure_indexes(db):
+        db.ambulances.create_index('updated_at', sparse=True)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'events': dict(self.counts),
+            'resets': self.resets,
+            'restarts': self.restarts,
+            'errors': self.errors,
+            'subscribers': len(self._subscribers),
+            'subscriber_errors': self.subscriber_errors,
+            'seconds_since_last_event': (
+                round(time.monotonic() - self.last_event_at, 1) if self.last_event_at else None
+            ),
+        }
+
+
+event_bus = EventBus()
+metrics.register('event_bus', event_bus.stats)
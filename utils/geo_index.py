@@ -0,0 +1,101 @@
+"""
+In-memory uniform-grid spatial index over lat/lng points.
+Points are bucketed into cell_deg x cell_deg cells; nearest() scans rings of cells
+outward from the query cell and ranks candidates by great-circle distance.
+"""
+import math
+from utils.distance import haversine_distance
+
+KM_PER_DEG_LAT = 111.32
+
+
+class GridIndex:
+    def __init__(self, cell_deg=0.02):
+        self.cell_deg = cell_deg
+        self._cells = {}  # (row, col) -> list of (lat, lng, item)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def add(self, lat, lng, item):
+        self._cells.setdefault(self._cell(lat, lng), []).append((float(lat), float(lng), item))
+        self._size += 1
+
+    def remove(self, lat, lng, item):
+        bucket = self._cells.get(self._cell(lat, lng))
+        if not bucket:
+            return False
+        for i, entry in enumerate(bucket):
+            if entry[2] is item or entry[2] == item:
+                bucket.pop(i)
+                self._size -= 1
+                if not bucket:
+                    del self._cells[self._cell(lat, lng)]
+                return True
+        return False
+
+    def within(self, lat, lng, radius_km, predicate=None):
+        """All (distance_km, item) within radius_km, unsorted."""
+        row, col = self._cell(lat, lng)
+        d_rows = int(math.ceil(radius_km / (KM_PER_DEG_LAT * self.cell_deg)))
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + d_rows * self.cell_deg, 89.9))), 1e-6)
+        d_cols = int(math.ceil(radius_km / (KM_PER_DEG_LAT * cos_lat * self.cell_deg)))
+        out = []
+        for r in range(row - d_rows, row + d_rows + 1):
+            for c in range(col - d_cols, col + d_cols + 1):
+                for plat, plng, item in self._cells.get((r, c), ()):
+                    if predicate is not None and not predicate(item):
+                        continue
+                    d = haversine_distance(lat, lng, plat, plng)
+                    if d <= radius_km:
+                        out.append((d, item))
+        return out
+
+    def nearest(self, lat, lng, k=10, radius_km=None, predicate=None, max_rings=None):
+        """
+        Up to k (distance_km, item) sorted by great-circle distance.
+        Without radius_km, rings expand until k hits are found and no closer point can exist.
+        """
+        if radius_km is not None:
+            hits = self.within(lat, lng, radius_km, predicate)
+            hits.sort(key=lambda x: x[0])
+            return hits[:k]
+        if not self._size:
+            return []
+        row, col = self._cell(lat, lng)
+        ring_km = KM_PER_DEG_LAT * self.cell_deg * max(math.cos(math.radians(lat)), 1e-6)
+        found = []
+        seen = 0
+        ring = 0
+        limit = max_rings if max_rings is not None else 1 << 30
+        while ring <= limit and seen < self._size:
+            for r, c in _ring_cells(row, col, ring):
+                for plat, plng, item in self._cells.get((r, c), ()):
+                    seen += 1
+                    if predicate is None or predicate(item):
+                        found.append((haversine_distance(lat, lng, plat, plng), item))
+            # Anything outside the scanned rings is at least ring * ring_km away
+            if len(found) >= k:
+                found.sort(key=lambda x: x[0])
+                if found[k - 1][0] <= ring * ring_km:
+                    break
+            ring += 1
+        found.sort(key=lambda x: x[0])
+        return found[:k]
+
+
+def _ring_cells(row, col, ring):
+    """Cells on the square ring at Chebyshev distance `ring` from (row, col)."""
+    if ring == 0:
+        yield row, col
+        return
+    for c in range(col - ring, col + ring + 1):
+        yield row - ring, c
+        yield row + ring, c
+    for r in range(row - ring + 1, row + ring):
+        yield r, col - ring
+        yield r, col + ring
@@ -0,0 +1,90 @@
+"""
+Geohash encoding for map aggregation.
+A geohash of length p names a lat/lng cell; every extra character splits it into 32
+children, so a point's hash prefixes are its cells at every coarser precision.
+"""
+import math
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+MAX_PRECISION = 12
+
+
+def encode(lat, lng, precision=8):
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    out = []
+    bits = 0
+    ch = 0
+    even = True  # bits alternate lng, lat, starting with lng
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits = 0
+            ch = 0
+    return ''.join(out)
+
+
+def bounds(geohash):
+    """(min_lat, min_lng, max_lat, max_lng) of the cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in geohash:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lng_lo, lat_hi, lng_hi
+
+
+def cell_size(precision):
+    """(lat_deg, lng_deg) of a cell at this precision."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def covering(min_lat, min_lng, max_lat, max_lng, precision, limit=None):
+    """
+    Hashes of the cells at `precision` that intersect the box, row by row.
+    Returns None when there would be more than `limit`.
+    """
+    dlat, dlng = cell_size(precision)
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0 - 1e-9)
+    min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0 - 1e-9)
+    rows = range(int(math.floor((min_lat + 90) / dlat)), int(math.floor((max_lat + 90) / dlat)) + 1)
+    cols = range(int(math.floor((min_lng + 180) / dlng)), int(math.floor((max_lng + 180) / dlng)) + 1)
+    if limit is not None and len(rows) * len(cols) > limit:
+        return None
+    return [
+        encode(-90 + (r + 0.5) * dlat, -180 + (c + 0.5) * dlng, precision)
+        for r in rows for c in cols
+    ]
+
+
+def precision_for_zoom(zoom):
+    """Cluster cell precision for a web-map zoom level (about 40-100 px per cell on screen)."""
+    return max(1, min(MAX_PRECISION, int(zoom) // 2))
@@ -0,0 +1,196 @@
+"""
+Server-side hospital catalogue with a spatial index.
+
+Loaded once per worker from HOSPITALS_FILE: a CSV (id,name,lat,lng,capabilities[,phone,address];
+capabilities separated by ';') or an OSM extract in Overpass JSON (elements with tags).
+Queries never leave the process. Candidate sets are cached per query cell, so repeated
+lookups around the same accident only re-rank a handful of hospitals.
+
+Build a CSV from an Overpass export:
+  python -m utils.hospitals convert overpass.json data/hospitals.csv
+"""
+import csv
+import json
+import math
+import sys
+import threading
+from pathlib import Path
+
+from config import Config
+from utils import metrics
+from utils.cache import TTLCache
+from utils.distance import haversine_distance
+from utils.geo_index import GridIndex
+
+QUERY_CELL_DEG = 0.01          # ~1.1 km cells for the candidate cache
+MATCH_RADIUS_KM = 0.25         # select-hospital: client coordinates must be this close to a catalogue entry
+
+# OSM tags -> capability names
+_OSM_CAPABILITIES = {
+    ('emergency', 'yes'): 'emergency',
+    ('healthcare:speciality', 'trauma'): 'trauma',
+    ('healthcare:speciality', 'intensive_care'): 'icu',
+    ('healthcare:speciality', 'paediatrics'): 'pediatric',
+    ('healthcare:speciality', 'cardiology'): 'cardiac',
+    ('healthcare:speciality', 'orthopaedics'): 'orthopedic',
+    ('healthcare:speciality', 'burns'): 'burns',
+}
+
+
+def _hospital(hid, name, lat, lng, capabilities=(), phone=None, address=None):
+    return {
+        'id': str(hid),
+        'name': name or 'Hospital',
+        'lat': float(lat),
+        'lng': float(lng),
+        'capabilities': sorted(set(c.strip().lower() for c in capabilities if c and c.strip())),
+        'phone': phone or None,
+        'address': address or None,
+    }
+
+
+def parse_csv(path):
+    out = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            if not row.get('lat') or not row.get('lng'):
+                continue
+            out.append(_hospital(
+                row.get('id') or f"csv-{i}", row.get('name'), row['lat'], row['lng'],
+                (row.get('capabilities') or '').split(';'), row.get('phone'), row.get('address'),
+            ))
+    return out
+
+
+def parse_overpass(path):
+    """Overpass JSON (out center): nodes use lat/lon, ways/relations use center."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    out = []
+    seen = set()
+    for el in data.get('elements', []):
+        center = el.get('center') or el
+        lat, lng = center.get('lat'), center.get('lon', center.get('lng'))
+        if lat is None or lng is None:
+            continue
+        key = (round(lat, 6), round(lng, 6))
+        if key in seen:
+            continue
+        seen.add(key)
+        tags = el.get('tags') or {}
+        caps = []
+        for (tag, value), cap in _OSM_CAPABILITIES.items():
+            if value in str(tags.get(tag, '')).split(';'):
+                caps.append(cap)
+        address = ', '.join(v for v in (tags.get('addr:street'), tags.get('addr:city')) if v) or None
+        out.append(_hospital(
+            f"osm-{el.get('type', 'node')}-{el.get('id')}", tags.get('name'), lat, lng, caps,
+            tags.get('phone') or tags.get('contact:phone'), address,
+        ))
+    return out
+
+
+def load_file(path):
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        return parse_overpass(path)
+    return parse_csv(path)
+
+
+class HospitalCatalogue:
+    def __init__(self, hospitals=()):
+        self._index = GridIndex(cell_deg=0.02)
+        self._by_id = {}
+        self._cells = TTLCache(maxsize=4096, ttl=3600)
+        for h in hospitals:
+            self._by_id[h['id']] = h
+            self._index.add(h['lat'], h['lng'], h)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, hospital_id):
+        return self._by_id.get(str(hospital_id))
+
+    def _candidates(self, lat, lng, radius_km):
+        """Hospitals within radius of any point of the query's cell (cached per cell + radius)."""
+        row, col = math.floor(lat / QUERY_CELL_DEG), math.floor(lng / QUERY_CELL_DEG)
+        key = (row, col, round(radius_km, 3))
+        hit = self._cells.get(key)
+        if hit is not None:
+            return hit
+        c_lat, c_lng = (row + 0.5) * QUERY_CELL_DEG, (col + 0.5) * QUERY_CELL_DEG
+        half_diag_km = haversine_distance(c_lat, c_lng, c_lat + QUERY_CELL_DEG / 2, c_lng + QUERY_CELL_DEG / 2)
+        hits = [h for _d, h in self._index.within(c_lat, c_lng, radius_km + half_diag_km)]
+        self._cells.set(key, hits)
+        return hits
+
+    def nearby(self, lat, lng, k=10, radius_km=5.0, capabilities=None):
+        """Up to k hospitals within radius_km, nearest first by great-circle distance."""
+        required = set(c.lower() for c in (capabilities or ()))
+        ranked = []
+        for h in self._candidates(lat, lng, radius_km):
+            if required and not required.issubset(h['capabilities']):
+                continue
+            d = haversine_distance(lat, lng, h['lat'], h['lng'])
+            if d <= radius_km:
+                ranked.append((d, h))
+        ranked.sort(key=lambda x: x[0])
+        return [dict(h, distance_m=round(d * 1000)) for d, h in ranked[:k]]
+
+    def match(self, hospital):
+        """Catalogue entry for a client-supplied hospital (by id, else nearest within MATCH_RADIUS_KM)."""
+        if hospital.get('id') and self.get(hospital['id']):
+            return self.get(hospital['id'])
+        try:
+            lat, lng = float(hospital['lat']), float(hospital['lng'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        hits = self._index.nearest(lat, lng, k=1, radius_km=MATCH_RADIUS_KM)
+        return hits[0][1] if hits else None
+
+    def stats(self):
+        return {'size': len(self), 'query_cells': self._cells.stats()}
+
+
+_CATALOGUE = None
+_LOCK = threading.Lock()
+
+
+def get_catalogue():
+    """Process-wide catalogue, loaded lazily from Config.HOSPITALS_FILE (empty if unset/missing)."""
+    global _CATALOGUE
+    if _CATALOGUE is None:
+        with _LOCK:
+            if _CATALOGUE is None:
+                path = Config.HOSPITALS_FILE
+                hospitals = load_file(path) if path and Path(path).exists() else []
+                _CATALOGUE = HospitalCatalogue(hospitals)
+    return _CATALOGUE
+
+
+def set_catalogue(catalogue):
+    global _CATALOGUE
+    _CATALOGUE = catalogue
+
+
+metrics.register('hospital_catalogue', lambda: get_catalogue().stats() if _CATALOGUE is not None else {'loaded': False})
+
+
+def _convert(src, dst):
+    hospitals = load_file(src)
+    Path(dst).parent.mkdir(parents=True, exist_ok=True)
+    with open(dst, 'w', newline='', encoding='utf-8') as f:
+        w = csv.writer(f)
+        w.writerow(['id', 'name', 'lat', 'lng', 'capabilities', 'phone', 'address'])
+        for h in hospitals:
+            w.writerow([h['id'], h['name'], h['lat'], h['lng'], ';'.join(h['capabilities']), h['phone'] or '', h['address'] or ''])
+    print(f"Wrote {len(hospitals)} hospitals to {dst}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'convert':
+        _convert(sys.argv[2], sys.argv[3])
+    else:
+        print("Usage: python -m utils.hospitals convert <overpass.json> <hospitals.csv>")
+        sys.exit(1)
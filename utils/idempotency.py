@@ -0,0 +1,86 @@
+"""
+Idempotency-Key support for the endpoints that create emergencies (request-emergency and
+sensor submit). A client that retries with the same key gets the first response back, and
+no reading, request, dispatch or SMS is created again.
+
+The key is claimed in the same upsert that checks it (models/idempotency_model.py). Only the
+first use of a key pays for the claim and the final store of the response. A response with
+status 5xx (or an exception) releases the key, so a retry runs again.
+"""
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+
+from models.idempotency_model import IdempotencyModel, IN_PROGRESS, MISMATCH, REPLAY
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def claim(db, scope, caller, key, fingerprint=None):
+    """
+    Reserve the key before any write. None when this call owns it and must settle() it;
+    otherwise the (body, status, replayed) to answer with instead of running the handler.
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        return {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}, 400, False
+    outcome, doc = IdempotencyModel.claim(db, scope, caller, key, fingerprint)
+    if outcome == REPLAY:
+        return doc['body'], doc['status'], True
+    if outcome == IN_PROGRESS:
+        return {'error': f'A request with this {HEADER} is still being processed'}, 409, False
+    if outcome == MISMATCH:
+        return {'error': f'This {HEADER} was already used for a different request'}, 422, False
+    return None
+
+
+def settle(db, scope, caller, key, status=None, body=None):
+    """Store the response of a claimed key; a 5xx (or no status: the handler raised) frees it."""
+    if status is None or status >= 500:
+        IdempotencyModel.release(db, scope, caller, key)
+    else:
+        IdempotencyModel.complete(db, scope, caller, key, status, body)
+
+
+def run_once(db, scope, caller, key, handler, fingerprint=None):
+    """
+    (body, status, replayed): handler() -> (body, status) runs at most once per key; later
+    uses get the stored result.
+    """
+    early = claim(db, scope, caller, key, fingerprint)
+    if early is not None:
+        return early
+    try:
+        body, status = handler()
+    except Exception:
+        settle(db, scope, caller, key)
+        raise
+    settle(db, scope, caller, key, status, body)
+    return body, status, False
+
+
+def idempotent(scope, get_db):
+    """Route decorator (below role_required): honour an Idempotency-Key header when present."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return f(*args, **kwargs)
+
+            def handler():
+                resp = current_app.make_response(f(*args, **kwargs))
+                return resp.get_json(), resp.status_code
+
+            body, status, replayed = run_once(
+                get_db(), scope, get_jwt_identity(), key, handler,
+                IdempotencyModel.fingerprint(request.get_json(silent=True)),
+            )
+            resp = jsonify(body)
+            resp.status_code = status
+            if replayed:
+                resp.headers['Idempotent-Replayed'] = 'true'
+            return resp
+        return decorated_function
+    return decorator
@@ -0,0 +1,56 @@
+"""
+MongoDB lease for electing one owner of a background job across workers and nodes.
+
+A lease is a document in db.leases ({_id: name, holder, expires_at}). acquire() takes it
+when it is free or expired, or renews it when this process already holds it; the owner
+must renew well inside `ttl_seconds` (every tick) and stop working as soon as a renewal
+fails. Expiry uses the app clock (IST naive), so nodes need roughly synced clocks; keep
+the TTL several times larger than the expected skew.
+"""
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from utils.time_utils import get_ist_now_naive
+
+
+class Lease:
+    def __init__(self, name, ttl_seconds):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.held = False
+
+    def acquire(self, db):
+        """Take or renew the lease; returns True while this process holds it."""
+        now = get_ist_now_naive()
+        try:
+            doc = db.leases.find_one_and_update(
+                {'_id': self.name, '$or': [{'holder': self.holder}, {'expires_at': {'$lt': now}}]},
+                {'$set': {'holder': self.holder, 'expires_at': now + self.ttl, 'renewed_at': now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            self.held = bool(doc) and doc.get('holder') == self.holder
+        except DuplicateKeyError:
+            # Held by someone else and not expired: the upsert tried to insert a second _id
+            self.held = False
+        return self.held
+
+    def release(self, db):
+        """Expire the lease now (if still ours) so another process can take over without waiting."""
+        if not self.held:
+            return
+        self.held = False
+        db.leases.update_one(
+            {'_id': self.name, 'holder': self.holder},
+            {'$set': {'expires_at': get_ist_now_naive()}}
+        )
+
+    @staticmethod
+    def current(db, name):
+        return db.leases.find_one({'_id': name})
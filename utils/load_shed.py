@@ -0,0 +1,237 @@
+"""
+Admission control for every API request: per-identity token buckets and adaptive load
+shedding by priority class.
+
+Each request path maps to a class (longest configured prefix wins):
+
+  critical  emergency creation and the dispatch loop (LOAD_SHED_CRITICAL_PATHS); never shed
+  low       telemetry and dashboards (LOAD_SHED_LOW_PATHS); shed first
+  normal    everything else
+
+Token buckets: each (class, identity) pair refills at LOAD_SHED_<CLASS>_RATE per second up
+to LOAD_SHED_<CLASS>_BURST; an empty bucket answers 429. The identity is the verified JWT
+subject, or the client IP when there is no valid token. Admin tokens all share the subject
+'admin', so each admin session (token jti) gets its own bucket. A rate of 0 disables the bucket.
+
+Shedding: the worker's pressure is the largest of
+  in-flight requests / LOAD_SHED_MAX_INFLIGHT,
+  decaying latency EWMA of admitted non-low requests / LOAD_SHED_LATENCY_MS,
+  queue wait from an X-Request-Start header (proxy timestamp) / LOAD_SHED_QUEUE_MS.
+At pressure >= 1 low requests get 503, and at >= LOAD_SHED_NORMAL_FACTOR normal requests do
+too, so critical requests keep the worker's capacity. All counters are in /admin/metrics.
+"""
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+from config import Config
+from utils import metrics
+from utils.auth import bearer_token, identity_of, verified_claims
+from utils.rate_limit import client_ip_from
+
+CLASSES = ('critical', 'normal', 'low')
+EXEMPT_PATHS = ('/',)
+# Long-lived responses (SSE): admitted like any request but not counted in flight or in latency
+STREAM_PREFIXES = ('/stream/',)
+_LATENCY_DECAY_SECONDS = 5.0
+_EWMA_WEIGHT = 0.1
+
+
+def _prefixes():
+    table = [(p, 'critical') for p in Config.LOAD_SHED_CRITICAL_PATHS] + [(p, 'low') for p in Config.LOAD_SHED_LOW_PATHS]
+    return sorted(table, key=lambda item: len(item[0]), reverse=True)
+
+
+def _identity(authorization, forwarded_for, remote_addr):
+    token = bearer_token(authorization)
+    if token:
+        try:
+            claims = verified_claims(token)   # cached, so the route does not decode it again
+            if claims.get('role') == 'admin':
+                return f"admin:{claims.get('jti') or identity_of(claims)}"
+            return f"{claims.get('role')}:{identity_of(claims)}"
+        except jwt.InvalidTokenError:
+            pass
+    return 'ip:' + client_ip_from(forwarded_for, remote_addr)
+
+
+def _queue_ms(request_start, now):
+    """X-Request-Start as set by nginx/Heroku-style routers: 't=<seconds or ms or us>'."""
+    if not request_start:
+        return 0.0
+    try:
+        value = float(request_start.split('=', 1)[-1])
+    except ValueError:
+        return 0.0
+    while value > now * 10:   # ms or us since the epoch
+        value /= 1000.0
+    return max((now - value) * 1000.0, 0.0)
+
+
+def _rejection(status, wait):
+    seconds = int(math.ceil(wait))
+    if status == 503:
+        return {'error': 'Server busy, please retry shortly', 'retry_after': seconds}, seconds
+    return {'error': 'Too many requests. Please slow down.', 'retry_after': seconds}, seconds
+
+
+class LoadShedder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = _prefixes()
+        self._buckets = OrderedDict()   # (class, identity) -> [tokens, updated monotonic]
+        self._inflight = 0
+        self._latency_ms = 0.0
+        self._latency_at = time.monotonic()
+        self.asgi = False               # set by asgi.py: the ASGI middleware does admission instead
+        self.counts = {c: {'admitted': 0, 'limited': 0, 'shed': 0} for c in CLASSES}
+
+    def classify(self, path):
+        for prefix, cls in self._routes:
+            if path.startswith(prefix):
+                return cls
+        return 'normal'
+
+    def _take(self, cls, identity, now):
+        rate = Config.LOAD_SHED_RATES[cls]
+        if rate <= 0:
+            return 0.0
+        burst = Config.LOAD_SHED_BURSTS[cls]
+        key = (cls, identity)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(burst), now]
+            while len(self._buckets) > Config.RATE_LIMIT_MAX_KEYS:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    def pressure(self, queue_ms=0.0, now=None):
+        now = now or time.monotonic()
+        latency = self._latency_ms * math.exp(-(now - self._latency_at) / _LATENCY_DECAY_SECONDS)
+        return max(
+            self._inflight / Config.LOAD_SHED_MAX_INFLIGHT if Config.LOAD_SHED_MAX_INFLIGHT else 0.0,
+            latency / Config.LOAD_SHED_LATENCY_MS if Config.LOAD_SHED_LATENCY_MS else 0.0,
+            queue_ms / Config.LOAD_SHED_QUEUE_MS if Config.LOAD_SHED_QUEUE_MS else 0.0,
+        )
+
+    def admit(self, path, authorization='', forwarded_for='', remote_addr=None, request_start=None):
+        """
+        Returns (class, None) when admitted (call finish() when done), or
+        (class, (status, retry_after_seconds)) when rejected.
+        """
+        if path in EXEMPT_PATHS:
+            return None, None
+        cls = self.classify(path)
+        identity = _identity(authorization, forwarded_for, remote_addr)
+        now = time.monotonic()
+        queue_ms = _queue_ms(request_start, time.time())
+        with self._lock:
+            if cls != 'critical':
+                level = self.pressure(queue_ms, now)
+                if level >= (1.0 if cls == 'low' else Config.LOAD_SHED_NORMAL_FACTOR):
+                    self.counts[cls]['shed'] += 1
+                    return cls, (503, Config.LOAD_SHED_RETRY_AFTER_SECONDS)
+            wait = self._take(cls, identity, now)
+            if wait:
+                self.counts[cls]['limited'] += 1
+                return cls, (429, wait)
+            self.counts[cls]['admitted'] += 1
+            self._inflight += 1
+        return cls, None
+
+    def finish(self, cls, elapsed_seconds):
+        """Release an admitted request; elapsed_seconds None skips the latency sample."""
+        if cls is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._inflight = max(self._inflight - 1, 0)
+            if cls != 'low' and elapsed_seconds is not None:
+                decayed = self._latency_ms * math.exp(-(now - self._latency_at) / _LATENCY_DECAY_SECONDS)
+                self._latency_ms = decayed + _EWMA_WEIGHT * (elapsed_seconds * 1000.0 - decayed)
+                self._latency_at = now
+
+    def stats(self):
+        return {
+            'inflight': self._inflight,
+            'pressure': round(self.pressure(), 3),
+            'latency_ewma_ms': round(self._latency_ms, 1),
+            'buckets': len(self._buckets),
+            'classes': self.counts,
+        }
+
+    # --- Flask ------------------------------------------------------------------
+
+    def init_app(self, app):
+        app.before_request(self._flask_before)
+        app.teardown_request(self._flask_teardown)
+
+    def _flask_before(self):
+        from flask import g, jsonify, request
+        if self.asgi or request.method == 'OPTIONS':
+            return None
+        cls, rejected = self.admit(
+            request.path, request.headers.get('Authorization', ''), request.headers.get('X-Forwarded-For', ''),
+            request.remote_addr, request.headers.get('X-Request-Start'),
+        )
+        if rejected:
+            body, seconds = _rejection(*rejected)
+            resp = jsonify(body)
+            resp.headers['Retry-After'] = str(seconds)
+            return resp, rejected[0]
+        g.load_shed = (cls, time.monotonic())
+        return None
+
+    def _flask_teardown(self, _exc):
+        from flask import g
+        admitted = g.pop('load_shed', None)
+        if admitted:
+            self.finish(admitted[0], time.monotonic() - admitted[1])
+
+
+class ASGILoadShedMiddleware:
+    """The same admission control in front of the ASGI app (asgi.py), including the mounted Flask app."""
+
+    def __init__(self, app, shedder=None):
+        self.app = app
+        self.shedder = shedder or load_shedder
+        self.shedder.asgi = True
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'OPTIONS':
+            return await self.app(scope, receive, send)
+        headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers']}
+        client = scope.get('client')
+        cls, rejected = self.shedder.admit(
+            scope['path'], headers.get('authorization', ''), headers.get('x-forwarded-for', ''),
+            client[0] if client else None, headers.get('x-request-start'),
+        )
+        if rejected:
+            body, seconds = _rejection(*rejected)
+            await send({'type': 'http.response.start', 'status': rejected[0], 'headers': [
+                (b'content-type', b'application/json'), (b'retry-after', str(seconds).encode()),
+            ]})
+            await send({'type': 'http.response.body', 'body': (json.dumps(body) + '\n').encode()})
+            return
+        if scope['path'].startswith(STREAM_PREFIXES):
+            self.shedder.finish(cls, None)
+            return await self.app(scope, receive, send)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.shedder.finish(cls, time.monotonic() - started)
+
+
+load_shedder = LoadShedder()
+metrics.register('load_shed', load_shedder.stats)
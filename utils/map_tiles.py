@@ -0,0 +1,251 @@
+"""
+Server-side clustering for the admin map (/admin/map-data).
+
+Open incidents (from the live incidents snapshot) and ambulances with a location are
+bucketed into geohash cells sized for the requested zoom, with counts by status and
+ambulance type. Aggregates are computed per tile (the cell's parent, 32 cells) and kept
+in a TTL cache; when a point moves or changes status only the tiles containing its old
+and new positions are dropped. At MAP_DETAIL_ZOOM and above the endpoint returns the
+individual markers instead.
+
+Ambulance positions are a per-worker copy. While the event bus (utils/event_bus.py) is
+live, every ambulance write is applied as it arrives (position, status and type). Otherwise
+the copy is refreshed from MongoDB at most every MAP_AMBULANCE_REFRESH_SECONDS (only
+documents with a newer current_location_updated_at). Either way a full reload every
+MAP_AMBULANCE_RELOAD_SECONDS picks up anything missed.
+"""
+import threading
+import time
+
+from config import Config
+from utils import geohash, metrics
+from utils.cache import TTLCache
+from utils.event_bus import RESET, event_bus
+
+_AMBULANCE_FIELDS = {'name': 1, 'vehicle_number': 1, 'status': 1, 'ambulance_type': 1,
+                     'current_location': 1, 'current_location_updated_at': 1}
+_POINT_PRECISION = 8
+
+
+def _point(loc):
+    if not loc or loc.get('lat') is None or loc.get('lng') is None:
+        return None
+    return float(loc['lat']), float(loc['lng'])
+
+
+class MapTiles:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ambulances = {}   # id -> (geohash, doc)
+        self._incidents = {}    # id -> (geohash, (status, lat, lng))
+        self._incident_rows = []
+        self._incident_version = None
+        self._last_seen_at = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._tiles = TTLCache(maxsize=Config.MAP_TILE_CACHE_ENTRIES, ttl=Config.MAP_TILE_TTL_SECONDS)
+        self.invalidations = 0
+
+    # --- keeping points current ---------------------------------------------------
+
+    def _invalidate(self, *hashes):
+        for h in hashes:
+            if not h:
+                continue
+            for precision in range(1, _POINT_PRECISION + 1):
+                self._tiles.delete((precision, h[:precision - 1]))
+            self.invalidations += 1
+
+    def _put(self, store, key, h, value):
+        old = store.get(key)
+        if old is None or old[0] != h or old[1] != value:
+            self._invalidate(h, old[0] if old else None)
+        store[key] = (h, value)
+
+    def _drop(self, store, key):
+        old = store.pop(key, None)
+        if old:
+            self._invalidate(old[0])
+
+    def _apply_ambulance(self, key, amb):
+        point = _point(amb.get('current_location'))
+        if point is None:
+            self._drop(self._ambulances, key)
+            return
+        h = geohash.encode(point[0], point[1], _POINT_PRECISION)
+        old = self._ambulances.get(key)
+        if old is None or old[0] != h or _status_key(old[1]) != _status_key(amb):
+            self._invalidate(h, old[0] if old else None)
+        self._ambulances[key] = (h, amb)
+        at = amb.get('current_location_updated_at')
+        if at is not None and (self._last_seen_at is None or at > self._last_seen_at):
+            self._last_seen_at = at
+
+    def _refresh_ambulances(self, db, now):
+        full = not self._loaded_at or now - self._loaded_at >= Config.MAP_AMBULANCE_RELOAD_SECONDS
+        if not full and event_bus.live:
+            return
+        query = {'current_location': {'$ne': None}}
+        if not full and self._last_seen_at is not None:
+            query['current_location_updated_at'] = {'$gte': self._last_seen_at}
+        seen = set()
+        for amb in db.ambulances.find(query, _AMBULANCE_FIELDS):
+            key = str(amb['_id'])
+            seen.add(key)
+            self._apply_ambulance(key, amb)
+        if full:
+            for key in [k for k in self._ambulances if k not in seen]:
+                self._drop(self._ambulances, key)
+            self._loaded_at = now
+
+    def _refresh_incidents(self, db):
+        from models.live_incident_model import live_incidents
+        version, rows = live_incidents.open_incidents(db)
+        if version == self._incident_version:
+            return
+        current = set()
+        for row in rows:
+            point = _point(row.get('location'))
+            if point is None:
+                continue
+            current.add(row['id'])
+            h = geohash.encode(point[0], point[1], _POINT_PRECISION)
+            self._put(self._incidents, row['id'], h, (row['status'], point[0], point[1]))
+        for key in [k for k in self._incidents if k not in current]:
+            self._drop(self._incidents, key)
+        self._incident_rows = rows
+        self._incident_version = version
+
+    def on_change(self, db, event):
+        """Event bus subscriber for ambulances: apply the write before the next refresh."""
+        with self._lock:
+            if event.op == RESET:
+                self._loaded_at = 0.0
+            elif not self._loaded_at:
+                return   # the first refresh loads everything
+            elif event.doc is None:
+                self._drop(self._ambulances, str(event.id))
+            else:
+                self._apply_ambulance(str(event.id), {k: event.doc.get(k) for k in ('_id', *_AMBULANCE_FIELDS)})
+
+    def refresh(self, db):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < Config.MAP_AMBULANCE_REFRESH_SECONDS:
+                return
+            self._refresh_ambulances(db, now)
+            self._refresh_incidents(db)
+            self._checked_at = now
+
+    # --- queries ------------------------------------------------------------------
+
+    def _aggregate_tile(self, precision, prefix):
+        cells = {}
+
+        def cell(h):
+            c = cells.get(h)
+            if c is None:
+                c = cells[h] = {
+                    'geohash': h, 'lat_sum': 0.0, 'lng_sum': 0.0, 'points': 0,
+                    'incidents': {'count': 0, 'by_status': {}},
+                    'ambulances': {'count': 0, 'by_status': {}, 'by_type': {}},
+                }
+            return c
+
+        for h, (status, lat, lng) in self._incidents.values():
+            if h.startswith(prefix):
+                c = cell(h[:precision])
+                c['incidents']['count'] += 1
+                c['incidents']['by_status'][status] = c['incidents']['by_status'].get(status, 0) + 1
+                c['lat_sum'] += lat
+                c['lng_sum'] += lng
+                c['points'] += 1
+        for h, amb in self._ambulances.values():
+            if h.startswith(prefix):
+                c = cell(h[:precision])
+                a = c['ambulances']
+                a['count'] += 1
+                status = amb.get('status') or 'unknown'
+                a['by_status'][status] = a['by_status'].get(status, 0) + 1
+                kind = amb.get('ambulance_type') or 'unknown'
+                a['by_type'][kind] = a['by_type'].get(kind, 0) + 1
+                loc = amb['current_location']
+                c['lat_sum'] += float(loc['lat'])
+                c['lng_sum'] += float(loc['lng'])
+                c['points'] += 1
+
+        out = []
+        for c in cells.values():
+            n = c.pop('points')
+            c['lat'] = round(c.pop('lat_sum') / n, 6)
+            c['lng'] = round(c.pop('lng_sum') / n, 6)
+            c['bounds'] = geohash.bounds(c['geohash'])
+            out.append(c)
+        return out
+
+    def clusters(self, bbox, zoom):
+        """Cell aggregates intersecting bbox (min_lat, min_lng, max_lat, max_lng)."""
+        precision = min(geohash.precision_for_zoom(zoom), _POINT_PRECISION)
+        with self._lock:
+            tiles = None
+            while precision > 1:
+                tiles = geohash.covering(*bbox, precision - 1, limit=Config.MAP_MAX_TILES)
+                if tiles is not None:
+                    break
+                precision -= 1
+            if tiles is None:
+                tiles = ['']
+            out = []
+            for prefix in tiles:
+                key = (precision, prefix)
+                cells = self._tiles.get(key)
+                if cells is None:
+                    cells = self._aggregate_tile(precision, prefix)
+                    self._tiles.set(key, cells)
+                out.extend(c for c in cells if _intersects(c['bounds'], bbox))
+        return precision, out
+
+    def detail(self, bbox, limit):
+        """Individual markers inside bbox, or None when there are more than limit."""
+        with self._lock:
+            incidents = [r for r in self._incident_rows if _inside(_point(r.get('location')), bbox)]
+            ambulances = [
+                {
+                    'id': key,
+                    'name': amb.get('name'),
+                    'vehicle_number': amb.get('vehicle_number'),
+                    'status': amb.get('status'),
+                    'ambulance_type': amb.get('ambulance_type'),
+                    'current_location': amb.get('current_location'),
+                }
+                for key, (_h, amb) in self._ambulances.items()
+                if _inside(_point(amb.get('current_location')), bbox)
+            ]
+        if len(incidents) + len(ambulances) > limit:
+            return None
+        return incidents, ambulances
+
+    def stats(self):
+        return {
+            'ambulances': len(self._ambulances),
+            'incidents': len(self._incidents),
+            'invalidations': self.invalidations,
+            'tiles': self._tiles.stats(),
+        }
+
+
+def _status_key(amb):
+    return amb.get('status'), amb.get('ambulance_type')
+
+
+def _inside(point, bbox):
+    return point is not None and bbox[0] <= point[0] <= bbox[2] and bbox[1] <= point[1] <= bbox[3]
+
+
+def _intersects(bounds, bbox):
+    return not (bounds[2] < bbox[0] or bounds[0] > bbox[2] or bounds[3] < bbox[1] or bounds[1] > bbox[3])
+
+
+map_tiles = MapTiles()
+metrics.register('map_tiles', map_tiles.stats)
+event_bus.subscribe(map_tiles.on_change, ['ambulances'])
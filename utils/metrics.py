@@ -0,0 +1,25 @@
+"""
+Process-local metrics registry.
+Subsystems register a provider (a no-arg callable returning a dict); GET /admin/metrics
+returns a snapshot of all providers for the worker that served the request.
+"""
+import os
+import time
+
+_PROVIDERS = {}
+_STARTED_AT = time.time()
+
+
+def register(name, provider):
+    """Register (or replace) a stats provider under name."""
+    _PROVIDERS[name] = provider
+
+
+def snapshot():
+    out = {'pid': os.getpid(), 'uptime_seconds': round(time.time() - _STARTED_AT, 1)}
+    for name, provider in list(_PROVIDERS.items()):
+        try:
+            out[name] = provider()
+        except Exception as e:
+            out[name] = {'error': str(e)}
+    return out
@@ -1,7 +1,27 @@
 from models.otp_model import OTPModel
 from config import Config
+from utils.rate_limit import RateLimiter, client_ip
 from utils.twilio_sms import send_sms, normalize_phone
 
+# SMS-pumping guard: per phone number and per caller IP, checked before any DB write or SMS
+send_per_phone = RateLimiter('otp_send_phone', Config.OTP_SEND_PHONE_LIMIT, Config.OTP_SEND_PHONE_WINDOW_SECONDS)
+send_per_ip = RateLimiter('otp_send_ip', Config.OTP_SEND_IP_LIMIT, Config.OTP_SEND_IP_WINDOW_SECONDS)
+# Guessing guard: a 6-digit code must not be brute-forced within its validity
+verify_per_phone = RateLimiter('otp_verify_phone', Config.OTP_VERIFY_PHONE_LIMIT, Config.OTP_VERIFY_WINDOW_SECONDS)
+
+
+def send_otp_wait(db, req, phone, role):
+    """Seconds the caller must wait before another OTP can be sent (0 = go ahead)."""
+    return max(
+        send_per_ip.hit(client_ip(req), db),
+        send_per_phone.hit(f"{role}:{normalize_phone(phone)}", db),
+    )
+
+
+def verify_otp_wait(db, phone, role):
+    return verify_per_phone.hit(f"{role}:{normalize_phone(phone)}", db)
+
+
 def send_otp_logic(db, phone, role='user'):
     """Generate OTP, store in DB, send via Twilio. role: 'user' or 'ambulance'."""
     otp = OTPModel.generate_otp()
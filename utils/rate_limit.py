@@ -0,0 +1,124 @@
+"""
+Sliding-window rate limits (OTP send/verify).
+
+RateLimiter(name, limit, window_seconds).hit(key) counts one event for key and says whether
+it is within `limit` per `window_seconds`. Two backends (RATE_LIMIT_BACKEND):
+
+  memory  exact sliding log per key in this worker; no database traffic, but each worker
+          enforces the limit on its own (the effective limit is limit x workers).
+  mongo   shared across workers and nodes: one counter document per key and fixed window in
+          db.rate_limits. The sliding count is estimated as
+          current + previous x (unelapsed share of the window). The counters expire through a
+          TTL index (ensure_indexes).
+
+Denied events still count, so a client that keeps hammering stays blocked.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+from config import Config
+from utils import metrics
+
+_limiters = {}
+
+
+class RateLimiter:
+    def __init__(self, name, limit, window_seconds, max_keys=None):
+        self.name = name
+        self.limit = limit
+        self.window = float(window_seconds)
+        self.max_keys = max_keys or Config.RATE_LIMIT_MAX_KEYS
+        self._events = OrderedDict()  # key -> deque of monotonic timestamps
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.denied = 0
+        _limiters[name] = self
+
+    def hit(self, key, db=None):
+        """Count one event; returns seconds to wait (0 when allowed)."""
+        if Config.RATE_LIMIT_BACKEND == 'mongo' and db is not None:
+            wait = self._hit_mongo(db, key)
+        else:
+            wait = self._hit_memory(key)
+        if wait:
+            self.denied += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def _hit_memory(self, key):
+        now = time.monotonic()
+        with self._lock:
+            events = self._events.get(key)
+            if events is None:
+                events = self._events[key] = deque(maxlen=self.limit + 1)
+                while len(self._events) > self.max_keys:
+                    self._events.popitem(last=False)
+            self._events.move_to_end(key)
+            while events and events[0] <= now - self.window:
+                events.popleft()
+            events.append(now)
+            if len(events) <= self.limit:
+                return 0
+            # Blocked until enough of the window has passed to drop below the limit
+            return max(round(events[-self.limit] + self.window - now, 1), 0.1)
+
+    def _hit_mongo(self, db, key):
+        now = datetime.now(timezone.utc)
+        index = math.floor(now.timestamp() / self.window)
+        elapsed = now.timestamp() / self.window - index
+        base = f"{self.name}|{key}|"
+        current = db.rate_limits.find_one_and_update(
+            {'_id': base + str(index)},
+            {'$inc': {'n': 1}, '$setOnInsert': {
+                'expires_at': now + timedelta(seconds=2 * self.window)
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        previous = db.rate_limits.find_one({'_id': base + str(index - 1)}, {'n': 1}) or {}
+        estimate = current['n'] + previous.get('n', 0) * (1 - elapsed)
+        if estimate <= self.limit:
+            return 0
+        return max(round((1 - elapsed) * self.window, 1), 0.1)
+
+    def stats(self):
+        return {'allowed': self.allowed, 'denied': self.denied, 'keys': len(self._events)}
+
+    @staticmethod
+    def ensure_indexes(db):
+        db.rate_limits.create_index('expires_at', expireAfterSeconds=0)
+
+
+def too_many(wait):
+    """429 response for a denied hit (wait: seconds from RateLimiter.hit)."""
+    from flask import jsonify
+    seconds = int(math.ceil(wait))
+    resp = jsonify({'error': 'Too many attempts. Please try again later.', 'retry_after': seconds})
+    resp.headers['Retry-After'] = str(seconds)
+    return resp, 429
+
+
+def client_ip(req):
+    """Caller address of a Flask request for per-IP limits (see client_ip_from)."""
+    return client_ip_from(req.headers.get('X-Forwarded-For', ''), req.remote_addr)
+
+
+def client_ip_from(forwarded_for, remote_addr):
+    """
+    Behind RATE_LIMIT_PROXY_HOPS reverse proxies the client is that many entries from the right
+    of X-Forwarded-For (entries further left are caller-supplied).
+    """
+    hops = Config.RATE_LIMIT_PROXY_HOPS
+    route = [a.strip() for a in (forwarded_for or '').split(',') if a.strip()]
+    if hops and len(route) >= hops:
+        return route[-hops]
+    return remote_addr or 'unknown'
+
+
+metrics.register('rate_limits', lambda: {name: lim.stats() for name, lim in _limiters.items()})
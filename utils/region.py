@@ -0,0 +1,40 @@
+"""
+Region shard key: the geohash prefix (SHARD_REGION_PRECISION characters) of a location.
+
+Requests get theirs at creation, and it never changes. Ambulances get theirs from each
+location update. ops/sharding.py shards `requests` on {region: 1, _id: 1} and can pin
+geohash prefixes to shards with zone ranges. Neighbouring regions then live on the same
+shard, so a dispatch query filtered on the regions around a point goes to one shard.
+
+With SHARDED_DISPATCH on, dispatch first searches the block of regions around the point,
+the cell plus its eight neighbours. That block reaches at least one cell (see
+cell_size_km) in every direction. Dispatch only falls back to a query over every region
+when the block has no candidate.
+"""
+from config import Config
+from utils import geohash
+from utils.geo_index import KM_PER_DEG_LAT
+
+
+def region_of(lat, lng):
+    return geohash.encode(float(lat), float(lng), Config.SHARD_REGION_PRECISION)
+
+
+def regions_near(lat, lng):
+    """The region of (lat, lng) and its neighbours, as a sorted list."""
+    dlat, dlng = geohash.cell_size(Config.SHARD_REGION_PRECISION)
+    lat, lng = float(lat), float(lng)
+    return sorted(set(geohash.covering(lat - dlat, lng - dlng, lat + dlat, lng + dlng, Config.SHARD_REGION_PRECISION)))
+
+
+def cell_size_km():
+    """(north-south, east-west at the equator) size of one region in km."""
+    dlat, dlng = geohash.cell_size(Config.SHARD_REGION_PRECISION)
+    return dlat * KM_PER_DEG_LAT, dlng * KM_PER_DEG_LAT
+
+
+def near_filter(lat, lng):
+    """Query clause for documents in the regions around (lat, lng); {} unless SHARDED_DISPATCH."""
+    if not Config.SHARDED_DISPATCH or lat is None or lng is None:
+        return {}
+    return {'region': {'$in': regions_near(lat, lng)}}
@@ -1,7 +1,15 @@
 """
 Send SMS via Twilio (e.g. OTP).
+SMS_BACKEND=fake keeps messages in an in-process outbox instead (load tests, local runs).
 """
+import time
+from collections import deque
+
 from config import Config
+from utils import metrics
+
+FAKE_OUTBOX = deque(maxlen=1000)
+_fake_sent = 0
 
 def send_sms(to_number: str, body: str):
     """
@@ -9,6 +17,8 @@ def send_sms(to_number: str, body: str):
     to_number: E.164 format e.g. +919876543210
     Returns (success: bool, error_message: str or empty).
     """
+    if Config.SMS_BACKEND == 'fake':
+        return _send_fake(to_number, body)
     if not Config.TWILIO_ACCOUNT_SID or not Config.TWILIO_AUTH_TOKEN:
         return False, "Twilio not configured"
     try:
@@ -23,6 +33,16 @@ def send_sms(to_number: str, body: str):
     except Exception as e:
         return False, str(e)
 
+def _send_fake(to_number, body):
+    global _fake_sent
+    if Config.SMS_FAKE_LATENCY_MS > 0:
+        time.sleep(Config.SMS_FAKE_LATENCY_MS / 1000)  # stand-in for the Twilio API round trip
+    FAKE_OUTBOX.append({'to': to_number, 'body': body, 'sent_at': time.time()})
+    _fake_sent += 1
+    return True, ""
+
+metrics.register('sms', lambda: {'backend': Config.SMS_BACKEND, 'fake_sent': _fake_sent})
+
 def normalize_phone(phone: str) -> str:
     """Ensure phone has + prefix for Twilio (E.164)."""
     phone = (phone or "").strip()